@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import argparse
+import importlib.util
+import numpy as np
+import google.auth
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import automl_v1beta1 as automl
+
+CLASSIFY_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'step-function', 'lambda-scripts', 'classify_image')
+sys.path.insert(0, CLASSIFY_IMAGE)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+# no Google Cloud credentials are needed, since no request leaves the machine
+google.auth.default = lambda *args, **kwargs: (AnonymousCredentials(), None)
+spec = importlib.util.spec_from_file_location('automl_lambda_function',
+                                              os.path.join(CLASSIFY_IMAGE, 'automl', 'lambda_function.py'))
+automl_lambda = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(automl_lambda)
+
+
+parser = argparse.ArgumentParser(description='Compare per-call latency of fresh and cached AutoML clients against a stubbed prediction service.')
+parser.add_argument('-n', '--calls', type=int, default=50, metavar='',
+                    help='Number of predictions per method (default: 50).')
+parser.add_argument('-l', '--latency', type=float, default=0.0, metavar='',
+                    help='Simulated latency of the stubbed prediction service in seconds (default: 0.0).')
+args = parser.parse_args()
+
+
+def stub_predict(name, payload, params):
+    '''Stand-in for PredictionServiceClient.predict so that no request leaves the machine.'''
+    time.sleep(args.latency)
+
+
+# stub the predictions of every client, including the one the lambda creates on first use
+automl.PredictionServiceClient.predict = staticmethod(stub_predict)
+
+
+def new_clients(content, project_id, model_id):
+    '''Clients created on every call, as previously done in get_prediction.'''
+    automl_client = automl.AutoMlClient(credentials=AnonymousCredentials())
+    model_full_id = automl_client.model_path(project_id, automl_lambda.COMPUTE_REGION, model_id)
+    prediction_client = automl.PredictionServiceClient(credentials=AnonymousCredentials())
+    return prediction_client.predict(model_full_id, {'image': {'image_bytes': content}}, {})
+
+
+def cached_clients(content, project_id, model_id):
+    '''Clients and model path created once and reused, with the keep-alive channel options,
+       as done in get_prediction of the automl lambda now.'''
+    return automl_lambda.get_prediction(content, project_id, model_id)
+
+
+if __name__ == '__main__':
+    content = b'\xff' * 65536
+    print('{:<10}{:>18}{:>18}'.format('Method', 'Median (ms)', 'First call (ms)'))
+    for name, function in [('fresh', new_clients), ('cached', cached_clients)]:
+        timings = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            function(content, 'project', 'model')
+            timings.append(time.perf_counter() - start)
+        print('{:<10}{:>18.3f}{:>18.3f}'.format(name, np.median(timings) * 1e3, timings[0] * 1e3))
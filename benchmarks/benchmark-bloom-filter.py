@@ -0,0 +1,41 @@
+import os
+import sys
+import time
+import argparse
+from uuid import uuid4
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'step-function', 'lambda-scripts', 'check_for_duplicate_upload'))
+from bloom_filter import BloomFilter
+
+
+parser = argparse.ArgumentParser(description='Measure lookups per second and false-positive rate of the duplicate check filter.')
+parser.add_argument('-n', '--images', type=int, default=1000000, metavar='',
+                    help='Number of image ids added to the filter (default: 1000000).')
+parser.add_argument('-l', '--lookups', type=int, default=200000, metavar='',
+                    help='Number of lookups of image ids never added (default: 200000).')
+parser.add_argument('-e', '--error_rate', type=float, default=0.01, metavar='',
+                    help='Target false-positive rate of the filter (default: 0.01).')
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    image_filter = BloomFilter(args.images, args.error_rate)
+    start = time.perf_counter()
+    for index in range(args.images):
+        image_filter.add('i{:08d}q_flt'.format(index))
+    load_time = time.perf_counter() - start
+
+    unseen = [uuid4().hex[:9] + '_flc' for _ in range(args.lookups)]
+    start = time.perf_counter()
+    false_positives = sum(1 for image_id in unseen if image_id in image_filter)
+    lookup_time = time.perf_counter() - start
+
+    print('Filter size       : {:.1f} MB, {} hash functions'.format(len(image_filter.bits) / 2 ** 20,
+                                                                   image_filter.num_hashes))
+    print('Load              : {:.0f} ids/s'.format(args.images / load_time))
+    print('Lookups           : {:.0f} lookups/s'.format(args.lookups / lookup_time))
+    print('False positives   : {} of {} ({:.4%}, expected {:.4%})'.format(false_positives, args.lookups,
+                                                                      false_positives / args.lookups,
+                                                                      image_filter.expected_error_rate()))
+    print('DynamoDB lookups avoided: {:.2%} of unseen images'.format(1 - false_positives / args.lookups))
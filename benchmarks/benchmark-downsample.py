@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from astropy.io import fits
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'step-function', 'lambda-scripts', 'classify_image'))
+from fits_preprocessing import fits_to_image, encode_jpeg
+
+
+parser = argparse.ArgumentParser(description='Compare payload size and latency of full-resolution and downsampled images.')
+parser.add_argument('-s', '--size', type=int, default=256, metavar='',
+                    help='Side length of the model input (default: 256).')
+parser.add_argument('-r', '--repeats', type=int, default=5, metavar='',
+                    help='Number of images to process per path (default: 5).')
+parser.add_argument('-b', '--bandwidth', type=float, default=50.0, metavar='',
+                    help='Assumed Lambda-to-endpoint bandwidth in MB/s used to estimate transfer time (default: 50).')
+args = parser.parse_args()
+
+
+def make_hdul(chips):
+    '''Function returns an in-memory FITS file with a SCI, ERR and DQ extension per chip.'''
+    hdus = [fits.PrimaryHDU()]
+    for chip in chips:
+        hdus += [fits.ImageHDU(chip, name='SCI'), fits.ImageHDU(name='ERR'), fits.ImageHDU(name='DQ')]
+    return fits.HDUList(hdus)
+
+
+def run(hdul, size):
+    '''Preprocess and encode one image the way the SageMaker backend does: the model JPEG is sent
+       to the endpoint and the full-resolution JPEG archived, encoded once if they are the same image.
+       Function returns (payload bytes, preprocess time, encode time).'''
+    start = time.perf_counter()
+    _, image, model_image = fits_to_image(hdul, size)
+    preprocessed = time.perf_counter()
+    content = encode_jpeg(model_image)
+    if model_image is not image:
+        encode_jpeg(image)
+    encoded = time.perf_counter()
+    return len(content), preprocessed - start, encoded - preprocessed
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    # two 2048x4096 SCI chips, as found in ACS/WFC and WFC3/UVIS files
+    hdul = make_hdul([rng.lognormal(size=(2048, 4096)).astype('>f4') for _ in range(2)])
+    print('{:<14}{:>16}{:>18}{:>14}{:>18}'.format('Path', 'Payload (MB)', 'Preprocess (s)',
+                                                 'Encode (s)', 'End-to-end (s)'))
+    for name, size in [('full', None), ('downsampled', args.size)]:
+        results = np.array([run(hdul, size) for _ in range(args.repeats)])
+        payload, preprocess_time, encode_time = np.median(results, axis=0)
+        transfer_time = payload * 1e-6 / args.bandwidth
+        print('{:<14}{:>16.3f}{:>18.3f}{:>14.3f}{:>18.3f}'.format(name, payload * 1e-6, preprocess_time, encode_time,
+                                                                preprocess_time + encode_time + transfer_time))
+    print('\nBoth paths encode the full-resolution archive JPEG; the payload is the JPEG sent to the endpoint.')
+    print('End-to-end includes transfer at an assumed {} MB/s.'.format(args.bandwidth))
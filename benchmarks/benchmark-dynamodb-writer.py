@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'step-function', 'lambda-scripts'))
+from dynamodb_batch_writer import BatchWriter, convert_floats
+
+
+parser = argparse.ArgumentParser(description='Compare items/sec of sequential put_item calls and the batched DynamoDB writer.')
+parser.add_argument('-n', '--items', type=int, default=2000, metavar='',
+                    help='Number of images to log (default: 2000).')
+parser.add_argument('-l', '--latency', type=float, default=0.005, metavar='',
+                    help='Simulated round trip of one DynamoDB request in seconds (default: 0.005).')
+parser.add_argument('-u', '--unprocessed', type=float, default=0.05, metavar='',
+                    help='Fraction of items a batch request leaves unprocessed, simulating throttling (default: 0.05).')
+args = parser.parse_args()
+
+
+class LocalTable:
+    '''Local stand-in for a DynamoDB table resource.'''
+    def __init__(self, store):
+        self.store = store
+
+    def put_item(self, Item):
+        time.sleep(args.latency)
+        self.store.append(Item)
+
+
+class LocalDynamoDB:
+    '''Local stand-in for the DynamoDB service resource; batch requests randomly leave items unprocessed.'''
+    def __init__(self):
+        self.store = []
+        self.requests = 0
+
+    def Table(self, name):
+        return LocalTable(self.store)
+
+    def batch_write_item(self, RequestItems):
+        time.sleep(args.latency)
+        self.requests += 1
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            for request in requests:
+                if random.random() < args.unprocessed:
+                    unprocessed.setdefault(table_name, []).append(request)
+                else:
+                    self.store.append(request['PutRequest']['Item'])
+        return {'UnprocessedItems': unprocessed}
+
+
+def get_items(index):
+    item = {'IMAGE ID': 'i{:08d}q_flt'.format(index), 'RA_TARG': 150.1 + index * 1e-6,
+            'DEC_TARG': 2.2, 'EXPTIME': 600.0, 'PREDICTED CLASS': 'STARS'}
+    return item, {'IMAGE ID': item['IMAGE ID']}
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    print('{:<12}{:>14}{:>12}{:>14}'.format('Method', 'Items/s', 'Requests', 'Items stored'))
+
+    db_resource = LocalDynamoDB()
+    start = time.perf_counter()
+    for index in range(args.items):
+        item, upload_history_item = get_items(index)
+        db_resource.Table('classifications').put_item(Item=convert_floats([item])[0])
+        db_resource.Table('history').put_item(Item=upload_history_item)
+    elapsed = time.perf_counter() - start
+    print('{:<12}{:>14.0f}{:>12}{:>14}'.format('put_item', 2 * args.items / elapsed, 2 * args.items,
+                                               len(db_resource.store)))
+
+    db_resource = LocalDynamoDB()
+    start = time.perf_counter()
+    items = [get_items(index) for index in range(args.items)]
+    convert_floats([item for item, _ in items])
+    with BatchWriter(db_resource) as writer:
+        for item, upload_history_item in items:
+            writer.put('classifications', item)
+            writer.put('history', upload_history_item)
+    elapsed = time.perf_counter() - start
+    print('{:<12}{:>14.0f}{:>12}{:>14}'.format('BatchWriter', 2 * args.items / elapsed, db_resource.requests,
+                                               len(db_resource.store)))
@@ -0,0 +1,79 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import onnxruntime
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'step-function', 'lambda-scripts', 'classify_image'))
+from fits_preprocessing import merge_chips, block_reduce, normalize, to_uint8, encode_jpeg, to_model_input
+
+
+parser = argparse.ArgumentParser(description='Compare the endpoint and in-process (ONNX) inference paths of classify_image.')
+parser.add_argument('model', type=str, help='Path to the ONNX export of the model (see sagemaker-export-onnx-model.py).')
+parser.add_argument('-n', '--images', type=int, default=32, metavar='',
+                    help='Number of images to classify per path (default: 32).')
+parser.add_argument('-b', '--batch_size', type=int, default=8, metavar='',
+                    help='Number of images per in-process model run (default: 8).')
+parser.add_argument('-l', '--latency', type=float, default=0.02, metavar='',
+                    help='Network latency added by the stubbed endpoint per request in seconds (default: 0.02).')
+args = parser.parse_args()
+
+MODEL_INPUT_SIZE = 256
+session = onnxruntime.InferenceSession(args.model, providers=['CPUExecutionProvider'])
+input_name = session.get_inputs()[0].name
+
+
+class StubEndpoint(BaseHTTPRequestHandler):
+    '''Local stand-in for the SageMaker endpoint: decodes the JPEG and runs the same model.'''
+    def do_POST(self):
+        content = self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(args.latency)
+        image = Image.open(io.BytesIO(content))
+        result = session.run(None, {input_name: to_model_input(image, MODEL_INPUT_SIZE)[np.newaxis]})[0][0]
+        body = json.dumps(result.tolist()).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+def preprocess(chips):
+    data = block_reduce(merge_chips(*chips), MODEL_INPUT_SIZE)
+    return Image.fromarray(to_uint8(normalize(data)))
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    chips = [rng.lognormal(size=(1024, 2048)).astype('>f4') for _ in range(2)]
+    images = [preprocess(chips) for _ in range(args.images)]
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubEndpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/invocations'.format(server.server_port)
+
+    start = time.perf_counter()
+    for image in images:
+        request = urllib.request.Request(url, data=encode_jpeg(image), method='POST')
+        json.loads(urllib.request.urlopen(request).read().decode())
+    endpoint_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model_inputs = [to_model_input(image, MODEL_INPUT_SIZE) for image in images]
+    for index in range(0, len(model_inputs), args.batch_size):
+        session.run(None, {input_name: np.stack(model_inputs[index: index + args.batch_size])})
+    in_process_time = time.perf_counter() - start
+    server.shutdown()
+
+    print('{:<12}{:>14}{:>18}'.format('Path', 'Total (s)', 'Per image (ms)'))
+    for name, elapsed in [('endpoint', endpoint_time), ('in-process', in_process_time)]:
+        print('{:<12}{:>14.3f}{:>18.2f}'.format(name, elapsed, elapsed / args.images * 1e3))
@@ -0,0 +1,68 @@
+import os
+import sys
+import csv
+import gzip
+import time
+import random
+import resource
+import argparse
+import tempfile
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'step-function'))
+from inventory_manifest import ROWS_PER_PAGE, iter_pages
+
+
+parser = argparse.ArgumentParser(description='Measure rows/sec and memory of streaming a synthetic S3 Inventory report, '
+                                             'compared to paging list_objects_v2 over the same bucket.')
+parser.add_argument('-n', '--rows', type=int, default=3000000, metavar='',
+                    help='Number of objects in the synthetic inventory report (default: 3000000).')
+parser.add_argument('-l', '--latency', type=float, default=0.15, metavar='',
+                    help='Round trip of one list_objects_v2 request of 1,000 objects in seconds (default: 0.15).')
+args = parser.parse_args()
+
+# the HST archive stores several files per observation; only a few of them are classified
+SUFFIXES = ['flt.fits', 'flc.fits', 'raw.fits', 'spt.fits', 'jif.fits', 'drz.fits', 'flt_thumb.jpg', 'trl.fits']
+ENDINGS = ['flt.fits', 'flc.fits']
+
+
+def write_report(path):
+    random.seed(0)
+    with gzip.open(path, 'wt', newline='') as report:
+        writer = csv.writer(report)
+        for index in range(args.rows):
+            observation = 'i{:08x}q'.format(index // len(SUFFIXES))
+            key = 'hst/public/{}/{}/{}_{}'.format(observation[:4], observation, observation,
+                                                  SUFFIXES[index % len(SUFFIXES)])
+            writer.writerow(['stpubdata', quote(key), random.randint(10 ** 5, 10 ** 8), '2020-01-01T00:00:00.000Z'])
+
+
+def max_rss():
+    '''Peak resident memory of the process in MB.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'inventory.csv.gz')
+        start = time.perf_counter()
+        write_report(path)
+        print('Wrote {} rows ({:.1f} MB gzipped) in {:.1f} seconds.\n'.format(
+            args.rows, os.path.getsize(path) / 1e6, time.perf_counter() - start))
+
+        rss_before = max_rss()
+        start = time.perf_counter()
+        matched = pages = 0
+        for _, _, rows in iter_pages(path, 'CSV', 'Bucket, Key, Size, LastModifiedDate', None):
+            pages += 1
+            matched += sum(1 for _, key in rows if any([key.endswith(ending) for ending in ENDINGS]))
+        elapsed = time.perf_counter() - start
+
+    list_requests = -(-args.rows // 1000)
+    print('{:<28}{:>14}{:>12}{:>14}{:>16}'.format('Method', 'Rows/s', 'Requests', 'Seconds', 'Peak RSS (MB)'))
+    print('{:<28}{:>14.0f}{:>12}{:>14.1f}{:>16.1f}'.format('inventory report (CSV.gz)', args.rows / elapsed, 0,
+                                                            elapsed, max_rss()))
+    print('{:<28}{:>14.0f}{:>12}{:>14.1f}{:>16}'.format('list_objects_v2 (estimate)', 1000 / args.latency,
+                                                        list_requests, list_requests * args.latency, '-'))
+    print('\n{} keys to publish in {} pages of {} rows; peak RSS grew by {:.1f} MB while streaming.'.format(
+        matched, pages, ROWS_PER_PAGE, max_rss() - rss_before))
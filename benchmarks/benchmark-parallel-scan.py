@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import zlib
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dynamodb_scan import ScanStats, parallel_scan
+
+
+parser = argparse.ArgumentParser(description='Compare items/sec of a sequential and a parallel Scan of a local DynamoDB stand-in.')
+parser.add_argument('-n', '--items', type=int, default=200000, metavar='',
+                    help='Number of items in the table (default: 200000).')
+parser.add_argument('-p', '--page_size', type=int, default=2500, metavar='',
+                    help='Number of items in one page of 1 MB (default: 2500).')
+parser.add_argument('-l', '--latency', type=float, default=0.05, metavar='',
+                    help='Simulated round trip of one Scan request in seconds (default: 0.05).')
+parser.add_argument('-s', '--segments', type=int, nargs='*', default=[1, 2, 4, 8, 16], metavar='',
+                    help='Numbers of segments to compare (default: 1 2 4 8 16).')
+args = parser.parse_args()
+
+
+class LocalDynamoDB:
+    '''Local stand-in for the DynamoDB client: items are split into segments by the hash of their
+       key, like DynamoDB splits the partitions of a table.'''
+    def __init__(self, items):
+        self.items = items
+        # (total segments, segment) -> items of the segment
+        self.segments = {}
+
+    def get_segment(self, segment, total_segments):
+        if (total_segments, segment) not in self.segments:
+            for index in range(total_segments):
+                self.segments[(total_segments, index)] = []
+            for item in self.items:
+                index = zlib.crc32(item['IMAGE ID']['S'].encode()) % total_segments
+                self.segments[(total_segments, index)].append(item)
+        return self.segments[(total_segments, segment)]
+
+    def scan(self, TableName, ReturnConsumedCapacity=None, Segment=0, TotalSegments=1,
+             ExclusiveStartKey=None, **kwargs):
+        time.sleep(args.latency)
+        segment_items = self.get_segment(Segment, TotalSegments)
+        start = int(ExclusiveStartKey['position']['N']) if ExclusiveStartKey else 0
+        response = {'Items': segment_items[start: start + args.page_size],
+                    # 0.5 read capacity units per 4 KB of an eventually consistent read
+                    'ConsumedCapacity': {'TableName': TableName, 'CapacityUnits': 128.0}}
+        if start + args.page_size < len(segment_items):
+            response['LastEvaluatedKey'] = {'position': {'N': str(start + args.page_size)}}
+        return response
+
+
+if __name__ == '__main__':
+    items = [{'IMAGE ID': {'S': 'i{:08d}q_flt'.format(index)}, 'PREDICTED CLASS': {'S': 'STARS'},
+              'RA_TARG': {'N': '150.1'}, 'DEC_TARG': {'N': '2.2'}} for index in range(args.items)]
+    db_client = LocalDynamoDB(items)
+
+    print('{:<10}{:>12}{:>10}{:>10}{:>10}'.format('Segments', 'Items/s', 'Pages', 'RCU', 'Correct'))
+    for segments in args.segments:
+        db_client.get_segment(0, segments)
+        stats = ScanStats()
+        image_ids = [item['IMAGE ID']['S'] for page in parallel_scan(db_client, {'TableName': 'classifications'},
+                                                                     segments, stats) for item in page]
+        # every item is read exactly once, whatever the number of segments
+        correct = len(image_ids) == args.items and len(set(image_ids)) == args.items
+        elapsed = stats.end - stats.start
+        print('{:<10}{:>12.0f}{:>10}{:>10.0f}{:>10}'.format(segments, stats.items / elapsed, stats.pages,
+                                                          stats.capacity_units, str(correct)))
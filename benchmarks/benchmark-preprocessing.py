@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import resource
+import argparse
+import multiprocessing as mp
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'step-function', 'lambda-scripts', 'classify_image'))
+from fits_preprocessing import merge_chips, normalize, to_uint8
+
+
+parser = argparse.ArgumentParser(description='Compare per-image latency and peak RSS of the FITS-to-image preprocessing.')
+parser.add_argument('-r', '--repeats', type=int, default=5, metavar='',
+                    help='Number of images to preprocess per implementation (default: 5).')
+parser.add_argument('-H', '--height', type=int, default=2048, metavar='',
+                    help='Height of each of the two SCI chips (default: 2048).')
+parser.add_argument('-W', '--width', type=int, default=4096, metavar='',
+                    help='Width of each of the two SCI chips (default: 4096).')
+args = parser.parse_args()
+
+
+def legacy(data_1_of_2, data_2_of_2):
+    '''Preprocessing as previously done inside the classify_image lambdas.'''
+    height = data_1_of_2.shape[0] + data_2_of_2.shape[0]
+    width = data_1_of_2.shape[1]
+    temp = np.zeros((height, width))
+    temp[0: int(height/2), :] = data_1_of_2
+    temp[int(height/2): height, :] = data_2_of_2
+    data = temp
+    top = np.percentile(data, 99)
+    data[data > top] = top
+    bottom = np.percentile(data, 1)
+    data[data < bottom] = bottom
+    data = data - data.min()
+    data = (data / data.max()) * 255.0
+    data = np.flipud(data)
+    return np.uint8(data)
+
+
+def shared(data_1_of_2, data_2_of_2):
+    '''Preprocessing as done by the fits_preprocessing package.'''
+    return to_uint8(normalize(merge_chips(data_1_of_2, data_2_of_2)))
+
+
+def run(name, height, width, repeats, queue):
+    '''Preprocess synthetic HST-sized frames in a fresh process and report latency and peak RSS.'''
+    func = {'legacy': legacy, 'shared': shared}[name]
+    rng = np.random.default_rng(0)
+    # FITS data is stored as big-endian float32
+    chips = [rng.lognormal(size=(height, width)).astype('>f4') for _ in range(2)]
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*chips)
+        timings.append(time.perf_counter() - start)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux
+    queue.put((name, np.median(timings), (peak_rss - baseline_rss) / 1024))
+
+
+if __name__ == '__main__':
+    queue = mp.Queue()
+    print('Image size: {}x{} ({} runs each)\n'.format(2 * args.height, args.width, args.repeats))
+    print('{:<8}{:>16}{:>22}'.format('Method', 'Median (s)', 'Peak RSS added (MB)'))
+    for name in ['legacy', 'shared']:
+        process = mp.Process(target=run, args=(name, args.height, args.width, args.repeats, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        print('{:<8}{:>16.3f}{:>22.1f}'.format(*result))
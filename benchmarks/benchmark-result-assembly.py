@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+from matplotlib.colors import to_rgba
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dynamodb_scan import ColumnBuilder
+
+
+parser = argparse.ArgumentParser(description='Compare time and memory of row-by-row and columnar assembly of scanned '
+                                             'classifications into a DataFrame and per-class plot inputs.')
+parser.add_argument('-n', '--items', type=int, default=1000000, metavar='',
+                    help='Number of synthetic items (default: 1000000).')
+parser.add_argument('-r', '--row_items', type=int, default=5000, metavar='',
+                    help='Number of items assembled row by row; df.loc appends are quadratic, so the full count '
+                         'would not finish (default: 5000).')
+parser.add_argument('-p', '--page_size', type=int, default=2500, metavar='',
+                    help='Number of items in one scanned page (default: 2500).')
+args = parser.parse_args()
+
+CLASSES = ['CLUSTER', 'DEEP', 'NEBULA', 'STARS']
+COLORS = {'CLUSTER': 'red', 'DEEP': 'blue', 'NEBULA': 'green', 'STARS': 'yellow'}
+COLUMN_TYPES = {'IMAGE ID': 'S', 'PREDICTED CLASS': 'S',
+                'PROBABILITY OF CLUSTER': 'N', 'PROBABILITY OF DEEP': 'N',
+                'PROBABILITY OF NEBULA': 'N', 'PROBABILITY OF STARS': 'N',
+                'DEC_TARG': 'N', 'RA_TARG': 'N'}
+
+
+def get_pages(count):
+    '''Synthetic scanned pages of items in the low-level DynamoDB format.'''
+    random.seed(0)
+    items = []
+    for index in range(count):
+        item = {'IMAGE ID': {'S': 'i{:08d}q_flt'.format(index)},
+                'PREDICTED CLASS': {'S': random.choice(CLASSES)},
+                'TIME ADDED TO TABLE': {'S': '12:00:00 PM UTC'},
+                'DEC_TARG': {'N': str(round(random.uniform(-90, 90), 6))},
+                'RA_TARG': {'N': str(round(random.uniform(0, 360), 6))}}
+        for cls in CLASSES:
+            item['PROBABILITY OF ' + cls] = {'N': str(round(random.random(), 8))}
+        items.append(item)
+    return [items[start: start + args.page_size] for start in range(0, count, args.page_size)]
+
+
+def assemble_rows(pages):
+    '''Assembly before: per-attribute conversion, df.loc appends, list comprehensions and to_rgba per point.'''
+    type_conversion = {'N': float, 'S': str}
+    responses = []
+    for items in pages:
+        for vals in items:
+            temp = {}
+            for key in vals:
+                _type = list(vals[key].keys())[0]
+                val = list(vals[key].values())[0]
+                temp[key] = type_conversion[_type](val)
+            responses.append(temp)
+    df = pd.DataFrame(columns=list(responses[0].keys()))
+    for index, item in enumerate(responses):
+        df.loc[index, :] = item
+    df = df[list(COLUMN_TYPES.keys())]
+    ra = np.radians(df['RA_TARG'].astype(float).to_numpy())
+    dec = np.radians(df['DEC_TARG'].astype(float).to_numpy())
+    plot_inputs = []
+    for cls in CLASSES:
+        indexes = df[df['PREDICTED CLASS'] == cls].index
+        _ra = [ra[index] for index in indexes]
+        _dec = [dec[index] for index in indexes]
+        rgba_color = [to_rgba(c=COLORS[cls], alpha=df.loc[index, 'PROBABILITY OF ' + cls]) for index in indexes]
+        plot_inputs.append((_ra, _dec, rgba_color))
+    return df, plot_inputs
+
+
+def assemble_columns(pages):
+    '''Assembly after: typed columns decoded per page, one DataFrame, NumPy masks and RGBA arrays.'''
+    columns = ColumnBuilder(COLUMN_TYPES)
+    for items in pages:
+        columns.add(items)
+    df = pd.DataFrame(columns.arrays(), columns=list(COLUMN_TYPES.keys()))
+    df['PREDICTED CLASS'] = df['PREDICTED CLASS'].astype('category')
+    ra = np.radians(df['RA_TARG'].to_numpy())
+    dec = np.radians(df['DEC_TARG'].to_numpy())
+    predicted_classes = df['PREDICTED CLASS'].to_numpy()
+    plot_inputs = []
+    for cls in CLASSES:
+        mask = predicted_classes == cls
+        rgba_color = np.tile(to_rgba(COLORS[cls]), (np.count_nonzero(mask), 1))
+        rgba_color[:, 3] = df['PROBABILITY OF ' + cls].to_numpy()[mask]
+        plot_inputs.append((ra[mask], dec[mask], rgba_color))
+    return df, plot_inputs
+
+
+def measure(assemble, pages):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df, plot_inputs = assemble(pages)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, df, plot_inputs
+
+
+if __name__ == '__main__':
+    print('{:<10}{:>10}{:>12}{:>14}{:>18}'.format('Assembly', 'Items', 'Seconds', 'Items/s', 'Peak memory (MB)'))
+    for name, assemble, count in [('rows', assemble_rows, args.row_items),
+                                  ('columns', assemble_columns, args.row_items),
+                                  ('columns', assemble_columns, args.items)]:
+        pages = get_pages(count)
+        elapsed, peak, df, plot_inputs = measure(assemble, pages)
+        print('{:<10}{:>10}{:>12.2f}{:>14.0f}{:>18.1f}'.format(name, count, elapsed, count / elapsed, peak / 1e6))
+        if count == args.row_items:
+            # both assemblies select the same points with the same colors
+            counts = [len(ra) for ra, _, _ in plot_inputs]
+            alphas = [float(np.sum(np.asarray(rgba)[:, 3])) if len(rgba) else 0.0 for _, _, rgba in plot_inputs]
+            print('{:<10}class counts {}, alpha sums {}'.format('', counts, [round(alpha, 3) for alpha in alphas]))
@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgba
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sky_binning import RA_BINS, DEC_BINS, bin_sky, plot_binned
+
+
+parser = argparse.ArgumentParser(description='Compare time and memory of rendering a Mollweide map of classified images '
+                                             'with one marker per image and binned into an equal-area grid.')
+parser.add_argument('-n', '--points', type=int, nargs='*', default=[10000, 100000, 1000000], metavar='',
+                    help='Numbers of synthetic images to render (default: 10000 100000 1000000).')
+parser.add_argument('-s', '--max_scatter', type=int, default=300000, metavar='',
+                    help='Largest number of images rendered with one marker per image (default: 300000).')
+args = parser.parse_args()
+
+COLORS = {'CLUSTER': 'red', 'DEEP': 'blue', 'NEBULA': 'green', 'STARS': 'yellow'}
+
+
+def get_images(count):
+    random = np.random.default_rng(0)
+    ra = random.uniform(-np.pi, np.pi, count)
+    # uniform over the sphere
+    dec = np.arcsin(random.uniform(-1, 1, count))
+    labels = random.choice(list(COLORS.keys()), count)
+    probabilities = {cls: random.random(count) for cls in COLORS}
+    return ra, dec, labels, probabilities
+
+
+def render_scatter(ra, dec, labels, probabilities):
+    fig = plt.figure(figsize=(16, 14))
+    ax = fig.add_subplot(111, projection='mollweide')
+    for cls in COLORS:
+        mask = labels == cls
+        rgba_color = np.tile(to_rgba(COLORS[cls]), (np.count_nonzero(mask), 1))
+        rgba_color[:, 3] = probabilities[cls][mask]
+        ax.scatter(ra[mask], dec[mask], color=rgba_color, label=cls)
+    ax.legend()
+    fig.savefig(os.devnull, format='png')
+    plt.close(fig)
+
+
+def render_binned(ra, dec, labels, probabilities):
+    fig = plt.figure(figsize=(16, 14))
+    ax = fig.add_subplot(111, projection='mollweide')
+    binned = bin_sky(ra, dec, labels, list(COLORS.keys()), probabilities)
+    plot_binned(ax, binned, COLORS)
+    fig.savefig(os.devnull, format='png')
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    print('Grid of {} x {} equal-area cells.\n'.format(RA_BINS, DEC_BINS))
+    print('{:<10}{:>10}{:>12}{:>18}'.format('Rendering', 'Images', 'Seconds', 'Peak memory (MB)'))
+    for count in args.points:
+        images = get_images(count)
+        for name, render in [('scatter', render_scatter), ('binned', render_binned)]:
+            if render is render_scatter and count > args.max_scatter:
+                continue
+            tracemalloc.start()
+            start = time.perf_counter()
+            render(*images)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{:<10}{:>10}{:>12.2f}{:>18.1f}'.format(name, count, elapsed, peak / 1e6))
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'step-function'))
+from sns_batch_publisher import MAX_BATCH_PUBLISH_ENTRIES, TokenBucket, BatchPublisher
+
+
+parser = argparse.ArgumentParser(description='Compare messages/sec of one-at-a-time and batched, concurrent SNS publishing.')
+parser.add_argument('-n', '--messages', type=int, default=2000, metavar='',
+                    help='Number of messages to publish (default: 2000).')
+parser.add_argument('-l', '--latency', type=float, default=0.02, metavar='',
+                    help='Simulated round trip of one SNS request in seconds (default: 0.02).')
+parser.add_argument('-f', '--failures', type=float, default=0.02, metavar='',
+                    help='Fraction of batch entries that fail with a retryable error, simulating throttling (default: 0.02).')
+parser.add_argument('-c', '--publishers', type=int, default=8, metavar='',
+                    help='Number of concurrent publishers (default: 8).')
+parser.add_argument('-r', '--rate', type=float, default=500.0, metavar='',
+                    help='Rate limit of the rate-limited run in messages/s (default: 500).')
+args = parser.parse_args()
+
+
+class LocalSNS:
+    '''Local stand-in for the SNS client; batch entries randomly fail with a retryable error.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.requests = 0
+
+    def publish(self, TopicArn, Message):
+        time.sleep(args.latency)
+        with self.lock:
+            self.requests += 1
+            self.delivered += 1
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        time.sleep(args.latency)
+        successful, failed = [], []
+        for entry in PublishBatchRequestEntries:
+            if random.random() < args.failures:
+                failed.append({'Id': entry['Id'], 'Code': 'Throttled', 'Message': 'Rate exceeded',
+                               'SenderFault': False})
+            else:
+                successful.append({'Id': entry['Id'], 'MessageId': entry['Id']})
+        with self.lock:
+            self.requests += 1
+            self.delivered += len(successful)
+        return {'Successful': successful, 'Failed': failed}
+
+
+def publish_batches(messages, publishers, rate):
+    sns_client = LocalSNS()
+    publisher = BatchPublisher(sns_client, 'arn:aws:sns:local:topic', TokenBucket(rate), base_delay=0.01)
+    batches = [messages[start: start + MAX_BATCH_PUBLISH_ENTRIES]
+               for start in range(0, len(messages), MAX_BATCH_PUBLISH_ENTRIES)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=publishers) as executor:
+        failed = sum(len(result) for result in executor.map(publisher.publish, batches))
+    return time.perf_counter() - start, sns_client, failed
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    messages = ['{{"Records": [{{"s3": {{"object": {{"key": "hst/public/i{0:04d}/i{0:08d}q_flt.fits"}}}}}}]}}'.format(index)
+                for index in range(args.messages)]
+    print('{:<28}{:>12}{:>12}{:>12}{:>10}'.format('Method', 'Msgs/s', 'Requests', 'Delivered', 'Failed'))
+
+    sns_client = LocalSNS()
+    start = time.perf_counter()
+    for message in messages:
+        sns_client.publish(TopicArn='arn:aws:sns:local:topic', Message=message)
+    elapsed = time.perf_counter() - start
+    print('{:<28}{:>12.0f}{:>12}{:>12}{:>10}'.format('publish', args.messages / elapsed, sns_client.requests,
+                                                     sns_client.delivered, 0))
+
+    for name, publishers, rate in [('publish_batch', 1, 0),
+                                   ('publish_batch x{}'.format(args.publishers), args.publishers, 0),
+                                   ('publish_batch x{} @ {:.0f}/s'.format(args.publishers, args.rate),
+                                    args.publishers, args.rate)]:
+        elapsed, sns_client, failed = publish_batches(messages, publishers, rate)
+        print('{:<28}{:>12.0f}{:>12}{:>12}{:>10}'.format(name, args.messages / elapsed, sns_client.requests,
+                                                         sns_client.delivered, failed))
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+
+parser = argparse.ArgumentParser(description='Compare the time and disk usage of train-validation-test-split.py '
+                                             'in each mode on a synthetic directory of images.')
+parser.add_argument('-n', '--images', type=int, default=5000, metavar='',
+                    help='Number of synthetic images in each of the four classes (default: 5000).')
+parser.add_argument('-s', '--size', type=int, default=100000, metavar='',
+                    help='Size of each synthetic image in bytes (default: 100000).')
+parser.add_argument('-w', '--workers', type=int, default=8, metavar='',
+                    help='Number of images placed at the same time (default: 8).')
+args = parser.parse_args()
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'train-validation-test-split.py')
+CLASSES = ['CLUSTER', 'DEEP', 'NEBULA', 'STARS']
+MODES = ['copy', 'hardlink', 'symlink', 'reflink', 'manifest']
+
+
+def disk_usage(path):
+    '''Function returns the bytes allocated to the files under path, counting each inode once.'''
+    inodes = set()
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            stat = os.lstat(os.path.join(root, name))
+            if stat.st_ino not in inodes:
+                inodes.add(stat.st_ino)
+                total += stat.st_blocks * 512
+    return total
+
+
+if __name__ == '__main__':
+    parent = tempfile.mkdtemp()
+    try:
+        for cls in CLASSES:
+            os.makedirs(os.path.join(parent, cls))
+            for index in range(args.images):
+                with open(os.path.join(parent, cls, '{:06d}.jpg'.format(index)), 'wb') as file:
+                    file.write(os.urandom(args.size))
+        source_usage = disk_usage(parent)
+        print('{:<10}{:>10}{:>12}{:>22}'.format('Mode', 'Images', 'Seconds', 'Added disk usage (MB)'))
+        for mode in MODES:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, SCRIPT, parent, '-m', mode, '-w', str(args.workers)],
+                           check=True, stdout=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            added = disk_usage(parent) - source_usage
+            print('{:<10}{:>10}{:>12.2f}{:>22.1f}'.format(mode, args.images * len(CLASSES), elapsed, added / 1e6))
+            for name in ['TRAIN', 'VALIDATION', 'TEST', 'split.csv']:
+                path = os.path.join(parent, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+    finally:
+        shutil.rmtree(parent)
@@ -0,0 +1,118 @@
+'''Incremental local Parquet cache of the classifications table, used by query-dynamodb-and-plot.py.
+
+The table is append-only and log_to_dynamodb stamps every item with "DATE ADDED TO TABLE" and
+"TIMESTAMP ADDED TO TABLE", so a sync only has to fetch the items added since the previous one.
+Each sync writes its items as a new Parquet partition of the cache directory. The column types
+are saved with the watermark; a sync with other column types fetches the whole table again.'''
+import os
+import sys
+import json
+import time
+from contextlib import closing
+import pandas as pd
+from dynamodb_scan import ScanStats, ColumnBuilder, parallel_scan
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'step-function', 'lambda-scripts'))
+from date_index import get_date_partitions, query_partitions
+
+
+# overlap between two syncs, covering index propagation delay and clock skew (in seconds)
+SYNC_OVERLAP = 30
+STATE_FILE = '_cache-state.json'
+
+
+class CacheMismatchException(Exception):
+    pass
+
+
+class ClassificationsCache:
+    '''Partitions of the classifications table in a local directory, and the high-watermark
+       (the time of the last sync) up to which they are complete.'''
+    def __init__(self, directory, table):
+        self.directory = directory
+        self.state_path = os.path.join(directory, STATE_FILE)
+        self.state = {'table': table, 'column_types': None, 'watermark': None, 'partitions': []}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as state_file:
+                self.state = json.load(state_file)
+            if self.state['table'] != table:
+                msg = 'Cache {} holds table {}, not {}.'
+                raise CacheMismatchException(msg.format(directory, self.state['table'], table))
+
+    def scan(self, db_client, kwargs, columns, segments, stats):
+        '''Add the items of a parallel Scan to columns; the scan stops if adding them fails.'''
+        with closing(parallel_scan(db_client, kwargs, segments, stats)) as pages:
+            for items in pages:
+                columns.add(items)
+
+    def fetch_since(self, db_client, kwargs, since, columns, date_index, segments, stats):
+        '''Add the items stamped at or after since to columns: with the date index, by querying
+           each day since then; without it, by a parallel Scan that filters on the timestamp.'''
+        names = dict(kwargs['ExpressionAttributeNames'], **{'#date': 'DATE ADDED TO TABLE',
+                                                           '#ts': 'TIMESTAMP ADDED TO TABLE'})
+        if not date_index:
+            # a filtered Scan still reads (and is billed for) the whole table, but only returns new items
+            scan_kwargs = dict(kwargs, ExpressionAttributeNames=names, FilterExpression='#ts >= :since',
+                               ExpressionAttributeValues={':since': {'N': str(since)}})
+            self.scan(db_client, scan_kwargs, columns, segments, stats)
+            return
+
+        query_kwargs = {key: value for key, value in kwargs.items() if key != 'Select'}
+        query_kwargs.update(IndexName=date_index, ExpressionAttributeNames=names,
+                            KeyConditionExpression='#date = :date AND #ts >= :since',
+                            ReturnConsumedCapacity='TOTAL')
+
+        def get_kwargs(partition):
+            return dict(query_kwargs, ExpressionAttributeValues={':date': {'S': partition},
+                                                                 ':since': {'N': str(since)}})
+
+        for response in query_partitions(db_client.query, get_kwargs, get_date_partitions(since, time.time())):
+            stats.record(response)
+            columns.add(response['Items'])
+
+    def sync(self, db_client, kwargs, column_types, segments=1, date_index=None, stats=None):
+        '''Fetch the items added to the table since the high-watermark (every item on the first
+           sync, or if the column types changed) and write them as a new partition.
+           Function returns the number of items fetched.'''
+        start = int(time.time())
+        stats = stats if stats is not None else ScanStats()
+        columns = ColumnBuilder(column_types)
+        # partitions written with other column types are replaced by a full sync
+        stale_partitions = []
+        if self.state.get('column_types') != column_types:
+            stale_partitions = self.state['partitions']
+            self.state.update(column_types=column_types, watermark=None, partitions=[])
+        if self.state['watermark'] is None:
+            self.scan(db_client, kwargs, columns, segments, stats)
+        else:
+            self.fetch_since(db_client, kwargs, self.state['watermark'] - SYNC_OVERLAP, columns,
+                             date_index, segments, stats)
+        stats.end = time.time()
+
+        df = pd.DataFrame(columns.arrays(), columns=list(column_types.keys()))
+        os.makedirs(self.directory, exist_ok=True)
+        if len(df):
+            partition = 'part-{:05d}-{}.parquet'.format(len(self.state['partitions']), start)
+            df.to_parquet(os.path.join(self.directory, partition), index=False)
+            self.state['partitions'].append(partition)
+        self.state['watermark'] = start
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(self.state, state_file)
+        os.replace(temp_path, self.state_path)
+        for partition in stale_partitions:
+            if partition not in self.state['partitions']:
+                os.remove(os.path.join(self.directory, partition))
+        return len(df)
+
+    def read(self, columns=None):
+        '''Function returns a DataFrame of every cached item, read from the partitions.'''
+        frames = [pd.read_parquet(os.path.join(self.directory, partition), columns=columns)
+                  for partition in self.state['partitions']]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True)
+        # syncs overlap, so an item may be in two partitions; the latest copy is kept
+        if 'IMAGE ID' in df.columns:
+            df = df.drop_duplicates('IMAGE ID', keep='last').reset_index(drop=True)
+        return df
@@ -0,0 +1,121 @@
+'''Parallel Scan of a DynamoDB table, shared by query-dynamodb-and-plot.py and its benchmarks.'''
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ScanStats:
+    '''Items, pages and read capacity of a scan, reported as throughput at the end.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = 0
+        self.pages = 0
+        self.capacity_units = 0.0
+        self.start = time.time()
+        self.end = None
+
+    def record(self, response):
+        with self.lock:
+            self.items += len(response['Items'])
+            self.pages += 1
+            self.capacity_units += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+
+    def report(self):
+        elapsed = max((self.end or time.time()) - self.start, 1e-9)
+        msg = 'Scanned {} items in {} pages in {:.1f} seconds: {:.0f} items/s, '
+        msg += '{:.1f} read capacity units consumed ({:.1f} RCU/s).'
+        return msg.format(self.items, self.pages, elapsed, self.items / elapsed,
+                          self.capacity_units, self.capacity_units / elapsed)
+
+
+# time between two checks of whether the scan was stopped while a worker waits for the reader (in seconds)
+PUT_TIMEOUT = 0.1
+
+
+def put_page(pages, items, stopping):
+    '''Put a page on pages, waiting while the reader is behind, unless the scan is stopped.
+       Function returns whether the page was put.'''
+    while not stopping.is_set():
+        try:
+            pages.put(items, timeout=PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def scan_segment(db_client, kwargs, segment, segments, pages, stats, stopping):
+    '''Page through one segment of the table, putting the items of each page on pages,
+       until the segment is done or stopping is set.'''
+    kwargs = dict(kwargs, ReturnConsumedCapacity='TOTAL')
+    if segments > 1:
+        kwargs.update(Segment=segment, TotalSegments=segments)
+    try:
+        while not stopping.is_set():
+            response = db_client.scan(**kwargs)
+            stats.record(response)
+            if not put_page(pages, response['Items'], stopping):
+                break
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    finally:
+        # tell the reader that this segment is done
+        put_page(pages, None, stopping)
+
+
+def parallel_scan(db_client, kwargs, segments=1, stats=None):
+    '''Scan a table with segments workers, each reading a segment of it (parallel Scan).
+       Function yields the items of each page as soon as it is read, in no particular order.
+       The workers stop when the caller stops iterating (or closes the generator) early.'''
+    stats = stats if stats is not None else ScanStats()
+    # a few pages per segment are buffered, so memory use does not depend on the size of the table
+    pages = queue.Queue(maxsize=2 * segments)
+    stopping = threading.Event()
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        futures = [executor.submit(scan_segment, db_client, kwargs, segment, segments, pages, stats, stopping)
+                   for segment in range(segments)]
+        try:
+            remaining = segments
+            while remaining:
+                items = pages.get()
+                if items is None:
+                    remaining -= 1
+                else:
+                    yield items
+        finally:
+            # unblock the workers waiting on a full queue, so that leaving the executor does not hang
+            stopping.set()
+            stats.end = time.time()
+        # raise the exception of a segment that failed
+        for future in futures:
+            future.result()
+
+
+class ColumnBuilder:
+    '''Decode pages of scanned items (in the low-level format, e.g. {'RA_TARG': {'N': '150.1'}})
+       straight into one typed array per column. columns maps each attribute name to its
+       DynamoDB type: 'N' attributes become float64 arrays (NaN where missing), 'S' attributes
+       object arrays (None where missing).'''
+    def __init__(self, columns):
+        self.columns = columns
+        # attribute name -> decoded arrays of each page
+        self.chunks = {name: [] for name in columns}
+
+    def add(self, items):
+        for name, chunks in self.chunks.items():
+            if self.columns[name] == 'N':
+                chunks.append(np.fromiter((float(item[name]['N']) if name in item else np.nan for item in items),
+                                          dtype=np.float64, count=len(items)))
+            else:
+                chunk = np.empty(len(items), dtype=object)
+                chunk[:] = [item[name]['S'] if name in item else None for item in items]
+                chunks.append(chunk)
+
+    def arrays(self):
+        '''Function returns a dict of attribute name -> array of all the items added.'''
+        return {name: np.concatenate(chunks) if chunks else
+                np.empty(0, dtype=np.float64 if self.columns[name] == 'N' else object)
+                for name, chunks in self.chunks.items()}
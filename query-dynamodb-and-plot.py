@@ -1,16 +1,32 @@
 import boto3
 import argparse
+import numpy as np
 import pandas as pd
 import astropy
 import astropy.coordinates as coord
 import astropy.units as units
 import matplotlib.pyplot as plt
 from matplotlib.colors import to_rgba
+from dynamodb_scan import ScanStats, ColumnBuilder, parallel_scan
+from classifications_cache import ClassificationsCache
+from sky_binning import add_binning_arguments, bin_sky, plot_binned, save_and_show
 
 
 parser = argparse.ArgumentParser(description='Query DynamoDB table for all entries and then plot the entries.')
 parser.add_argument('profile', type=str, help='Name of the AWS profile to use.')
 parser.add_argument('table', type=str, help='Name of the DynamoDB to query.')
+parser.add_argument('-s', '--segments', type=int, default=1, metavar='',
+                    help='Number of segments of the table scanned at the same time (default: 1).')
+parser.add_argument('-c', '--cache', type=str, default=None, metavar='',
+                    help='Directory of a local Parquet cache of the table; only the items added since the last '
+                         'sync are fetched, and the plot reads from the cache (default: no cache).')
+parser.add_argument('-d', '--date_index', type=str, default=None, metavar='',
+                    help='Global secondary index of the table with "DATE ADDED TO TABLE" as partition key and '
+                         '"TIMESTAMP ADDED TO TABLE" as sort key; lets a sync query new items instead of '
+                         'scanning the table (default: none).')
+parser.add_argument('-o', '--offline', action='store_true',
+                    help='Plot the cache without syncing it first.')
+add_binning_arguments(parser, 'image')
 args = parser.parse_args()
 
 sess = boto3.Session(profile_name=args.profile)
@@ -29,39 +45,33 @@ kwargs = {
                                 "#nebula": "PROBABILITY OF NEBULA"}
 }
 
-response = db_client.scan(**kwargs)
-responses = []
-# query table for all entries
-while 'LastEvaluatedKey' in response.keys():
-    key = response['LastEvaluatedKey']
-    responses.extend([item for item in response['Items']])
-    temp_kwargs = kwargs.copy()
-    temp_kwargs['ExclusiveStartKey'] = key
-    response = db_client.scan(**temp_kwargs)
-responses.extend([item for item in response['Items']])
+# DynamoDB type of each column to keep
+column_types = {'IMAGE ID': 'S', 'PREDICTED CLASS': 'S',
+                'PROBABILITY OF CLUSTER': 'N', 'PROBABILITY OF DEEP': 'N',
+                'PROBABILITY OF NEBULA': 'N', 'PROBABILITY OF STARS': 'N',
+                'DEC_TARG': 'N', 'RA_TARG': 'N'}
+ordered_cols = list(column_types.keys())
 
-# extract the values from each entry
-type_conversion = {'N': float, 'S': str}
-for index in range(len(responses)):
-    vals = responses[index]
-    temp = {}
-    for key in vals:
-        _type = list(vals[key].keys())[0]
-        val = list(vals[key].values())[0]
-        temp[key] = type_conversion[_type](val)
-    responses[index] = temp
+if args.cache:
+    # sync the cache with the items added since the last sync, then read every item from it
+    cache = ClassificationsCache(args.cache, args.table)
+    if not args.offline:
+        stats = ScanStats()
+        added = cache.sync(db_client, kwargs, column_types, args.segments, args.date_index, stats)
+        print(stats.report())
+        print('Added {} items to the cache in {}.'.format(added, args.cache))
+    df = cache.read(ordered_cols)
+else:
+    # query table for all entries, decoding the values into typed columns as the pages of the segments come in
+    columns = ColumnBuilder(column_types)
+    stats = ScanStats()
+    for items in parallel_scan(db_client, kwargs, args.segments, stats):
+        columns.add(items)
+    print(stats.report())
 
-
-ordered_cols = ['IMAGE ID', 'PREDICTED CLASS',
-                'PROBABILITY OF CLUSTER', 'PROBABILITY OF DEEP', 
-                'PROBABILITY OF NEBULA', 'PROBABILITY OF STARS',
-                'DEC_TARG', 'RA_TARG']
-
-# stick the data into a DataFrame
-df = pd.DataFrame(columns=list(responses[0].keys()))
-for index, item in enumerate(responses):
-    df.loc[index, :] = item
-df = df[ordered_cols]
+    # stick the data into a DataFrame
+    df = pd.DataFrame(columns.arrays(), columns=ordered_cols)
+df['PREDICTED CLASS'] = df['PREDICTED CLASS'].astype('category')
 
 colors = {'CLUSTER': 'red',
           'DEEP'   : 'blue',
@@ -75,22 +85,31 @@ colors = {'CLUSTER': 'red',
 # ==============================================
 
 # convert to angular coordinates
-ra = coord.Angle(df['RA_TARG'] * units.degree)
+ra = coord.Angle(df['RA_TARG'].to_numpy() * units.degree)
 ra = ra.wrap_at(180 * units.degree)
-dec = coord.Angle(df['DEC_TARG'] * units.degree)
+dec = coord.Angle(df['DEC_TARG'].to_numpy() * units.degree)
+ra_radian, dec_radian = ra.radian, dec.radian
+predicted_classes = df['PREDICTED CLASS'].to_numpy()
 
 fig = plt.figure(figsize=(16, 14))
 ax = fig.add_subplot(111, projection="mollweide")
 max_len = max([len(k) for k in colors.keys()])
 print('\nClass Count\n' + "="*16)
 for cls in colors.keys():
-    indexes = df[df['PREDICTED CLASS'] == cls].index
-    print('{}'.format(cls).ljust(max_len) + ' -> {}'.format(len(indexes)))
-    _ra = [ra.radian[index] for index in indexes]
-    _dec = [dec.radian[index] for index in indexes]
-    rgba_color = [to_rgba(c=colors[cls],
-                          alpha=df.loc[index, 'PROBABILITY OF ' + cls]) for index in indexes]
-    ax.scatter(_ra, _dec, color=rgba_color, label=cls)
+    mask = predicted_classes == cls
+    print('{}'.format(cls).ljust(max_len) + ' -> {}'.format(np.count_nonzero(mask)))
+    if not args.binned:
+        # the color of the class, with the probability of the class as alpha
+        rgba_color = np.tile(to_rgba(colors[cls]), (np.count_nonzero(mask), 1))
+        rgba_color[:, 3] = df['PROBABILITY OF ' + cls].to_numpy()[mask]
+        ax.scatter(ra_radian[mask], dec_radian[mask], color=rgba_color, label=cls)
 print('-'*16 + "\n".ljust(max_len+5) + "{}\n".format(df.shape[0]))
-ax.legend()
-plt.show()
+binned = None
+if args.binned:
+    probabilities = {cls: df['PROBABILITY OF ' + cls].to_numpy() for cls in colors.keys()}
+    binned = bin_sky(ra_radian, dec_radian, predicted_classes, list(colors.keys()), probabilities,
+                     args.ra_bins, args.dec_bins)
+    plot_binned(ax, binned, colors, args.ra_bins, args.dec_bins)
+else:
+    ax.legend()
+save_and_show(fig, binned, args)
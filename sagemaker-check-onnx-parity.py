@@ -0,0 +1,98 @@
+import os
+import sys
+import glob
+import json
+import tarfile
+import argparse
+import tempfile
+import numpy as np
+import mxnet as mx
+import onnxruntime
+from astropy.io import fits
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'step-function', 'lambda-scripts', 'classify_image'))
+from fits_preprocessing import fits_to_image, encode_jpeg, to_model_input
+
+
+parser = argparse.ArgumentParser(description='Check that the ONNX backend of classify_image classifies images like the '
+                                             'trained MXNet model served by the SageMaker endpoint.')
+parser.add_argument('model_archive', type=str,
+                    help='Path to the model.tar.gz written by the training job to its S3 output location.')
+parser.add_argument('onnx_model', type=str,
+                    help='Path to the ONNX export of the model (see sagemaker-export-onnx-model.py).')
+parser.add_argument('images', type=str, nargs='+',
+                    help='Paths to FITS files to classify (e.g. /Users/johndoe/Desktop/idpya7i2q_flt.fits).')
+parser.add_argument('-s', '--image_shape', type=str, default='3,256,256', metavar='',
+                    help='Image shape the model was trained with (default: "3,256,256").')
+parser.add_argument('-e', '--endpoint', type=str, default=None, metavar='',
+                    help='Name of a SageMaker endpoint serving the model, to also compare against (default: none).')
+parser.add_argument('-t', '--tolerance', type=float, default=0.01, metavar='',
+                    help='Largest allowed difference between two probabilities of a class (default: 0.01).')
+args = parser.parse_args()
+
+
+def load_mxnet_model(model_archive, image_shape, model_dir):
+    '''Function returns the trained model of a training job, bound for inference on one image.'''
+    with tarfile.open(model_archive) as archive:
+        archive.extractall(model_dir)
+    symbol_file = glob.glob(os.path.join(model_dir, '*-symbol.json'))[0]
+    prefix = symbol_file[: -len('-symbol.json')]
+    # the parameters of the last epoch
+    epoch = int(sorted(glob.glob(prefix + '-*.params'))[-1][-len('0000.params'): -len('.params')])
+    symbol, arg_params, aux_params = mx.model.load_checkpoint(prefix, epoch)
+    module = mx.mod.Module(symbol=symbol, context=mx.cpu(), label_names=None)
+    module.bind(for_training=False, data_shapes=[('data', (1,) + image_shape)])
+    module.set_params(arg_params, aux_params, allow_missing=True)
+    return module
+
+
+def classify_mxnet(module, content, image_shape):
+    '''Classify a JPEG the way the endpoint does: decode it to three channels and resize it to
+       the image shape with MXNet. Function returns the probability of each class.'''
+    image = mx.image.imdecode(content)
+    image = mx.image.imresize(image, image_shape[2], image_shape[1])
+    data = mx.nd.transpose(image, (2, 0, 1)).astype(np.float32).expand_dims(axis=0)
+    module.forward(mx.io.DataBatch([data]), is_train=False)
+    return module.get_outputs()[0].asnumpy()[0]
+
+
+def classify_endpoint(runtime, content):
+    response = runtime.invoke_endpoint(EndpointName=args.endpoint, Body=content)
+    return np.array(json.loads(response['Body'].read().decode()))
+
+
+if __name__ == '__main__':
+    image_shape = tuple(int(dim) for dim in args.image_shape.split(','))
+    session = onnxruntime.InferenceSession(args.onnx_model, providers=['CPUExecutionProvider'])
+    input_name = session.get_inputs()[0].name
+    runtime = None
+    if args.endpoint:
+        import boto3
+        runtime = boto3.client('runtime.sagemaker')
+
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as model_dir:
+        module = load_mxnet_model(args.model_archive, image_shape, model_dir)
+        print('{:<40}{:>16}{:>20}'.format('Image', 'Reference', 'Largest difference'))
+        for path in args.images:
+            # the same preprocessing as the lambdas: the SageMaker backend sends the JPEG of the
+            # model image, the ONNX backend passes the model image to the model directly
+            with fits.open(path) as hdul:
+                _, _, model_image = fits_to_image(hdul, image_shape[1])
+            content = encode_jpeg(model_image)
+            onnx_result = session.run(None, {input_name: to_model_input(model_image, image_shape[1])[np.newaxis]})[0][0]
+            references = [('mxnet', classify_mxnet(module, content, image_shape))]
+            if runtime is not None:
+                references.append(('endpoint', classify_endpoint(runtime, content)))
+            for name, result in references:
+                difference = float(np.max(np.abs(onnx_result - result)))
+                same_class = int(np.argmax(onnx_result)) == int(np.argmax(result))
+                if difference > args.tolerance or not same_class:
+                    mismatches += 1
+                print('{:<40}{:>16}{:>20.6f}{}'.format(os.path.basename(path), name, difference,
+                                                      '' if same_class else '  (predicted class differs)'))
+
+    print('\n{} of {} comparisons outside a tolerance of {}.'.format(mismatches, len(args.images) * len(references),
+                                                                   args.tolerance))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,35 @@
+import os
+import glob
+import tarfile
+import argparse
+import tempfile
+import numpy as np
+import mxnet as mx
+
+
+parser = argparse.ArgumentParser(description='Export a trained SageMaker image classification model to ONNX for in-process inference.')
+parser.add_argument('model_archive', type=str,
+                    help='Path to the model.tar.gz written by the training job to its S3 output location.')
+parser.add_argument('save_path', type=str,
+                    help='Path to the ONNX file to write (e.g. /Users/johndoe/Desktop/model.onnx).')
+parser.add_argument('-s', '--image_shape', type=str, default='3,256,256', metavar='',
+                    help='Image shape the model was trained with (default: "3,256,256").')
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    image_shape = tuple(int(dim) for dim in args.image_shape.split(','))
+    with tempfile.TemporaryDirectory() as model_dir:
+        with tarfile.open(args.model_archive) as archive:
+            archive.extractall(model_dir)
+        symbol_file = glob.glob(os.path.join(model_dir, '*-symbol.json'))[0]
+        # the parameters of the last epoch
+        params_file = sorted(glob.glob(os.path.join(model_dir, '*.params')))[-1]
+        # the batch dimension is left dynamic so that images can be classified in batches
+        mx.onnx.export_model(symbol_file, params_file,
+                             in_shapes=[(1,) + image_shape],
+                             in_types=[np.float32],
+                             onnx_file_path=args.save_path,
+                             dynamic=True,
+                             dynamic_input_shapes=[(None,) + image_shape])
+    print('\nModel exported to "{}".\n'.format(args.save_path))
@@ -0,0 +1,143 @@
+'''Density-binned sky maps: images are aggregated into an equal-area grid of the sky, so the cost
+of plotting depends on the number of cells instead of the number of images.
+
+The grid has n_ra columns equal in right ascension and n_dec rows equal in sin(declination),
+so every cell covers the same solid angle (4 pi / (n_ra * n_dec) steradians).'''
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgba
+from matplotlib.patches import Patch
+
+
+RA_BINS = 360
+DEC_BINS = 180
+
+
+def cell_edges(n_ra=RA_BINS, n_dec=DEC_BINS):
+    '''Function returns the edges (in radians) of the cells in right ascension, wrapped at 180
+       degrees, and in declination.'''
+    return np.linspace(-np.pi, np.pi, n_ra + 1), np.arcsin(np.linspace(-1.0, 1.0, n_dec + 1))
+
+
+def sky_cells(ra, dec, n_ra=RA_BINS, n_dec=DEC_BINS):
+    '''Function returns the index (row * n_ra + column) of the cell of each position, given the
+       right ascension wrapped at 180 degrees and the declination in radians.'''
+    columns = np.clip(((np.asarray(ra) + np.pi) / (2 * np.pi) * n_ra).astype(np.int64), 0, n_ra - 1)
+    rows = np.clip(((np.sin(dec) + 1.0) / 2.0 * n_dec).astype(np.int64), 0, n_dec - 1)
+    return rows * n_ra + columns
+
+
+def bin_sky(ra, dec, labels, classes, probabilities=None, n_ra=RA_BINS, n_dec=DEC_BINS):
+    '''Aggregate images by cell. probabilities optionally maps each class to the probability
+       of that class of every image.
+       Function returns a DataFrame with a row per non-empty cell: its index, center (in degrees),
+       number of images, number of images of each class and, if probabilities are given, the mean
+       probability of each class over the images predicted as that class. Images with a right
+       ascension or declination that is not finite are left out.'''
+    ra, dec, labels = np.asarray(ra, dtype=np.float64), np.asarray(dec, dtype=np.float64), np.asarray(labels)
+    # images without a position (e.g. missing RA_TARG or DEC_TARG) are left out
+    finite = np.isfinite(ra) & np.isfinite(dec)
+    if not finite.all():
+        ra, dec, labels = ra[finite], dec[finite], labels[finite]
+        if probabilities is not None:
+            probabilities = {cls: np.asarray(values)[finite] for cls, values in probabilities.items()}
+    cells = sky_cells(ra, dec, n_ra, n_dec)
+    counts = np.bincount(cells, minlength=n_ra * n_dec)
+    occupied = np.flatnonzero(counts)
+    ra_edges, dec_edges = cell_edges(n_ra, n_dec)
+    ra_centers = (ra_edges[:-1] + ra_edges[1:]) / 2
+    dec_centers = (dec_edges[:-1] + dec_edges[1:]) / 2
+
+    binned = {'CELL': occupied,
+              'RA': np.degrees(ra_centers[occupied % n_ra]),
+              'DEC': np.degrees(dec_centers[occupied // n_ra]),
+              'COUNT': counts[occupied]}
+    for cls in classes:
+        mask = labels == cls
+        class_counts = np.bincount(cells[mask], minlength=n_ra * n_dec)
+        binned['COUNT OF ' + cls] = class_counts[occupied]
+        if probabilities is not None:
+            sums = np.bincount(cells[mask], weights=np.asarray(probabilities[cls])[mask], minlength=n_ra * n_dec)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                binned['MEAN PROBABILITY OF ' + cls] = sums[occupied] / class_counts[occupied]
+    return pd.DataFrame(binned)
+
+
+def binned_colors(binned, colors, n_ra=RA_BINS, n_dec=DEC_BINS):
+    '''Function returns the (n_dec, n_ra, 4) RGBA grid of the cells: each non-empty cell has the
+       color of its most frequent class, with the mean probability of that class as alpha, or the
+       log of the number of images relative to the densiest cell without probabilities.'''
+    classes = list(colors.keys())
+    class_counts = binned[['COUNT OF ' + cls for cls in classes]].to_numpy()
+    dominant = np.argmax(class_counts, axis=1)
+    rgba = np.array([to_rgba(colors[cls]) for cls in classes])[dominant]
+    if all('MEAN PROBABILITY OF ' + cls in binned for cls in classes):
+        probabilities = binned[['MEAN PROBABILITY OF ' + cls for cls in classes]].to_numpy()
+        rgba[:, 3] = np.nan_to_num(probabilities[np.arange(len(binned)), dominant])
+    else:
+        counts = binned['COUNT'].to_numpy()
+        rgba[:, 3] = np.log1p(counts) / np.log1p(counts.max(initial=1))
+
+    grid = np.zeros((n_dec * n_ra, 4))
+    grid[binned['CELL'].to_numpy()] = rgba
+    return grid.reshape(n_dec, n_ra, 4)
+
+
+def plot_binned(ax, binned, colors, n_ra=RA_BINS, n_dec=DEC_BINS):
+    '''Draw the cells on a (Mollweide) sky axes, with a legend entry per class.'''
+    ra_edges, dec_edges = cell_edges(n_ra, n_dec)
+    ax.pcolormesh(ra_edges, dec_edges, binned_colors(binned, colors, n_ra, n_dec))
+    # a fixed location, since finding the "best" one tests every cell of the mesh
+    ax.legend(handles=[Patch(color=colors[cls], label=cls) for cls in colors], loc='lower right')
+
+
+def bin_positions(positions, n_ra=RA_BINS, n_dec=DEC_BINS):
+    '''Bin the positions of objects of several classes. positions maps each class to the
+       (ra, dec) of its objects in radians, the right ascension wrapped at 180 degrees.
+       Function returns the DataFrame of bin_sky.'''
+    ra = np.concatenate([np.asarray(ra, dtype=np.float64) for ra, _ in positions.values()])
+    dec = np.concatenate([np.asarray(dec, dtype=np.float64) for _, dec in positions.values()])
+    labels = np.repeat(list(positions.keys()), [len(ra) for ra, _ in positions.values()])
+    return bin_sky(ra, dec, labels, list(positions.keys()), None, n_ra, n_dec)
+
+
+def add_binning_arguments(parser, noun='object'):
+    '''Add the --binned, --ra_bins, --dec_bins and --export options of the sky plotting scripts to parser.'''
+    parser.add_argument('-b', '--binned', action='store_true',
+                        help='Plot the {0}s binned into an equal-area grid of the sky, colored by the most frequent '
+                             'class of each cell, instead of one marker per {0}.'.format(noun))
+    parser.add_argument('--ra_bins', type=int, default=RA_BINS, metavar='',
+                        help='Number of cells of the grid in right ascension (default: {}).'.format(RA_BINS))
+    parser.add_argument('--dec_bins', type=int, default=DEC_BINS, metavar='',
+                        help='Number of cells of the grid in declination (default: {}).'.format(DEC_BINS))
+    parser.add_argument('-e', '--export', type=str, default=None, metavar='',
+                        help='Save the plot to <EXPORT>.png and, with --binned, the cells to <EXPORT>.csv '
+                             '(default: only show the plot).')
+    return parser
+
+
+def save_and_show(fig, binned, args):
+    '''Save the plot and the cells (binned, None unless args.binned) if args.export is set, then show the plot.'''
+    if args.export:
+        fig.savefig(args.export + '.png')
+        if binned is not None:
+            binned.to_csv(args.export + '.csv', index=False)
+    plt.show()
+
+
+def render(ax, fig, positions, args):
+    '''Plot the positions of objects of several classes (see bin_positions) on a sky axes, binned
+       if args.binned and one marker per object otherwise, in the default color cycle, then save
+       and show the plot.'''
+    binned = None
+    if args.binned:
+        # the default color cycle, as used by scatter
+        colors = {cls: 'C{}'.format(index) for index, cls in enumerate(positions)}
+        binned = bin_positions(positions, args.ra_bins, args.dec_bins)
+        plot_binned(ax, binned, colors, args.ra_bins, args.dec_bins)
+    else:
+        for cls, (ra, dec) in positions.items():
+            ax.scatter(ra, dec, label=cls)
+        ax.legend()
+    save_and_show(fig, binned, args)
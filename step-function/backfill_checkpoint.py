@@ -0,0 +1,108 @@
+'''Durable progress of process-existing-bucket-objects.py, so that an interrupted backfill can be resumed.'''
+import os
+import json
+import time
+import threading
+from collections import deque
+
+
+class CheckpointMismatchException(Exception):
+    pass
+
+
+class Checkpoint:
+    '''Progress of a backfill, saved to a JSON state file.
+
+       The bucket is listed as shards, i.e. prefixes listed with or without a "/" delimiter.
+       Each shard records the continuation token of its first page that is not fully published
+       and the last key before which every key is published (the watermark). Pages are listed
+       ahead of publishing, so the checkpoint of a shard only moves past a key once that key
+       and every key listed before it have been published. Keys that could not be published
+       are kept in "failed". When an inventory report is read instead of listing the bucket,
+       each of its data files is a shard, and the token is the number of rows read.'''
+    def __init__(self, path, bucket, prefix, interval=10.0, manifest=None):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.state = {'bucket': bucket, 'prefix': prefix, 'manifest': manifest, 'shards': None,
+                      'published': 0, 'failed': []}
+        # shard index -> pages listed but not yet fully published, in listing order
+        self.pages = {}
+        self.last_save = time.time()
+
+    @classmethod
+    def load(cls, path, bucket, prefix, interval=10.0, manifest=None):
+        checkpoint = cls(path, bucket, prefix, interval, manifest)
+        with open(path) as state_file:
+            state = json.load(state_file)
+        if (state['bucket'], state['prefix'], state.get('manifest')) != (bucket, prefix, manifest):
+            msg = 'State file {} is for s3://{}/{} (manifest: {}), not s3://{}/{} (manifest: {}).'
+            raise CheckpointMismatchException(msg.format(path, state['bucket'], state['prefix'], state.get('manifest'),
+                                                         bucket, prefix, manifest))
+        checkpoint.state = state
+        return checkpoint
+
+    def set_shards(self, shards):
+        '''Record the (prefix, delimiter) of every shard of the bucket.'''
+        with self.lock:
+            self.state['shards'] = [{'prefix': prefix, 'delimiter': delimiter, 'token': None,
+                                     'watermark': None, 'done': False} for prefix, delimiter in shards]
+
+    def set_files(self, files):
+        '''Record the (location, file format, schema) of every data file of an inventory report.'''
+        with self.lock:
+            self.state['shards'] = [{'file': location, 'format': file_format, 'schema': schema, 'token': None,
+                                     'watermark': None, 'done': False} for location, file_format, schema in files]
+
+    def add_page(self, shard_index, next_token, last_key, keys):
+        '''Register a listed page of a shard and the keys of it that are about to be published.
+           Function returns the page, to pass to done() along with each of its keys.'''
+        page = {'shard': shard_index, 'next_token': next_token, 'last_key': last_key,
+                'pending': deque(sorted(keys)), 'done': set()}
+        with self.lock:
+            self.pages.setdefault(shard_index, deque()).append(page)
+            self.advance(shard_index)
+        return page
+
+    def done(self, page, key, failed=False):
+        '''Record that a key was published, or could not be published if failed is set.
+           The page is None for keys that are not part of a listing (e.g. retried failures).'''
+        with self.lock:
+            if failed:
+                self.state['failed'].append(key)
+            else:
+                self.state['published'] += 1
+            if page is not None:
+                page['done'].add(key)
+                self.advance(page['shard'])
+
+    def advance(self, shard_index):
+        '''Move the checkpoint of a shard past the keys published in listing order.'''
+        pages = self.pages[shard_index]
+        shard = self.state['shards'][shard_index]
+        while pages:
+            page = pages[0]
+            while page['pending'] and page['pending'][0] in page['done']:
+                shard['watermark'] = page['pending'].popleft()
+            if page['pending']:
+                break
+            pages.popleft()
+            shard['token'] = page['next_token']
+            if page['last_key'] is not None:
+                shard['watermark'] = max(shard['watermark'] or '', page['last_key'])
+            if page['next_token'] is None:
+                shard['done'] = True
+
+    def save(self):
+        '''Atomically write the state file.'''
+        with self.lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as state_file:
+                json.dump(self.state, state_file)
+            os.replace(temp_path, self.path)
+            self.last_save = time.time()
+
+    def maybe_save(self):
+        '''Write the state file if it was last written more than interval seconds ago.'''
+        if time.time() - self.last_save >= self.interval:
+            self.save()
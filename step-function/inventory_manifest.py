@@ -0,0 +1,116 @@
+'''Streaming reader of S3 Inventory reports used by process-existing-bucket-objects.py.
+
+A location is a local path or an s3://bucket/key URL, of either the manifest.json of an
+inventory report or a single CSV (optionally gzipped) or Parquet data file of one.'''
+import io
+import os
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+from urllib.parse import unquote
+
+
+# rows of an inventory data file read at a time
+ROWS_PER_PAGE = 1000
+# columns of a CSV data file when the schema is not given by a manifest
+DEFAULT_SCHEMA = 'Bucket, Key'
+
+
+class UnsupportedFormatException(Exception):
+    pass
+
+
+def split_s3_url(location):
+    '''Function returns the (bucket, key) of an s3://bucket/key URL, or None for a local path.'''
+    if not location.startswith('s3://'):
+        return None
+    bucket, _, key = location[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def open_location(location, s3_client):
+    '''Open a local file or stream an S3 object. Function returns a binary file object.'''
+    s3_location = split_s3_url(location)
+    if s3_location is None:
+        return open(location, 'rb')
+    return s3_client.get_object(Bucket=s3_location[0], Key=s3_location[1])['Body']
+
+
+def read_manifest(location, s3_client):
+    '''Function returns the (location, file format, schema) of every data file of an inventory
+       report, given its manifest.json or a single data file.'''
+    if not location.endswith('manifest.json'):
+        file_format = 'Parquet' if location.endswith('.parquet') else 'CSV'
+        return [(location, file_format, DEFAULT_SCHEMA)]
+
+    with open_location(location, s3_client) as manifest_file:
+        manifest = json.loads(manifest_file.read())
+    files = []
+    for data_file in manifest['files']:
+        if split_s3_url(location) is None:
+            # a local copy of the report keeps the data files next to the manifest, or in its data/ folder
+            path = os.path.join(os.path.dirname(location), data_file['key'])
+            if not os.path.exists(path):
+                path = os.path.join(os.path.dirname(location), 'data', os.path.basename(data_file['key']))
+        else:
+            path = 's3://{}/{}'.format(manifest['destinationBucket'].split(':::')[-1], data_file['key'])
+        files.append((path, manifest.get('fileFormat', 'CSV'), manifest.get('fileSchema', DEFAULT_SCHEMA)))
+    return files
+
+
+def iter_csv_rows(location, schema, s3_client):
+    columns = [column.strip().lower() for column in schema.split(',')]
+    bucket_column, key_column = columns.index('bucket'), columns.index('key')
+    with open_location(location, s3_client) as data_file:
+        if location.endswith('.gz'):
+            data_file = gzip.GzipFile(fileobj=data_file)
+        for row in csv.reader(io.TextIOWrapper(data_file, encoding='utf-8', newline='')):
+            # keys of CSV inventory reports are URL-encoded
+            yield row[bucket_column], unquote(row[key_column])
+
+
+def iter_parquet_rows(location, s3_client):
+    # pyarrow is only needed for Parquet reports
+    import pyarrow.parquet as pq
+
+    temp_path = None
+    if split_s3_url(location) is not None:
+        # Parquet needs random access, so the data file is spooled to disk instead of memory
+        with open_location(location, s3_client) as body, \
+                tempfile.NamedTemporaryFile(suffix='.parquet', delete=False) as temp_file:
+            shutil.copyfileobj(body, temp_file)
+            temp_path = location = temp_file.name
+    try:
+        parquet_file = pq.ParquetFile(location)
+        for batch in parquet_file.iter_batches(batch_size=ROWS_PER_PAGE, columns=['bucket', 'key']):
+            yield from zip(batch.column(0).to_pylist(), batch.column(1).to_pylist())
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+
+
+def iter_pages(location, file_format, schema, s3_client, start_row=0):
+    '''Stream the (bucket, key) rows of an inventory data file, ROWS_PER_PAGE at a time,
+       skipping the first start_row rows. Function yields, for each page, the number of rows
+       read so far, whether it is the last page, and the rows of the page.'''
+    if file_format == 'CSV':
+        rows = iter_csv_rows(location, schema, s3_client)
+    elif file_format == 'Parquet':
+        rows = iter_parquet_rows(location, s3_client)
+    else:
+        raise UnsupportedFormatException('Inventory format {} is not supported.'.format(file_format))
+
+    row_number = 0
+    page = []
+    for row in rows:
+        row_number += 1
+        if row_number <= start_row:
+            continue
+        if len(page) == ROWS_PER_PAGE:
+            # a full page is only handed out once the next row is read, so that the last page is known
+            yield row_number - 1, False, page
+            page = []
+        page.append(row)
+    yield row_number, True, page
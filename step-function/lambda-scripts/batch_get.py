@@ -0,0 +1,24 @@
+'''BatchGetItem lookups that request the unprocessed keys again.'''
+import time
+
+
+# largest number of keys in one BatchGetItem request
+MAX_BATCH_GET_KEYS = 100
+
+
+def batch_get_items(db_resource, table_name, keys, **kwargs):
+    '''Get the items of keys from a table with BatchGetItem, MAX_BATCH_GET_KEYS at a time,
+       requesting the unprocessed keys again while the table is throttling. kwargs are added
+       to the request of the table, e.g. ProjectionExpression or ConsistentRead.
+       Function yields each item found.'''
+    for start in range(0, len(keys), MAX_BATCH_GET_KEYS):
+        request = {table_name: dict(kwargs, Keys=keys[start: start + MAX_BATCH_GET_KEYS])}
+        delay = 0.05
+        while request:
+            response = db_resource.batch_get_item(RequestItems=request)
+            yield from response['Responses'].get(table_name, [])
+            request = response.get('UnprocessedKeys')
+            if request:
+                # incrementally increase sleeping time while the table is throttling
+                time.sleep(delay)
+                delay *= 2
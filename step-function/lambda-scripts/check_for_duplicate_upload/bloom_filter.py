@@ -0,0 +1,55 @@
+import json
+import math
+import hashlib
+
+
+class BloomFilter:
+    '''Probabilistic set membership with no false negatives: "not seen" answers are
+       definite, "maybe seen" answers are wrong with a probability of about error_rate
+       as long as no more than capacity items have been added.'''
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        # optimal number of bits and of hash functions for the capacity and error rate
+        self.num_bits = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        '''Bit positions of an item, derived from two 64 bit hashes (double hashing).'''
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.num_bits for index in range(self.num_hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+    def is_full(self):
+        '''Whether more items than the capacity were added, i.e. the error rate is no longer met.'''
+        return self.count > self.capacity
+
+    def expected_error_rate(self):
+        '''Probability of a "maybe seen" answer for an item that was never added.'''
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def dumps(self):
+        '''Function returns the filter as bytes: a JSON header line followed by the bits.'''
+        header = {'capacity': self.capacity, 'error_rate': self.error_rate, 'count': self.count}
+        return json.dumps(header).encode() + b'\n' + bytes(self.bits)
+
+    @classmethod
+    def loads(cls, data):
+        '''Function returns the filter saved by dumps.'''
+        header, _, bits = data.partition(b'\n')
+        header = json.loads(header)
+        bloom_filter = cls(header['capacity'], header['error_rate'])
+        bloom_filter.bits = bytearray(bits)
+        bloom_filter.count = header['count']
+        return bloom_filter
@@ -1,22 +1,216 @@
 import os
+import time
 import boto3
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from bloom_filter import BloomFilter
+from date_index import get_date_partitions, query_partitions
+from batch_get import batch_get_items
 
 
+# The conditional claim in DynamoDB is what decides whether an image is a duplicate. The Bloom
+# filter is only a hint that saves the lookup of images it has definitely not seen, and it is
+# refreshed every FILTER_REFRESH_INTERVAL seconds, so its "not seen" answer can be that stale:
+# an image logged by another container in the meantime is claimed, the claim fails because the
+# image is in the table, and the image is still reported as a duplicate.
+
+# largest number of claims written at the same time for a batch of images
+MAX_CLAIM_WORKERS = 10
+# overlap between two incremental refreshes, covering index propagation delay and clock skew (in seconds)
+REFRESH_OVERLAP = 30
+
 table_id = os.environ.get('UPLOAD_HISTORY_TABLE')
+# global secondary index of the upload history table with "DATE ADDED TO TABLE" as partition key and
+# "TIMESTAMP ADDED TO TABLE" as sort key; without it the filter is not used and every image is looked up
+date_index_name = os.environ.get('UPLOAD_HISTORY_DATE_INDEX')
+# number of shards of each date in the index, as set for log_to_dynamodb; if set, the index has
+# "DATE SHARD" as partition key instead, so that one day's writes are spread over that many partitions
+date_shards = int(os.environ.get('UPLOAD_HISTORY_DATE_SHARDS', '0'))
+# time between two incremental refreshes of the filter (in seconds)
+refresh_interval = float(os.environ.get('FILTER_REFRESH_INTERVAL', '60'))
+# number of image ids the filter is sized for, at the least
+expected_images = int(os.environ.get('EXPECTED_IMAGES', '1000000'))
+filter_error_rate = float(os.environ.get('FILTER_ERROR_RATE', '0.01'))
+# S3 location of a snapshot of the filter, which cold containers load and refresh from the index
+# instead of scanning the whole table; without a bucket every cold container scans the table
+snapshot_bucket = os.environ.get('FILTER_SNAPSHOT_BUCKET')
+snapshot_key = os.environ.get('FILTER_SNAPSHOT_KEY', 'check_for_duplicate_upload/filter.bin')
+# age of the snapshot after which a container writes a new one (in seconds)
+snapshot_interval = float(os.environ.get('FILTER_SNAPSHOT_INTERVAL', '3600'))
+# time after which the claim of an execution that neither logged nor released it expires (in seconds)
+claim_duration = int(os.environ.get('CLAIM_DURATION', '3600'))
 db_resource = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
 upload_history_table = db_resource.Table(table_id)
 
+# filter of the image ids in the upload history table, kept for the life of the container
+image_filter = None
+# time up to which the upload history has been added to the filter
+watermark = None
+last_refresh = 0.0
+# watermark of the latest snapshot loaded or saved by the container
+snapshot_watermark = None
+
+
+def load_filter():
+    '''Build the filter from a full scan of the upload history table.'''
+    global image_filter, watermark
+    start = time.time()
+    # leave room for the table to grow before the filter has to be rebuilt
+    new_filter = BloomFilter(max(expected_images, 2 * upload_history_table.item_count), filter_error_rate)
+    kwargs = {'ProjectionExpression': '#img_id',
+              'ExpressionAttributeNames': {'#img_id': 'IMAGE ID'}}
+    while True:
+        response = upload_history_table.scan(**kwargs)
+        for item in response['Items']:
+            new_filter.add(item['IMAGE ID'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    image_filter = new_filter
+    watermark = start
+
+
+def refresh_filter():
+    '''Add the image ids logged since the last refresh to the filter.'''
+    global watermark
+    start = time.time()
+    since = watermark - REFRESH_OVERLAP
+    partition_key = 'DATE SHARD' if date_shards else 'DATE ADDED TO TABLE'
+
+    def get_kwargs(partition):
+        return {'IndexName': date_index_name,
+                'KeyConditionExpression': Key(partition_key).eq(partition) &
+                                          Key('TIMESTAMP ADDED TO TABLE').gte(int(since)),
+                'ProjectionExpression': '#img_id',
+                'ExpressionAttributeNames': {'#img_id': 'IMAGE ID'}}
+
+    for response in query_partitions(upload_history_table.query, get_kwargs,
+                                     get_date_partitions(since, start, date_shards)):
+        for item in response['Items']:
+            image_filter.add(item['IMAGE ID'])
+    watermark = start
+
+
+def load_snapshot():
+    '''Load the snapshot of the filter saved by a container. A snapshot that is missing or cannot
+       be read is ignored. Function returns whether a snapshot was loaded.'''
+    global image_filter, watermark, snapshot_watermark
+    if not snapshot_bucket:
+        return False
+    try:
+        response = s3_client.get_object(Bucket=snapshot_bucket, Key=snapshot_key)
+        snapshot = BloomFilter.loads(response['Body'].read())
+        snapshot_time = float(response['Metadata']['watermark'])
+    except (ClientError, ValueError, KeyError) as error:
+        print('Filter snapshot not loaded: {}'.format(error))
+        return False
+    image_filter = snapshot
+    watermark = snapshot_watermark = snapshot_time
+    return True
+
+
+def save_snapshot():
+    '''Save the filter to S3 if the latest snapshot is older than FILTER_SNAPSHOT_INTERVAL seconds.'''
+    global snapshot_watermark
+    if not snapshot_bucket or (snapshot_watermark is not None and watermark - snapshot_watermark < snapshot_interval):
+        return
+    try:
+        s3_client.put_object(Bucket=snapshot_bucket, Key=snapshot_key, Body=image_filter.dumps(),
+                             Metadata={'watermark': repr(watermark)})
+        snapshot_watermark = watermark
+    except ClientError as error:
+        print('Filter snapshot not saved: {}'.format(error))
+
+
+def update_filter():
+    '''Load the filter on first use (from the snapshot if there is one) and refresh it every
+       FILTER_REFRESH_INTERVAL seconds.'''
+    global last_refresh
+    if not date_index_name:
+        return
+    now = time.time()
+    if image_filter is None and load_snapshot():
+        refresh_filter()
+    elif image_filter is None or image_filter.is_full():
+        load_filter()
+    elif now - last_refresh >= refresh_interval:
+        refresh_filter()
+    else:
+        return
+    last_refresh = now
+    save_snapshot()
+
+
+def get_uploaded(image_ids):
+    '''Consistently look up image ids in the upload history table with BatchGetItem.
+       Function returns the set of image ids that have been classified and logged;
+       images that are only claimed are left out.'''
+    items = batch_get_items(db_resource, table_id, [{'IMAGE ID': image_id} for image_id in image_ids],
+                            ProjectionExpression='#img_id, #expires',
+                            ExpressionAttributeNames={'#img_id': 'IMAGE ID', '#expires': 'CLAIM EXPIRES'},
+                            ConsistentRead=True)
+    return {item['IMAGE ID'] for item in items if 'CLAIM EXPIRES' not in item}
+
+
+def claim(image_id, token):
+    '''Atomically claim an image for the execution holding token. The claim fails if the image
+       has been logged by log_to_dynamodb, or is claimed by another execution and the claim has
+       not expired. Function returns whether the image was claimed.'''
+    now = int(time.time())
+    try:
+        # claims are written from several threads, so through the client, which unlike the
+        # table resource is thread-safe
+        db_resource.meta.client.put_item(
+            TableName=table_id,
+            Item={'IMAGE ID': image_id, 'CLAIM TOKEN': token, 'CLAIM EXPIRES': now + claim_duration},
+            ConditionExpression='attribute_not_exists(#img_id) OR #expires < :now',
+            ExpressionAttributeNames={'#img_id': 'IMAGE ID', '#expires': 'CLAIM EXPIRES'},
+            ExpressionAttributeValues={':now': now}
+        )
+        return True
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def get_duplicates(image_ids, token):
+    '''Claim the images that have not been previously uploaded.
+       Function returns, for each image id, whether the image is a duplicate, i.e. it has been
+       previously uploaded, another execution is classifying it, or it appears earlier in image_ids.'''
+    # ids the filter has definitely not seen are claimed without being looked up first
+    maybe_seen = [image_id for image_id in set(image_ids)
+                  if image_filter is None or image_id in image_filter]
+    uploaded = get_uploaded(maybe_seen)
+    to_claim = [image_id for image_id in set(image_ids) if image_id not in uploaded]
+    claimed = set()
+    if to_claim:
+        with ThreadPoolExecutor(max_workers=min(len(to_claim), MAX_CLAIM_WORKERS)) as executor:
+            results = executor.map(lambda image_id: claim(image_id, token), to_claim)
+            claimed = {image_id for image_id, is_claimed in zip(to_claim, results) if is_claimed}
+
+    duplicates = []
+    for image_id in image_ids:
+        duplicates.append(image_id not in claimed)
+        # only the first occurrence of an image in a batch is classified
+        claimed.discard(image_id)
+    return duplicates
+
 
 def lambda_handler(event, context, call=None, callback=None):
-    # to avoid duplicate uploads, check to see if image has been previously uploaded
-    query = upload_history_table.query(
-       ProjectionExpression="#img_id",
-       ExpressionAttributeNames={ "#img_id": "IMAGE ID" },
-       KeyConditionExpression="#img_id = :id",
-       ExpressionAttributeValues={":id": event['image_id']}
-    )
-
-    is_duplicate = True if len(query['Items']) else False
-    event['is_duplicate'] = is_duplicate
+    # to avoid duplicate uploads, claim the image unless it has been previously uploaded
+    # or is being classified by another execution; a list of image events is checked as one batch
+    update_filter()
+    events = event if isinstance(event, list) else [event]
+    # the token identifies the claims of this invocation, so that log_error can release them
+    token = str(uuid4())
+    duplicates = get_duplicates([image_event['image_id'] for image_event in events], token)
+    for image_event, is_duplicate in zip(events, duplicates):
+        image_event['is_duplicate'] = is_duplicate
+        if not is_duplicate:
+            image_event['claim_token'] = token
 
     return event
@@ -2,38 +2,22 @@ import os
 import json
 import time
 import boto3
-import numpy as np
-from astropy.io import fits
-from PIL import Image
-from PIL import FitsStubImagePlugin
+from functools import lru_cache
+from fits_preprocessing import open_s3_fits_sci, fits_to_image, encode_jpeg
+from prediction_cache import PredictionCache, hash_image
+from classification_results import get_classification_item
 from google.cloud import automl_v1beta1 as automl
+from google.cloud.automl_v1beta1.gapic.transports.prediction_service_grpc_transport import PredictionServiceGrpcTransport
 
 
 # AutoML is currently not recognizing other regions. This is the default compute region
 COMPUTE_REGION = 'us-central1'
 # file size of image to be passed to AutoML must be less than 31.45828 MB
 MAX_FILE_SIZE_FOR_AUTOML = 31458280 # in bytes
-# keys whose values are to be extracted from the header of the primary HDU of a FITS file
-hdu_keys = ['FILENAME',
-            'FILETYPE',
-            'TELESCOP',
-            'INSTRUME',
-            'TARGNAME',
-            'RA_TARG',
-            'DEC_TARG',
-            'PROPOSID',
-            'PR_INV_L',
-            'PR_INV_F',
-            'GYROMODE',
-            'DATE-OBS',
-            'TIME-OBS',
-            'EXPTIME',
-            'EXPFLAG',
-            'OBSTYPE',
-            'OBSMODE',
-            'DETECTOR',
-            'FILTER',
-            'APERTURE']
+# keep the gRPC channel of the prediction client alive between warm invocations
+CHANNEL_OPTIONS = [('grpc.keepalive_time_ms', 30000),
+                   ('grpc.keepalive_timeout_ms', 10000),
+                   ('grpc.keepalive_permit_without_calls', 1)]
 
 # environment variables
 # --------------------------- AUTOML ---------------------------
@@ -43,19 +27,53 @@ model_id = os.environ.get('AUTOML_MODEL_ID')
 score_threshold = '0.0' # value from 0.0 to 1.0; default is 0.5
 # --------------------------- AWS ---------------------------
 destination_bucket_name = os.environ.get('DESTINATION_BUCKET')
+# side length to downsample images to before classification; the archived JPEG keeps full resolution;
+# 0 sends the full resolution
+image_size = int(os.environ.get('IMAGE_SIZE', '0'))
+# DynamoDB table caching classifications by image content; caching is off if not set
+prediction_cache_table_id = os.environ.get('PREDICTION_CACHE_TABLE')
+# version of the model; cached classifications made by other versions are ignored
+model_version = os.environ.get('MODEL_VERSION', model_id)
+# time after which a cached classification expires (in seconds)
+prediction_cache_ttl = int(os.environ.get('PREDICTION_CACHE_TTL', '2592000'))
+# write images straight to the folder of their predicted class, making "Copy and Delete Image" unnecessary
+upload_to_class_folder = os.environ.get('UPLOAD_TO_CLASS_FOLDER', 'false').lower() == 'true'
 
 # acquire AWS service access
 s3_client = boto3.client('s3')
+prediction_cache = None
+if prediction_cache_table_id:
+    prediction_cache = PredictionCache(boto3.resource('dynamodb').Table(prediction_cache_table_id),
+                                       model_version, prediction_cache_ttl)
 
 class FileSizeException(Exception):
     pass
 
+
+@lru_cache(maxsize=None)
+def get_automl_client():
+    '''Create the AutoML client on first use and reuse it across warm invocations.'''
+    return automl.AutoMlClient()
+
+
+@lru_cache(maxsize=None)
+def get_prediction_client():
+    '''Create the prediction client (and its gRPC channel) on first use and reuse it
+       across warm invocations.'''
+    channel = PredictionServiceGrpcTransport.create_channel(options=CHANNEL_OPTIONS)
+    return automl.PredictionServiceClient(channel=channel)
+
+
+@lru_cache(maxsize=None)
+def get_model_full_id(project_id, model_id):
+    return get_automl_client().model_path(project_id, COMPUTE_REGION, model_id)
+
+
 def get_prediction(content, project_id, model_id):
     '''Pass an image to automl model for classification.
        Function returns an automl_v1beta1.types.PredictResponse object.'''
-    automl_client = automl.AutoMlClient()
-    model_full_id = automl_client.model_path(project_id, COMPUTE_REGION, model_id)
-    prediction_client = automl.PredictionServiceClient()
+    model_full_id = get_model_full_id(project_id, model_id)
+    prediction_client = get_prediction_client()
     payload = {'image': {'image_bytes': content}}
     params = {'score_threshold': score_threshold}
     response = prediction_client.predict(model_full_id, payload, params)
@@ -63,80 +81,43 @@ def get_prediction(content, project_id, model_id):
     return response
 
 
+def get_classification(content):
+    '''Send a JPEG image off to AutoML for classification.
+       Function returns the probability of each class and the predicted class.'''
+    response = get_prediction(content, project_id, model_id)
+    return get_classification_item((payload.display_name, payload.classification.score)
+                                   for payload in response.payload)
+
+
 def lambda_handler(event, context, call=None, callback=None):
     bucket = event['s3']['bucket']
     key = event['s3']['key']
-    download_path = '/tmp/{}.fits'.format(event['image_id'])
-    
-    # download image and send off to AutoML for classification
-    s3_client.download_file(bucket, key, download_path, ExtraArgs={'RequestPayer': 'requester'})
-    
-    with fits.open(download_path) as downloaded_file:
-        primary_hdu = downloaded_file[0]
-        header_keys = list(primary_hdu.header.keys())
-        metadata = {key: primary_hdu.header[key] for key in hdu_keys if key in header_keys}
-        # if present, the first and fourth indexes of the FITS file are two pieces of one single image
-        if len(downloaded_file) > 4 and downloaded_file[4].header['EXTNAME'] == 'SCI':
-            # two portions of one single image
-            data_1_of_2 = downloaded_file[1].data
-            data_2_of_2 = downloaded_file[4].data
-            height = data_1_of_2.shape[0] + data_2_of_2.shape[0]
-            width = data_1_of_2.shape[1]
-            # merge the two image Header Data Units (HDU) into one image
-            temp = np.zeros((height, width))
-            temp[0: int(height/2), :] = data_1_of_2
-            temp[int(height/2): height, :] = data_2_of_2
-            data = temp
-        else:
-            # get one of the image Header Data Units (HDU) from each FITS file
-            data = downloaded_file[1].data
     
-    # clean up temp download
-    os.remove(download_path)
+    # fetch only the headers and SCI data of the image and send off to AutoML for classification
+    with open_s3_fits_sci(s3_client, bucket, key) as downloaded_file:
+        metadata, image, model_image = fits_to_image(downloaded_file, image_size)
     
-    # trim the extreme values
-    top = np.percentile(data, 99)
-    data[data > top] = top
-    bottom = np.percentile(data, 1)
-    data[data < bottom] = bottom
-    
-    # scale the data
-    data = data - data.min()
-    data = (data / data.max()) * 255.0
-    data = np.flipud(data)
-    data = np.uint8(data)
-    
-    image = Image.fromarray(data)
-    download_path = download_path.replace('.fits','.jpg')
-    image.save(download_path)
-    file_size = os.path.getsize(download_path)
+    content = encode_jpeg(model_image)
+    file_size = len(content)
     msg = 'File size of image: {:.2f} MB\n'.format(file_size * 1e-6)
     msg += 'Size of an image to be classified by AutoML must be less than 31.45828 MB'
     if file_size >= MAX_FILE_SIZE_FOR_AUTOML:
-        # clean up temp download
-        os.remove(download_path)
         raise FileSizeException(msg)
-    s3_client.upload_file(download_path, destination_bucket_name, event['image_id'])
-
-    with open(download_path, 'rb') as downloaded_image:
-        content = downloaded_image.read()
-    # clean up temp download
-    os.remove(download_path)
-    response = get_prediction(content, project_id, model_id)
 
-    item = {'probabilities': {}}
-    # determine the predicted class based on the highest probability returned
-    predicted_class = {'class': '', 'probability': 0.0}
-    for payload in response.payload:
-        item['probabilities'][payload.display_name] = str(round(payload.classification.score, 8))
-        if payload.classification.score > predicted_class['probability']:
-            predicted_class['class'] = payload.display_name
-            predicted_class['probability'] = payload.classification.score
-        # if two or more classes have the same high probability, then create a concatenated string of the classes
-        elif payload.classification.score == predicted_class['probability']:
-            predicted_class['class'] = predicted_class['class'] + ', ' + payload.display_name
-    item['predicted_class'] = predicted_class['class']
+    if prediction_cache is None:
+        item = get_classification(content)
+    else:
+        # skip AutoML if the same pixels were classified before
+        item = prediction_cache.get_or_classify(hash_image(model_image), get_classification, content)
+    # upload once classified, straight to the folder of the predicted class if configured;
+    # otherwise as a temp object that copy_and_delete_image moves there
+    key = event['image_id']
+    if upload_to_class_folder:
+        key = item['predicted_class'] + '/' + key
+    archive_content = content if model_image is image else encode_jpeg(image)
+    s3_client.put_object(Bucket=destination_bucket_name, Key=key, Body=archive_content)
     event['metadata'] = metadata
     event['classification'] = item
+    event['uploaded_to_class_folder'] = upload_to_class_folder
     
     return event
@@ -0,0 +1,37 @@
+'''Classification results and per-image error handling shared by the classify_image lambdas.'''
+import json
+
+
+def get_classification_item(scores):
+    '''Function returns the probability of each class and the predicted class, given the
+       (class, probability) pairs returned by a model.'''
+    item = {'probabilities': {}}
+    # determine the predicted class based on the highest probability returned
+    predicted_class = {'class': '', 'probability': 0.0}
+    for cls, probability in scores:
+        item['probabilities'][cls] = str(round(probability, 8))
+        if probability > predicted_class['probability']:
+            predicted_class['class'] = cls
+            predicted_class['probability'] = probability
+        # if two or more classes have the same high probability, then create a concatenated string of the classes
+        elif probability == predicted_class['probability']:
+            predicted_class['class'] = predicted_class['class'] + ', ' + cls
+    item['predicted_class'] = predicted_class['class']
+    return item
+
+
+def get_error_info(error):
+    '''Describe an exception the same way a Step Functions Catch does, so that the
+       "Log Error" task can record a failed image of a batch.'''
+    cause = {'errorType': type(error).__name__, 'errorMessage': str(error)}
+    return {'Error': cause['errorType'], 'Cause': json.dumps(cause)}
+
+
+def isolate_errors(function):
+    '''Wrap function so that it returns a (result, exception) tuple instead of raising.'''
+    def wrapper(*args):
+        try:
+            return function(*args), None
+        except Exception as error:
+            return None, error
+    return wrapper
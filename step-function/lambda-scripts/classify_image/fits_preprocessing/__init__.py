@@ -0,0 +1,5 @@
+'''FITS-to-image preprocessing shared by the classify_image lambdas.'''
+from .image import (HDU_KEYS, extract_metadata, merge_chips, read_fits,
+                    block_reduce, normalize, to_uint8, fits_to_image, encode_jpeg,
+                    to_model_input)
+from .fetch import open_s3_fits, open_s3_fits_sci
@@ -0,0 +1,125 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from astropy.io import fits
+
+
+# FITS files are made up of 2880 byte blocks of 80 character header cards and data
+BLOCK_SIZE = 2880
+CARD_SIZE = 80
+# bytes requested per header read; large enough for the primary header of most HST files
+HEADER_CHUNK_SIZE = BLOCK_SIZE * 12
+# indexes of the HDUs whose data is needed to build the image (see read_fits)
+SCI_INDEXES = [1, 4]
+# data types of the values in a data unit for each BITPIX value
+BITPIX_DTYPES = {8: 'u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}
+
+
+def open_s3_fits(s3_client, bucket, key):
+    '''Stream a FITS file from a requester-pays bucket into memory and open it.
+       Function returns an astropy.io.fits.HDUList backed by an in-memory buffer.'''
+    response = s3_client.get_object(Bucket=bucket, Key=key, RequestPayer='requester')
+    buffer = io.BytesIO(response['Body'].read())
+    return fits.open(buffer)
+
+
+def get_range(s3_client, bucket, key, start, stop):
+    '''Read bytes [start, stop) of an object in a requester-pays bucket.
+       Function returns a (content, object size) tuple.'''
+    response = s3_client.get_object(Bucket=bucket, Key=key, RequestPayer='requester',
+                                    Range='bytes={}-{}'.format(start, stop - 1))
+    # e.g. "bytes 0-34559/16857600"
+    object_size = int(response['ContentRange'].split('/')[-1])
+    return response['Body'].read(), object_size
+
+
+def padded(size):
+    '''Round a number of bytes up to a whole number of FITS blocks.'''
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def data_size(header):
+    '''Number of bytes (including padding) taken up by the data unit that follows a header.'''
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+    size = 1
+    for axis in range(1, naxis + 1):
+        size *= header['NAXIS{}'.format(axis)]
+    size = header.get('GCOUNT', 1) * (header.get('PCOUNT', 0) + size)
+    return padded(abs(header['BITPIX']) // 8 * size)
+
+
+def read_header(s3_client, bucket, key, offset, object_size=None):
+    '''Read the header starting at offset using byte-range requests.
+       Function returns a (header, header size in bytes, object size) tuple.'''
+    content = b''
+    while True:
+        start = offset + len(content)
+        stop = start + HEADER_CHUNK_SIZE
+        if object_size is not None:
+            stop = min(stop, object_size)
+        if stop <= start:
+            raise OSError('Header at byte {} of "{}" has no END card.'.format(offset, key))
+        chunk, object_size = get_range(s3_client, bucket, key, start, stop)
+        content += chunk
+        for index in range(0, len(content) - CARD_SIZE + 1, CARD_SIZE):
+            if content[index: index + CARD_SIZE].rstrip() == b'END':
+                header_size = padded(index + CARD_SIZE)
+                header = fits.Header.fromstring(content[: index + CARD_SIZE].decode('ascii'))
+                return header, header_size, object_size
+
+
+def read_data(s3_client, bucket, key, header, offset):
+    '''Read the data unit of an image HDU using a byte-range request.'''
+    shape = tuple(header['NAXIS{}'.format(axis)] for axis in range(header['NAXIS'], 0, -1))
+    dtype = np.dtype(BITPIX_DTYPES[header['BITPIX']])
+    content, _ = get_range(s3_client, bucket, key, offset, offset + dtype.itemsize * int(np.prod(shape)))
+    data = np.frombuffer(content, dtype=dtype).reshape(shape)
+    bscale = header.get('BSCALE', 1)
+    bzero = header.get('BZERO', 0)
+    if bscale != 1 or bzero != 0:
+        data = data * np.float32(bscale) + np.float32(bzero)
+    return data
+
+
+def open_s3_fits_sci(s3_client, bucket, key):
+    '''Fetch only the headers and the SCI data needed for classification using byte-range requests.
+       The ERR and DQ data units are skipped; their HDUs are kept header-only so that
+       extension indexes match the file. Files whose SCI extensions are not plain images
+       (e.g. tile-compressed) are streamed whole with open_s3_fits.
+       Function returns an astropy.io.fits.HDUList.'''
+    headers = []
+    offsets = []
+    offset = 0
+    object_size = None
+    # walk the headers up to the last HDU that may hold SCI data, computing the offset of each one
+    while len(headers) <= max(SCI_INDEXES) and (object_size is None or offset < object_size):
+        header, header_size, object_size = read_header(s3_client, bucket, key, offset, object_size)
+        headers.append(header)
+        offsets.append(offset + header_size)
+        offset += header_size + data_size(header)
+
+    # the first extension always holds the image; the fourth only when it is a second SCI chip
+    sci_indexes = [index for index in SCI_INDEXES if index < len(headers)]
+    sci_indexes = [index for index in sci_indexes
+                   if index == SCI_INDEXES[0] or headers[index].get('EXTNAME') == 'SCI']
+    if not sci_indexes or any(headers[index].get('XTENSION') != 'IMAGE' for index in sci_indexes):
+        return open_s3_fits(s3_client, bucket, key)
+
+    # the SCI data units are independent of each other, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=len(sci_indexes)) as executor:
+        futures = {index: executor.submit(read_data, s3_client, bucket, key,
+                                          headers[index], offsets[index])
+                   for index in sci_indexes}
+    hdus = [fits.PrimaryHDU(header=headers[0])]
+    for index, header in enumerate(headers[1:], start=1):
+        if index in futures:
+            header = header.copy()
+            # scaling was already applied by read_data
+            for scaling_key in ['BSCALE', 'BZERO']:
+                header.remove(scaling_key, ignore_missing=True)
+            hdus.append(fits.ImageHDU(data=futures[index].result(), header=header))
+        else:
+            hdus.append(fits.ImageHDU(header=header))
+    return fits.HDUList(hdus)
@@ -0,0 +1,122 @@
+import io
+import numpy as np
+from PIL import Image
+
+
+# keys whose values are to be extracted from the header of the primary HDU of a FITS file
+HDU_KEYS = ['FILENAME',
+            'FILETYPE',
+            'TELESCOP',
+            'INSTRUME',
+            'TARGNAME',
+            'RA_TARG',
+            'DEC_TARG',
+            'PROPOSID',
+            'PR_INV_L',
+            'PR_INV_F',
+            'GYROMODE',
+            'DATE-OBS',
+            'TIME-OBS',
+            'EXPTIME',
+            'EXPFLAG',
+            'OBSTYPE',
+            'OBSMODE',
+            'DETECTOR',
+            'FILTER',
+            'APERTURE']
+# percentiles used to trim the extreme values of an image
+LOWER_PERCENTILE = 1
+UPPER_PERCENTILE = 99
+
+
+def extract_metadata(header):
+    '''Return the values of HDU_KEYS found in the header of the primary HDU.'''
+    return {key: header[key] for key in HDU_KEYS if key in header}
+
+
+def merge_chips(data_1_of_2, data_2_of_2):
+    '''Stack the two portions of one single image into a single float32 array.'''
+    height = data_1_of_2.shape[0] + data_2_of_2.shape[0]
+    width = data_1_of_2.shape[1]
+    data = np.empty((height, width), dtype=np.float32)
+    data[0: data_1_of_2.shape[0], :] = data_1_of_2
+    data[data_1_of_2.shape[0]: height, :] = data_2_of_2
+    return data
+
+
+def read_fits(hdul):
+    '''Extract the metadata and the science image from an opened FITS file.
+       Function returns a (metadata, data) tuple where data is a float32 array.'''
+    metadata = extract_metadata(hdul[0].header)
+    # if present, the first and fourth indexes of the FITS file are two pieces of one single image
+    if len(hdul) > 4 and hdul[4].header['EXTNAME'] == 'SCI':
+        data = merge_chips(hdul[1].data, hdul[4].data)
+    else:
+        # get one of the image Header Data Units (HDU) from each FITS file;
+        # FITS data is big-endian, so this copy also converts it to native float32
+        data = np.array(hdul[1].data, dtype=np.float32)
+    return metadata, data
+
+
+def block_reduce(data, size):
+    '''Area-resample an image by averaging square blocks of pixels so that its shorter side
+       is as close as possible to (but not less than) size. The aspect ratio is kept and
+       rows/columns that do not fill a whole block are dropped.'''
+    factor = min(data.shape) // size
+    if factor <= 1:
+        return data
+    height = data.shape[0] // factor
+    width = data.shape[1] // factor
+    blocks = data[: height * factor, : width * factor].reshape(height, factor, width, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def normalize(data):
+    '''Trim the extreme values of the image and scale it to the range 0-255.
+       The float32 array passed in is modified in place and returned.'''
+    # both percentiles are taken from a single partition of the data
+    bottom, top = np.percentile(data, [LOWER_PERCENTILE, UPPER_PERCENTILE])
+    np.clip(data, bottom, top, out=data)
+    # after clipping, the minimum is the bottom percentile and the maximum the top percentile
+    data -= bottom
+    if top > bottom:
+        data *= np.float32(255.0 / (top - bottom))
+    return data
+
+
+def to_uint8(data):
+    '''Convert a normalized image to the orientation and type expected by the model.'''
+    return np.flipud(data).astype(np.uint8)
+
+
+def fits_to_image(hdul, size=None):
+    '''Convert an opened FITS file into grayscale images ready to be encoded: the image at
+       full resolution, which is archived, and the image passed to the model. If size is given,
+       the model image is downsampled to roughly size x size pixels (the input size of the
+       model); otherwise it is the full resolution image.
+       Function returns a (metadata, PIL.Image.Image, PIL.Image.Image) tuple.'''
+    metadata, data = read_fits(hdul)
+    data = normalize(data)
+    image = Image.fromarray(to_uint8(data))
+    if not size:
+        return metadata, image, image
+    reduced = block_reduce(data, size)
+    if reduced is data:
+        # already no larger than the model input
+        return metadata, image, image
+    return metadata, image, Image.fromarray(to_uint8(reduced))
+
+
+def encode_jpeg(image):
+    '''Encode an image as JPEG in memory. Function returns the encoded bytes.'''
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def to_model_input(image, size):
+    '''Resize a grayscale image to size x size and repeat it over three channels.
+       Function returns a float32 array of shape (3, size, size), the layout of the
+       image_shape the model was trained with.'''
+    data = np.asarray(image.resize((size, size), Image.BILINEAR), dtype=np.float32)
+    return np.repeat(data[np.newaxis, :, :], 3, axis=0)
@@ -0,0 +1,167 @@
+import os
+import boto3
+import numpy as np
+import onnxruntime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from fits_preprocessing import open_s3_fits_sci, fits_to_image, encode_jpeg, to_model_input
+from prediction_cache import PredictionCache, hash_image
+from classification_results import get_classification_item, get_error_info, isolate_errors
+
+# side length of the images the model was trained on (image_shape='3,256,256'), used when
+# neither IMAGE_SIZE nor the input shape of the model gives it
+DEFAULT_MODEL_INPUT_SIZE = 256
+
+# environment variables
+# path of the ONNX export of the trained model (e.g. in a Lambda layer or on EFS);
+# if not set, the model is downloaded once per container from MODEL_BUCKET/MODEL_KEY
+model_path = os.environ.get('MODEL_PATH')
+model_bucket = os.environ.get('MODEL_BUCKET')
+model_key = os.environ.get('MODEL_KEY')
+destination_bucket_name = os.environ.get('DESTINATION_BUCKET')
+# side length of the model input, as for the SageMaker backend; by default the one of the
+# input shape of the model
+image_size = int(os.environ.get('IMAGE_SIZE', '0'))
+# number of images of a batch preprocessed at the same time
+preprocess_workers = int(os.environ.get('PREPROCESS_WORKERS', '4'))
+# largest number of images passed to the model in one run
+batch_size = int(os.environ.get('BATCH_SIZE', '8'))
+classes = [cls.strip() for cls in os.environ.get('CLASSES').split(',')]
+# DynamoDB table caching classifications by image content; caching is off if not set
+prediction_cache_table_id = os.environ.get('PREDICTION_CACHE_TABLE')
+# version of the model; cached classifications made by other versions are ignored
+model_version = os.environ.get('MODEL_VERSION', model_path or model_key)
+# time after which a cached classification expires (in seconds)
+prediction_cache_ttl = int(os.environ.get('PREDICTION_CACHE_TTL', '2592000'))
+# write images straight to the folder of their predicted class, making "Copy and Delete Image" unnecessary
+upload_to_class_folder = os.environ.get('UPLOAD_TO_CLASS_FOLDER', 'false').lower() == 'true'
+
+# acquire AWS service access
+s3_client = boto3.client('s3')
+prediction_cache = None
+if prediction_cache_table_id:
+    prediction_cache = PredictionCache(boto3.resource('dynamodb').Table(prediction_cache_table_id),
+                                       model_version, prediction_cache_ttl)
+
+
+@lru_cache(maxsize=None)
+def get_session():
+    '''Load the model once per container and reuse it across warm invocations.'''
+    path = model_path
+    if not path:
+        path = '/tmp/{}'.format(os.path.basename(model_key))
+        s3_client.download_file(model_bucket, model_key, path)
+    return onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+
+
+@lru_cache(maxsize=None)
+def get_model_input_size():
+    '''Function returns the side length of the model input: IMAGE_SIZE if set, otherwise the
+       last dimension of the input shape of the model (batch, channels, height, width).'''
+    if image_size:
+        return image_size
+    size = get_session().get_inputs()[0].shape[-1]
+    # dimensions left dynamic when the model was exported are names instead of numbers
+    return size if isinstance(size, int) else DEFAULT_MODEL_INPUT_SIZE
+
+
+def preprocess_image(event):
+    '''Fetch an image, convert it to JPEG at full resolution, and prepare the model input.
+       Function returns a (metadata, model input, hash of the model image pixels, JPEG bytes) tuple.'''
+    bucket = event['s3']['bucket']
+    key = event['s3']['key']
+
+    # fetch only the headers and SCI data of the image
+    with open_s3_fits_sci(s3_client, bucket, key) as downloaded_file:
+        metadata, image, model_image = fits_to_image(downloaded_file, get_model_input_size())
+
+    # the JPEG is only needed by the rest of the pipeline; the model uses the array directly
+    model_input = to_model_input(model_image, get_model_input_size())
+    return metadata, model_input, hash_image(model_image), encode_jpeg(image)
+
+
+def get_classifications(model_inputs):
+    '''Run the model on a list of preprocessed images in batches of BATCH_SIZE.
+       Function returns the probability of each class and the predicted class of each image.'''
+    session = get_session()
+    input_name = session.get_inputs()[0].name
+    results = []
+    for start in range(0, len(model_inputs), batch_size):
+        batch = np.stack(model_inputs[start: start + batch_size])
+        results.extend(session.run(None, {input_name: batch})[0].tolist())
+
+    return [get_classification_item(zip(classes, result)) for result in results]
+
+
+def classify(model_inputs, data_hashes):
+    '''Classify preprocessed images, only running the model on the images whose pixels
+       were not classified before.'''
+    if prediction_cache is None:
+        return get_classifications(model_inputs)
+    items = [prediction_cache.get(data_hash) for data_hash in data_hashes]
+    misses = [index for index, item in enumerate(items) if item is None]
+    for index, item in zip(misses, get_classifications([model_inputs[index] for index in misses])):
+        prediction_cache.put(data_hashes[index], item)
+        items[index] = item
+    return items
+
+
+def upload_image(event, content, classification):
+    '''Upload the JPEG image to the destination bucket once it is classified: straight to the
+       folder of its predicted class if UPLOAD_TO_CLASS_FOLDER is set, otherwise as a temp
+       object that copy_and_delete_image moves there.'''
+    key = event['image_id']
+    if upload_to_class_folder:
+        key = classification['predicted_class'] + '/' + key
+    s3_client.put_object(Bucket=destination_bucket_name, Key=key, Body=content)
+
+
+def classify_batch(events):
+    '''Classify a list of images. Images are preprocessed concurrently and classified
+       together. A failed image gets an "error-info" entry instead of a classification
+       and does not fail the batch. The list is passed on as is to copy_and_delete_image,
+       log_to_dynamodb and log_error, which each handle the images that concern them.'''
+    with ThreadPoolExecutor(max_workers=preprocess_workers) as executor:
+        preprocessed = list(executor.map(isolate_errors(preprocess_image), events))
+
+    # only the images that were preprocessed successfully are passed to the model
+    valid_indexes = [index for index, (_, error) in enumerate(preprocessed) if error is None]
+    classifications = classify([preprocessed[index][0][1] for index in valid_indexes],
+                               [preprocessed[index][0][2] for index in valid_indexes])
+    classifications = dict(zip(valid_indexes, classifications))
+
+    with ThreadPoolExecutor(max_workers=preprocess_workers) as executor:
+        uploaded = executor.map(isolate_errors(upload_image),
+                                [events[index] for index in valid_indexes],
+                                [preprocessed[index][0][3] for index in valid_indexes],
+                                [classifications[index] for index in valid_indexes])
+        uploaded = dict(zip(valid_indexes, uploaded))
+
+    for index, event in enumerate(events):
+        result, error = preprocessed[index]
+        if error is None:
+            _, error = uploaded[index]
+        if error is None:
+            event['metadata'] = result[0]
+            event['classification'] = classifications[index]
+            event['uploaded_to_class_folder'] = upload_to_class_folder
+        else:
+            event['error-info'] = get_error_info(error)
+
+    return events
+
+
+def lambda_handler(event, context, call=None, callback=None):
+    # load the model (and its input size) before images are preprocessed concurrently
+    get_model_input_size()
+    # a list of image events is classified as one batch
+    if isinstance(event, list):
+        return classify_batch(event)
+
+    metadata, model_input, data_hash, content = preprocess_image(event)
+    event['metadata'] = metadata
+    event['classification'] = classify([model_input], [data_hash])[0]
+    upload_image(event, content, event['classification'])
+    event['uploaded_to_class_folder'] = upload_to_class_folder
+
+    return event
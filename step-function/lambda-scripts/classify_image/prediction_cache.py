@@ -0,0 +1,82 @@
+'''Content-addressed cache of classifications shared by the classify_image lambdas.'''
+import json
+import time
+import hashlib
+import threading
+from botocore.exceptions import ClientError
+
+
+def hash_image(image):
+    '''Hash the pixels of a preprocessed image, so that the same exposure uploaded under
+       another key (or re-uploaded) gets the same hash.'''
+    digest = hashlib.sha256('{}x{}'.format(*image.size).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    '''Classifications stored in a DynamoDB table keyed by "DATA HASH".
+       Entries record the version of the model that made them and expire after ttl seconds
+       (the "EXPIRES" attribute is meant to be the table's TTL attribute); entries of
+       another model version or past their expiry are treated as misses. The cache is only an
+       optimization: a lookup that fails (e.g. throttling, a missing table or permission) counts
+       as a miss, and a write that fails is logged and ignored.
+       The cache is used from the threads of a batch, so it calls DynamoDB through the low-level
+       client of the table, which unlike the table resource is thread-safe.'''
+    def __init__(self, table, model_version, ttl):
+        self.table = table
+        self.client = table.meta.client
+        self.model_version = model_version
+        self.ttl = ttl
+        self.hits = 0
+        self.lookups = 0
+        self.lock = threading.Lock()
+
+    def get(self, data_hash):
+        '''Function returns the cached classification of an image, or None.'''
+        try:
+            response = self.client.get_item(TableName=self.table.name, Key={'DATA HASH': data_hash})
+        except ClientError as error:
+            print('Prediction cache lookup failed: {}'.format(error))
+            self.record(False)
+            return None
+        item = response.get('Item')
+        hit = (item is not None
+               and item['MODEL VERSION'] == self.model_version
+               and int(item['EXPIRES']) > time.time())
+        self.record(hit)
+        return json.loads(item['CLASSIFICATION']) if hit else None
+
+    def put(self, data_hash, classification):
+        try:
+            self.client.put_item(TableName=self.table.name,
+                                 Item={'DATA HASH': data_hash,
+                                       'MODEL VERSION': self.model_version,
+                                       'CLASSIFICATION': json.dumps(classification),
+                                       'EXPIRES': int(time.time()) + self.ttl})
+        except ClientError as error:
+            print('Prediction cache write failed: {}'.format(error))
+
+    def get_or_classify(self, data_hash, classify, *args):
+        '''Function returns the cached classification of an image, calling classify(*args)
+           and caching its result on a miss.'''
+        classification = self.get(data_hash)
+        if classification is None:
+            classification = classify(*args)
+            self.put(data_hash, classification)
+        return classification
+
+    def record(self, hit):
+        '''Count a lookup and log it as a CloudWatch embedded metric.'''
+        with self.lock:
+            self.lookups += 1
+            self.hits += int(hit)
+            hit_rate = self.hits / self.lookups
+        print(json.dumps({'_aws': {'Timestamp': int(time.time() * 1000),
+                                   'CloudWatchMetrics': [{'Namespace': 'ImageClassification',
+                                                          'Dimensions': [['ModelVersion']],
+                                                          'Metrics': [{'Name': 'PredictionCacheHit',
+                                                                       'Unit': 'Count'}]}]},
+                          'ModelVersion': self.model_version,
+                          'PredictionCacheHit': int(hit),
+                          'ContainerHitRate': round(hit_rate, 4)}))
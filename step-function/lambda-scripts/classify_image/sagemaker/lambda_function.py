@@ -2,124 +2,141 @@ import os
 import json
 import time
 import boto3
-import numpy as np
-from astropy.io import fits
-from PIL import Image
-from PIL import FitsStubImagePlugin
+from concurrent.futures import ThreadPoolExecutor
+from fits_preprocessing import open_s3_fits_sci, fits_to_image, encode_jpeg
+from prediction_cache import PredictionCache, hash_image
+from classification_results import get_classification_item, get_error_info, isolate_errors
 
 # file size of image to be passed to SageMaker must be less than 5 MB
 MAX_FILE_SIZE_FOR_SAGEMAKER = int(5e+6) # in bytes
-# keys whose values are to be extracted from the header of the primary HDU of a FITS file
-hdu_keys = ['FILENAME',
-            'FILETYPE',
-            'TELESCOP',
-            'INSTRUME',
-            'TARGNAME',
-            'RA_TARG',
-            'DEC_TARG',
-            'PROPOSID',
-            'PR_INV_L',
-            'PR_INV_F',
-            'GYROMODE',
-            'DATE-OBS',
-            'TIME-OBS',
-            'EXPTIME',
-            'EXPFLAG',
-            'OBSTYPE',
-            'OBSMODE',
-            'DETECTOR',
-            'FILTER',
-            'APERTURE']
 
 # environment variables
 endpoint_name = os.environ.get('ENDPOINT_NAME')
 destination_bucket_name = os.environ.get('DESTINATION_BUCKET')
+# side length of the images the model was trained on (image_shape='3,256,256'); images are only
+# downsampled for the endpoint, the archived JPEG keeps full resolution; 0 sends the full resolution
+image_size = int(os.environ.get('IMAGE_SIZE', '256'))
+# number of images of a batch preprocessed at the same time
+preprocess_workers = int(os.environ.get('PREPROCESS_WORKERS', '4'))
+# number of concurrent endpoint requests made for a batch of images
+batch_size = int(os.environ.get('BATCH_SIZE', '8'))
 classes = [cls.strip() for cls in os.environ.get('CLASSES').split(',')]
+# DynamoDB table caching classifications by image content; caching is off if not set
+prediction_cache_table_id = os.environ.get('PREDICTION_CACHE_TABLE')
+# version of the model; cached classifications made by other versions are ignored
+model_version = os.environ.get('MODEL_VERSION', endpoint_name)
+# time after which a cached classification expires (in seconds)
+prediction_cache_ttl = int(os.environ.get('PREDICTION_CACHE_TTL', '2592000'))
+# write images straight to the folder of their predicted class, making "Copy and Delete Image" unnecessary
+upload_to_class_folder = os.environ.get('UPLOAD_TO_CLASS_FOLDER', 'false').lower() == 'true'
 
 # acquire AWS service access
 s3_client = boto3.client('s3')
 runtime = boto3.client('runtime.sagemaker')
+prediction_cache = None
+if prediction_cache_table_id:
+    prediction_cache = PredictionCache(boto3.resource('dynamodb').Table(prediction_cache_table_id),
+                                       model_version, prediction_cache_ttl)
 
 class FileSizeException(Exception):
     pass
 
 
-def lambda_handler(event, context, call=None, callback=None):
+def preprocess_image(event):
+    '''Fetch an image and convert it to JPEG, once downsampled for the endpoint and once at full
+       resolution for the destination bucket.
+       Function returns a (metadata, model JPEG bytes, hash of the model image pixels, JPEG bytes) tuple.'''
     bucket = event['s3']['bucket']
     key = event['s3']['key']
-    download_path = '/tmp/{}.fits'.format(event['image_id'])
-    
-    # download image and send off to SageMaker for classification
-    s3_client.download_file(bucket, key, download_path, ExtraArgs={'RequestPayer': 'requester'})
-    
-    with fits.open(download_path) as downloaded_file:
-        primary_hdu = downloaded_file[0]
-        header_keys = list(primary_hdu.header.keys())
-        metadata = {key: primary_hdu.header[key] for key in hdu_keys if key in header_keys}
-        # if present, the first and fourth indexes of the FITS file are two pieces of one single image
-        if len(downloaded_file) > 4 and downloaded_file[4].header['EXTNAME'] == 'SCI':
-            # two portions of one single image
-            data_1_of_2 = downloaded_file[1].data
-            data_2_of_2 = downloaded_file[4].data
-            height = data_1_of_2.shape[0] + data_2_of_2.shape[0]
-            width = data_1_of_2.shape[1]
-            # merge the two image Header Data Units (HDU) into one image
-            temp = np.zeros((height, width))
-            temp[0: int(height/2), :] = data_1_of_2
-            temp[int(height/2): height, :] = data_2_of_2
-            data = temp
-        else:
-            # get one of the image Header Data Units (HDU) from each FITS file
-            data = downloaded_file[1].data
-    
-    # clean up temp download
-    os.remove(download_path)
-    
-    # trim the extreme values
-    top = np.percentile(data, 99)
-    data[data > top] = top
-    bottom = np.percentile(data, 1)
-    data[data < bottom] = bottom
     
-    # scale the data
-    data = data - data.min()
-    data = (data / data.max()) * 255.0
-    data = np.flipud(data)
-    data = np.uint8(data)
+    # fetch only the headers and SCI data of the image
+    with open_s3_fits_sci(s3_client, bucket, key) as downloaded_file:
+        metadata, image, model_image = fits_to_image(downloaded_file, image_size)
     
-    image = Image.fromarray(data)
-    download_path = download_path.replace('.fits','.jpg')
-    image.save(download_path)
-    file_size = os.path.getsize(download_path)
+    content = encode_jpeg(model_image)
+    file_size = len(content)
     msg = 'File size of image: {:.2f} MB\n'.format(file_size * 1e-6)
     msg += 'Size of an image to be classified by SageMaker endpoint must be less than 5 MB.'
     if file_size >= MAX_FILE_SIZE_FOR_SAGEMAKER:
-        # clean up temp download
-        os.remove(download_path)
         raise FileSizeException(msg)
-    s3_client.upload_file(download_path, destination_bucket_name, event['image_id'])
 
-    with open(download_path, 'rb') as downloaded_image:
-        content = downloaded_image.read()
-    # clean up temp download
-    os.remove(download_path)
+    archive_content = content if model_image is image else encode_jpeg(image)
+    return metadata, content, hash_image(model_image), archive_content
+
+
+def get_classification(content):
+    '''Send a JPEG image off to SageMaker for classification.
+       Function returns the probability of each class and the predicted class.'''
     response = runtime.invoke_endpoint(EndpointName=endpoint_name,
                                        Body=content)
     result = json.loads(response['Body'].read().decode())
+    return get_classification_item(zip(classes, result))
+
+
+def classify(content, data_hash):
+    '''Classify an image, skipping the endpoint if the same pixels were classified before.'''
+    if prediction_cache is None:
+        return get_classification(content)
+    return prediction_cache.get_or_classify(data_hash, get_classification, content)
+
+
+def upload_image(event, content, classification):
+    '''Upload the JPEG image to the destination bucket once it is classified: straight to the
+       folder of its predicted class if UPLOAD_TO_CLASS_FOLDER is set, otherwise as a temp
+       object that copy_and_delete_image moves there.'''
+    key = event['image_id']
+    if upload_to_class_folder:
+        key = classification['predicted_class'] + '/' + key
+    s3_client.put_object(Bucket=destination_bucket_name, Key=key, Body=content)
+
+
+def classify_and_upload(event, content, data_hash, archive_content):
+    classification = classify(content, data_hash)
+    upload_image(event, archive_content, classification)
+    return classification
+
+
+def classify_batch(events):
+    '''Classify a list of images. Images are preprocessed concurrently and sent to the
+       endpoint in micro-batches of at most BATCH_SIZE concurrent requests. A failed image
+       gets an "error-info" entry instead of a classification and does not fail the batch.
+       The list is passed on as is to copy_and_delete_image, log_to_dynamodb and log_error,
+       which each handle the images that concern them.'''
+    with ThreadPoolExecutor(max_workers=preprocess_workers) as executor:
+        preprocessed = list(executor.map(isolate_errors(preprocess_image), events))
+
+    # only the images that were preprocessed successfully are sent to the endpoint
+    valid_indexes = [index for index, (_, error) in enumerate(preprocessed) if error is None]
+    with ThreadPoolExecutor(max_workers=batch_size) as executor:
+        classified = executor.map(isolate_errors(classify_and_upload),
+                                  [events[index] for index in valid_indexes],
+                                  [preprocessed[index][0][1] for index in valid_indexes],
+                                  [preprocessed[index][0][2] for index in valid_indexes],
+                                  [preprocessed[index][0][3] for index in valid_indexes])
+        classifications = dict(zip(valid_indexes, classified))
+
+    for index, event in enumerate(events):
+        result, error = preprocessed[index]
+        if error is None:
+            event['metadata'] = result[0]
+            classification, error = classifications[index]
+        if error is None:
+            event['classification'] = classification
+            event['uploaded_to_class_folder'] = upload_to_class_folder
+        else:
+            event['error-info'] = get_error_info(error)
+
+    return events
+
+
+def lambda_handler(event, context, call=None, callback=None):
+    # a list of image events is classified as one batch
+    if isinstance(event, list):
+        return classify_batch(event)
 
-    item = {'probabilities': {}}
-    # determine the predicted class based on the highest probability returned
-    predicted_class = {'class': '', 'probability': 0.0}
-    for result_index, probability in enumerate(result):
-        item['probabilities'][classes[result_index]] = str(round(probability, 8))
-        if probability > predicted_class['probability']:
-            predicted_class['class'] = classes[result_index]
-            predicted_class['probability'] = probability
-        # if two or more classes have the same high probability, then create a concatenated string of the classes
-        elif probability == predicted_class['probability']:
-            predicted_class['class'] = predicted_class['class'] + ', ' + classes[result_index]
-    item['predicted_class'] = predicted_class['class']
+    metadata, content, data_hash, archive_content = preprocess_image(event)
     event['metadata'] = metadata
-    event['classification'] = item
+    event['classification'] = classify_and_upload(event, content, data_hash, archive_content)
+    event['uploaded_to_class_folder'] = upload_to_class_folder
     
     return event
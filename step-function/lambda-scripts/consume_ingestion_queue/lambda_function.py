@@ -0,0 +1,110 @@
+import os
+import json
+import time
+from uuid import uuid4
+from functools import lru_cache
+import boto3
+from execution_leases import LeaseStore, get_lease_duration, get_lease_table
+from state_machine_executions import ExecutionStarter, get_execution_name, get_state_machine_input
+
+
+# Consumer of an SQS queue subscribed to the SNS topic that process-existing-bucket-objects.py
+# publishes to (raw S3 notifications sent straight to the queue are accepted too). The event
+# source mapping should use a batch size of up to 10 (or a batching window), a maximum
+# concurrency, and ReportBatchItemFailures; the queue's redrive policy sends messages that keep
+# failing to a dead-letter queue. In "single" mode, executions are admitted through the same
+# leases as start_state_machine (LEASE_TABLE; see execution_leases.py).
+
+# environment variables
+# ARN of the batch state machine in "batch" mode, of the image state machine in "single" mode
+state_machine_arn = os.environ.get('STATE_MACHINE_ARN')
+# "batch" starts one execution of the batch state machine per batch of messages,
+# "single" starts one execution of the image state machine per image
+mode = os.environ.get('MODE', 'batch')
+# number of images classified at the same time by the Map state of the batch state machine
+max_concurrency = int(os.environ.get('MAX_CONCURRENCY', '10'))
+# largest number of executions started per second by one invocation in "single" mode
+max_starts_per_second = float(os.environ.get('MAX_STARTS_PER_SECOND', '5'))
+# in "single" mode, the number of executions of the image state machine allowed to run at the
+# same time, and the time after which the lease of an execution expires (in seconds), as set
+# for start_state_machine
+max_concurrent_executions = int(os.environ.get('MAX_CONCURRENT_EXECUTIONS', '1'))
+lease_duration = os.environ.get('LEASE_DURATION')
+lease_table_id = os.environ.get('LEASE_TABLE')
+client = boto3.client('stepfunctions')
+db_resource = boto3.resource('dynamodb')
+
+
+@lru_cache(maxsize=None)
+def get_execution_starter():
+    '''Create the execution starter and its lease store on first use and reuse them across
+       warm invocations.'''
+    duration = int(lease_duration) if lease_duration else get_lease_duration(client, state_machine_arn)
+    lease_store = LeaseStore(get_lease_table(db_resource, lease_table_id), max_concurrent_executions, duration)
+    return ExecutionStarter(client, state_machine_arn, lease_store)
+
+
+def get_records(message_body):
+    '''Function returns every S3 record in an SQS message body.'''
+    body = json.loads(message_body)
+    # messages delivered by SNS without raw message delivery are wrapped in an envelope
+    if isinstance(body, dict) and body.get('Type') == 'Notification':
+        body = json.loads(body['Message'])
+    if not isinstance(body, dict):
+        raise TypeError('Message body is not a JSON object.')
+    return body.get('Records', [])
+
+
+def lambda_handler(event, context):
+    '''Start the state machine for the images of a batch of SQS messages.
+       Function returns the messages that failed, for partial batch failure handling.'''
+    failed_message_ids = set()
+    # image id -> (state machine input, execution name, ids of the messages that mention the image)
+    images = {}
+    for record in event['Records']:
+        try:
+            s3_records = get_records(record['body'])
+            keys = [(s3_record['s3']['bucket']['name'], s3_record['s3']['object']['key'],
+                     s3_record['s3']['object'].get('eTag')) for s3_record in s3_records]
+        except (ValueError, KeyError, TypeError):
+            print('Message "{}" not processed: not an S3 notification.'.format(record['messageId']))
+            continue
+        for bucket, key, etag in keys:
+            state_machine_input, problems = get_state_machine_input(bucket, key)
+            if len(problems):
+                print('File "{}" not processed.\nReason(s):'.format(key))
+                for count, problem in enumerate(problems):
+                    print('{}) '.format(count+1) + problem)
+                continue
+            # the same image may appear in several messages of a batch; start it only once
+            image_id = state_machine_input['image_id']
+            execution_name = get_execution_name(bucket, key, etag)
+            images.setdefault(image_id, (state_machine_input, execution_name, []))[2].append(record['messageId'])
+
+    if mode == 'batch' and images:
+        try:
+            client.start_execution(
+                stateMachineArn=state_machine_arn,
+                name=str(uuid4()),
+                input=json.dumps({'images': [image for image, _, _ in images.values()],
+                                  'max_concurrency': max_concurrency})
+            )
+        except Exception as error:
+            print('Batch state machine not started: {}'.format(error))
+            failed_message_ids.update(message_id for _, _, message_ids in images.values()
+                                      for message_id in message_ids)
+    else:
+        for state_machine_input, execution_name, message_ids in images.values():
+            start = time.time()
+            try:
+                get_execution_starter().start(state_machine_input, execution_name, context)
+            except Exception as error:
+                print('State machine not started for "{}": {}'.format(state_machine_input['s3']['key'], error))
+                failed_message_ids.update(message_ids)
+            # pace the starts to at most MAX_STARTS_PER_SECOND
+            time.sleep(max(0.0, 1.0 / max_starts_per_second - (time.time() - start)))
+
+    print("{} image(s) from {} message(s) processed; {} message(s) failed.".format(len(images),
+                                                                              len(event['Records']),
+                                                                              len(failed_message_ids)))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in sorted(failed_message_ids)]}
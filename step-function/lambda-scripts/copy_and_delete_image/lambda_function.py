@@ -11,10 +11,9 @@ s3_client = boto3.client('s3')
 s3_resource = boto3.resource('s3')
 
 
-def lambda_handler(event, context, call=None, callback=None):
-    bucket = event['s3']['bucket']
+def copy_and_delete(event):
+    '''Move the temp JPEG of a classified image to the folder of its predicted class.'''
     image_id = event['image_id']
-    
     # copy image to corresponding folder in destination bucket based on the predicted class
     destination_bucket = s3_resource.Bucket(destination_bucket_name)
     copy_source = {'Bucket': destination_bucket_name, 'Key': image_id}
@@ -25,5 +24,15 @@ def lambda_handler(event, context, call=None, callback=None):
         
     # delete temp file from destination bucket
     _ = s3_client.delete_object(Bucket=destination_bucket_name, Key=image_id)
+
+
+def lambda_handler(event, context, call=None, callback=None):
+    # a list of image events (e.g. the output of a batch classification) is handled image by image;
+    # images that failed are left for "Log Error"
+    events = event if isinstance(event, list) else [event]
+    for image_event in events:
+        # classify_image already uploaded the image to the folder of its predicted class
+        if 'classification' in image_event and not image_event.get('uploaded_to_class_folder'):
+            copy_and_delete(image_event)
                             
     return event
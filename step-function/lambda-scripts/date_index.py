@@ -0,0 +1,41 @@
+'''Partitions and queries of the date index of the upload history and classifications tables.'''
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+# The index has "DATE ADDED TO TABLE" as partition key, so one day's writes and queries all
+# go to one partition. With shards, items also get a "DATE SHARD" attribute, the date followed
+# by one of shards numbers derived from the image id, and the index is keyed on it instead,
+# spreading each day over shards partitions.
+
+def get_date_shard(date, image_id, shards):
+    '''Function returns the "DATE SHARD" of an item added on date.'''
+    shard = int(hashlib.md5(image_id.encode()).hexdigest(), 16) % shards
+    return '{}#{}'.format(date, shard)
+
+
+def get_date_partitions(since, until, shards=0):
+    '''Function returns the partition key values of the date index covering the timestamps
+       since to until: each date, or each shard of each date if the index is sharded.'''
+    partitions = []
+    day = datetime.fromtimestamp(since, timezone.utc).date()
+    while day <= datetime.fromtimestamp(until, timezone.utc).date():
+        if shards:
+            partitions.extend('{}#{}'.format(day, shard) for shard in range(shards))
+        else:
+            partitions.append(str(day))
+        day += timedelta(days=1)
+    return partitions
+
+
+def query_partitions(query, get_kwargs, partitions):
+    '''Query each partition of the index, following LastEvaluatedKey. query is the query method
+       of a DynamoDB client or table, and get_kwargs(partition) returns its arguments.
+       Function yields each response.'''
+    for partition in partitions:
+        kwargs = get_kwargs(partition)
+        while True:
+            response = query(**kwargs)
+            yield response
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
@@ -0,0 +1,78 @@
+'''Batched, buffered DynamoDB writes shared by the log_to_dynamodb and log_error lambdas.'''
+import time
+import random
+from decimal import Decimal
+
+
+# largest number of requests in one BatchWriteItem call
+MAX_BATCH_WRITE_ITEMS = 25
+
+
+class UnprocessedItemsException(Exception):
+    pass
+
+
+def convert_floats(items, digits=8):
+    '''Convert the float values of a batch of items to Decimal, which DynamoDB requires.'''
+    for item in items:
+        for key, value in item.items():
+            if type(value) is float:
+                item[key] = Decimal(str(round(value, digits)))
+    return items
+
+
+class BatchWriter:
+    '''Buffer of put requests written to one or more tables with BatchWriteItem.
+       Requests are grouped 25 at a time; UnprocessedItems are retried with jittered
+       exponential backoff. Use it as a context manager to flush on exit.'''
+    def __init__(self, db_resource, max_attempts=8, base_delay=0.05, max_delay=2.0):
+        self.db_resource = db_resource
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # table name -> key of the item -> item; a later put of the same key replaces
+        # an earlier one, since a batch may not write the same item twice
+        self.buffer = {}
+        self.size = 0
+
+    def put(self, table_name, item, key_names=('IMAGE ID',)):
+        table_buffer = self.buffer.setdefault(table_name, {})
+        key = tuple(item.get(key_name) for key_name in key_names)
+        if key not in table_buffer:
+            self.size += 1
+        table_buffer[key] = item
+        if self.size >= MAX_BATCH_WRITE_ITEMS:
+            self.flush()
+
+    def flush(self):
+        '''Write every buffered item. Function returns the number of items written.'''
+        requests = [(table_name, {'PutRequest': {'Item': item}})
+                    for table_name, table_buffer in self.buffer.items()
+                    for item in table_buffer.values()]
+        self.buffer = {}
+        self.size = 0
+        for start in range(0, len(requests), MAX_BATCH_WRITE_ITEMS):
+            request_items = {}
+            for table_name, request in requests[start: start + MAX_BATCH_WRITE_ITEMS]:
+                request_items.setdefault(table_name, []).append(request)
+            self.write(request_items)
+        return len(requests)
+
+    def write(self, request_items):
+        for attempt in range(self.max_attempts):
+            response = self.db_resource.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems')
+            if not request_items:
+                return
+            # full jitter backoff while the tables are throttling
+            time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+        count = sum(len(requests) for requests in request_items.values())
+        raise UnprocessedItemsException('{} item(s) still unprocessed after {} attempts.'.format(count,
+                                                                                                 self.max_attempts))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
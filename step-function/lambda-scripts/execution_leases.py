@@ -0,0 +1,85 @@
+'''Leases on execution slots of the image state machine.'''
+import json
+import time
+import random
+from botocore.exceptions import ClientError
+
+
+# time a lease outlives the TimeoutSeconds of the state machine, covering the time between
+# acquiring the lease and starting the execution (in seconds)
+LEASE_MARGIN = 60
+
+
+class LeaseConfigurationException(Exception):
+    pass
+
+
+def get_lease_duration(client, state_machine_arn):
+    '''Function returns the time after which a lease expires: longer than the TimeoutSeconds of
+       the state machine, so that a lease never expires while its execution can still run.'''
+    response = client.describe_state_machine(stateMachineArn=state_machine_arn)
+    definition = json.loads(response['definition'])
+    if 'TimeoutSeconds' not in definition:
+        msg = 'State machine {} has no TimeoutSeconds to derive the lease duration from; '.format(state_machine_arn)
+        msg += 'set TimeoutSeconds in its definition or the LEASE_DURATION environment variable.'
+        raise LeaseConfigurationException(msg)
+    return int(definition['TimeoutSeconds']) + LEASE_MARGIN
+
+
+def get_lease_table(db_resource, lease_table_id):
+    '''Function returns the lease table, failing with an explanation if it is not configured.'''
+    if not lease_table_id:
+        msg = 'The LEASE_TABLE environment variable is not set. It names the DynamoDB table of execution '
+        msg += 'leases, with "SLOT" (Number) as partition key (see execution_leases.py).'
+        raise LeaseConfigurationException(msg)
+    return db_resource.Table(lease_table_id)
+
+
+class LeaseStore:
+    '''Counting semaphore of execution leases held in a DynamoDB table keyed by "SLOT".
+       Each of the slots 0 to slots-1 can be held by one execution at a time; a lease is
+       acquired with a conditional write, so concurrent invocations never share a slot.
+       slots and duration are only needed to acquire leases.'''
+    def __init__(self, table, slots=None, duration=None):
+        self.table = table
+        self.slots = slots
+        self.duration = duration
+
+    def acquire(self, owner):
+        '''Try to take a free or expired slot for owner. Function returns the slot or None.'''
+        now = int(time.time())
+        # start at a random slot to spread contention between invocations
+        slots = list(range(self.slots))
+        random.shuffle(slots)
+        for slot in slots:
+            try:
+                self.table.put_item(
+                    Item={'SLOT': slot, 'OWNER': owner, 'EXPIRES': now + self.duration},
+                    ConditionExpression='attribute_not_exists(#slot) OR #expires < :now',
+                    ExpressionAttributeNames={'#slot': 'SLOT', '#expires': 'EXPIRES'},
+                    ExpressionAttributeValues={':now': now}
+                )
+                return slot
+            except ClientError as error:
+                if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        return None
+
+    def release(self, slot, owner):
+        '''Free a slot, provided it is still held by owner.'''
+        try:
+            self.table.delete_item(
+                Key={'SLOT': slot},
+                ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'OWNER'},
+                ExpressionAttributeValues={':owner': owner}
+            )
+        except ClientError as error:
+            if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def leases(self):
+        '''Function returns the (slot, owner) of every lease currently held.'''
+        response = self.table.scan(ConsistentRead=True)
+        return [(int(item['SLOT']), item['OWNER']) for item in response['Items']
+                if int(item['SLOT']) < self.slots]
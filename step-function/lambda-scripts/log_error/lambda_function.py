@@ -1,15 +1,49 @@
 import os
 import boto3
 import json
+from functools import lru_cache
 from datetime import datetime, timezone
+from dynamodb_batch_writer import BatchWriter
 
 
 table_id = os.environ.get('ERROR_TABLE')
+# only needed to release the claims of check_for_duplicate_upload
+upload_history_table_id = os.environ.get('UPLOAD_HISTORY_TABLE')
+destination_bucket_name = os.environ.get('DESTINATION_BUCKET')
 db_resource = boto3.resource('dynamodb')
-table = db_resource.Table(table_id)
+s3_client = boto3.client('s3')
 
 
-def lambda_handler(event, context):
+@lru_cache(maxsize=None)
+def get_upload_history_table():
+    '''Create the upload history table handle on the first claim released rather than at import,
+       so that the lambda still logs errors when UPLOAD_HISTORY_TABLE is not set.'''
+    return db_resource.Table(upload_history_table_id)
+
+
+def release_claim(image_id, token):
+    '''Delete the claim check_for_duplicate_upload made on the image, so that it can be
+       classified again, provided the claim is still the one made for this execution.'''
+    try:
+        get_upload_history_table().delete_item(
+            Key={'IMAGE ID': image_id},
+            ConditionExpression='#token = :token',
+            ExpressionAttributeNames={'#token': 'CLAIM TOKEN'},
+            ExpressionAttributeValues={':token': token}
+        )
+    except db_resource.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
+
+
+def delete_temp_image(event):
+    '''Delete the temp JPEG classify_image uploaded for an image that failed before
+       copy_and_delete_image moved it to the folder of its predicted class.'''
+    if 'classification' in event and not event.get('uploaded_to_class_folder') and destination_bucket_name:
+        s3_client.delete_object(Bucket=destination_bucket_name, Key=event['image_id'])
+
+
+def get_item(event, current_time):
+    '''Function returns the item of a failed image for the error table, and the error.'''
     try:
         error = json.loads(event['error-info']['Cause'])
     except:
@@ -23,12 +57,25 @@ def lambda_handler(event, context):
         "ERROR MESSAGE": error['errorMessage']
     }
     
-    current_time = datetime.now(timezone.utc)
     item['DATE ADDED TO TABLE'] = str(current_time.date())
     item['TIME ADDED TO TABLE'] = current_time.strftime('%H:%M:%S %p %Z')
+    return item, error
+
+
+def lambda_handler(event, context):
+    # a list of image events is logged as one batch; only the images that failed are logged
+    events = event if isinstance(event, list) else [event]
+    events = [image_event for image_event in events if 'error-info' in image_event]
+    current_time = datetime.now(timezone.utc)
 
     # add to DynamoDB table
-    table.put_item(Item=item)
-    
-    print("Error Type: {}\nError Message: {}".format(error['errorType'],
-                                                     error['errorMessage']))
+    with BatchWriter(db_resource) as writer:
+        for image_event in events:
+            item, error = get_item(image_event, current_time)
+            writer.put(table_id, item)
+            print("Error Type: {}\nError Message: {}".format(error['errorType'],
+                                                             error['errorMessage']))
+    for image_event in events:
+        if 'claim_token' in image_event:
+            release_claim(image_event['image_id'], image_event['claim_token'])
+        delete_temp_image(image_event)
@@ -2,15 +2,19 @@ import os
 import boto3
 from decimal import Decimal
 from datetime import datetime, timezone
+from dynamodb_batch_writer import BatchWriter, convert_floats
+from date_index import get_date_shard
 
 img_classifications_table_id = os.environ.get('IMAGE_CLASSIFICATIONS_TABLE')
 upload_history_table_id = os.environ.get('UPLOAD_HISTORY_TABLE')
+# number of shards of each date in the date index of the upload history table (see date_index.py);
+# 0 keeps the index partitioned by "DATE ADDED TO TABLE" alone
+date_shards = int(os.environ.get('UPLOAD_HISTORY_DATE_SHARDS', '0'))
 db_resource = boto3.resource('dynamodb')
-img_classifications_table = db_resource.Table(img_classifications_table_id)
-upload_history_table = db_resource.Table(upload_history_table_id)
 
 
-def lambda_handler(event, context):
+def get_items(event, current_time):
+    '''Function returns the items of an image for the classifications and upload history tables.'''
     item = {
         "IMAGE ID": event['image_id'],
         "PREDICTED CLASS": event['classification']['predicted_class']
@@ -18,15 +22,34 @@ def lambda_handler(event, context):
     classes = event['classification']['probabilities']
     for cls in classes:
         item['PROBABILITY OF ' + cls] = Decimal(classes[cls])
-    current_time = datetime.now(timezone.utc)
     item['DATE ADDED TO TABLE'] = str(current_time.date())
     item['TIME ADDED TO TABLE'] = current_time.strftime('%H:%M:%S %p %Z')
+    item['TIMESTAMP ADDED TO TABLE'] = int(current_time.timestamp())
     for key in event['metadata']:
-        if type(event['metadata'][key]) is float:
-            item[key.upper()] = Decimal(str(round(event['metadata'][key], 8)))
-        else:
-            item[key.upper()] = event['metadata'][key]
+        item[key.upper()] = event['metadata'][key]
+    # the date and timestamp let check_for_duplicate_upload refresh its filter incrementally
+    # (and query-dynamodb-and-plot.py sync its cache of the classifications table)
+    upload_history_item = { 'IMAGE ID': event['image_id'],
+                            'DATE ADDED TO TABLE': item['DATE ADDED TO TABLE'],
+                            'TIMESTAMP ADDED TO TABLE': item['TIMESTAMP ADDED TO TABLE'] }
+    if date_shards:
+        upload_history_item['DATE SHARD'] = get_date_shard(item['DATE ADDED TO TABLE'], event['image_id'],
+                                                           date_shards)
+    return item, upload_history_item
+
+
+def lambda_handler(event, context):
+    # a list of image events (e.g. the output of a batch classification) is logged as one batch;
+    # images that failed or were skipped as duplicates are left out
+    events = event if isinstance(event, list) else [event]
+    events = [image_event for image_event in events if 'classification' in image_event]
+    current_time = datetime.now(timezone.utc)
+    items = [get_items(image_event, current_time) for image_event in events]
+    # metadata floats are converted to Decimal in one pass over the batch
+    convert_floats([item for item, _ in items])
     
     # update DynamoDB tables
-    img_classifications_table.put_item(Item=item)
-    upload_history_table.put_item(Item={ 'IMAGE ID': event['image_id'] })
+    with BatchWriter(db_resource) as writer:
+        for item, upload_history_item in items:
+            writer.put(img_classifications_table_id, item)
+            writer.put(upload_history_table_id, upload_history_item)
@@ -0,0 +1,19 @@
+import os
+import boto3
+from execution_leases import LeaseStore, get_lease_table
+
+
+# Last task of the image state machine, reached whether the image was classified, skipped as a
+# duplicate, or logged as an error: it frees the execution slot start_state_machine leased for
+# the execution, so that the next image can be started without waiting for the lease to expire.
+lease_table_id = os.environ.get('LEASE_TABLE')
+db_resource = boto3.resource('dynamodb')
+
+
+def lambda_handler(event, context, call=None, callback=None):
+    # executions started without a lease (e.g. by hand) have nothing to release
+    lease = event.get('lease')
+    if lease is not None:
+        lease_store = LeaseStore(get_lease_table(db_resource, lease_table_id))
+        lease_store.release(lease['slot'], lease['owner'])
+    return event
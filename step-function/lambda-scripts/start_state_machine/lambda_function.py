@@ -1,106 +1,89 @@
 import os
 import json
-import time
-from uuid import uuid4
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from execution_leases import LeaseStore, get_lease_duration, get_lease_table
+from state_machine_executions import ExecutionStarter, get_execution_name, get_state_machine_input
 
 
-VALID_EXTENSIONS = ['fits']
-VALID_SUBGROUPS = ['flc', 'flt']
+# Executions are admitted through leases on MAX_CONCURRENT_EXECUTIONS slots of a DynamoDB table
+# (LEASE_TABLE; see execution_leases.py for its key and the IAM permissions this lambda needs).
+# The "Release Execution Lease" task at the end of the state machine frees the lease of an
+# execution, whether it succeeded or failed.
+
+# largest number of executions started at the same time by one invocation
+MAX_START_WORKERS = 10
 state_machine_arn = os.environ.get('STATE_MACHINE_ARN')
+# number of executions of the state machine allowed to run at the same time
+max_concurrent_executions = int(os.environ.get('MAX_CONCURRENT_EXECUTIONS', '1'))
+# time after which the lease of an execution expires (in seconds); by default a little longer
+# than the TimeoutSeconds of the state machine, and it must not be shorter
+lease_duration = os.environ.get('LEASE_DURATION')
+lease_table_id = os.environ.get('LEASE_TABLE')
 client = boto3.client('stepfunctions')
+db_resource = boto3.resource('dynamodb')
 
-def get_error_msg(name, input_element, valid_elements):
-    msg = 'Invalid {}\n\t{} found: {}'.format(name, name.title(), input_element)
-    msg += '\n\t{} must be one of the following: '.format(name.title())
-    for index, valid_element in enumerate(valid_elements):
-        if index == len(valid_elements)-1:
-            msg += valid_element
-        else:
-            msg += valid_element + ', '
-    return msg
 
+class StartExecutionException(Exception):
+    pass
 
-def lambda_handler(event, context):
-    '''Only start the state machine if the file is a valid subgroup and extension.'''
-    event = json.loads(event['Records'][0]['Sns']['Message'])['Records'][0]
-    bucket = event['s3']['bucket']['name']
-    key = event['s3']['object']['key']
-    
-    # EXAMPLE 1
-    # =======================================================
-    # key      : hst/public/idpy/idpya7i2q/idpya7i2q_spt.fits
-    # image_id : idpya7i2q_spt
-    # subgroup : spt
-    # extension: fits
-    
-    # EXAMPLE 2
-    # ============================================================
-    # key      : hst/public/idpy/idpya7i0q/idpya7i0q_flt_thumb.jpg
-    # image_id : idpya7i0q_flt_thumb
-    # subgroup : flt_thumb
-    # extension: jpg
-    
-    image_id, extension = key.split('.')
-    image_id = image_id.split('/')[-1]
-    index = 0
-    for character in image_id:
-        if character == '_':
-            break
-        else:
-            index += 1
-    subgroup = image_id[index+1:]
 
-    elements = {'extension': {'input': extension,
-                              'valid': VALID_EXTENSIONS},
-                'subgroup' : {'input': subgroup,
-                              'valid': VALID_SUBGROUPS}}
+@lru_cache(maxsize=None)
+def get_execution_starter():
+    '''Create the execution starter and its lease store on first use and reuse them across
+       warm invocations.'''
+    duration = int(lease_duration) if lease_duration else get_lease_duration(client, state_machine_arn)
+    lease_store = LeaseStore(get_lease_table(db_resource, lease_table_id), max_concurrent_executions, duration)
+    return ExecutionStarter(client, state_machine_arn, lease_store)
 
-    problems = []
-    for element in elements:
-        input_element = elements[element]['input']
-        valid_elements = elements[element]['valid']
-        if input_element not in valid_elements:
-            msg = get_error_msg(element, input_element, valid_elements)
-            problems.append(msg)
 
-    if len(problems):
-        print('File "{}" not processed.\nReason(s):'.format(key))
-        for count, problem in enumerate(problems):
-            print('{}) '.format(count+1) + problem)
-        raise SystemExit
-        
-    state_machine_input = {
-        'image_id': image_id,
-        'subgroup': subgroup,
-        's3': {
-            'key': key,
-            'bucket': bucket
-        }
-    }
+def get_s3_records(event):
+    '''Function returns every S3 record of every SNS message in the event.'''
+    s3_records = []
+    for record in event['Records']:
+        message = json.loads(record['Sns']['Message'])
+        s3_records.extend(message.get('Records', []))
+    return s3_records
 
-    running_executions = client.list_executions(
-        stateMachineArn=state_machine_arn,
-        statusFilter='RUNNING'
-    )
 
-    # wait until there is no running execution of the state machine
-    delay = 0.10
-    while True:
-        if not running_executions['executions']:
-            break
+def lambda_handler(event, context):
+    '''Only start the state machine for the files that are a valid subgroup and extension.
+       Function returns the outcome of each S3 record in the event.'''
+    outcomes = []
+    to_start = []
+    for record in get_s3_records(event):
+        bucket = record['s3']['bucket']['name']
+        key = record['s3']['object']['key']
+        state_machine_input, problems = get_state_machine_input(bucket, key)
+        if len(problems):
+            print('File "{}" not processed.\nReason(s):'.format(key))
+            for count, problem in enumerate(problems):
+                print('{}) '.format(count+1) + problem)
+            outcomes.append({'key': key, 'status': 'SKIPPED', 'reason': problems})
         else:
-            time.sleep(delay)
-            running_executions = client.list_executions(
-                stateMachineArn=state_machine_arn,
-                statusFilter='RUNNING'
-            )
-            # incrementally increase sleeping time
-            delay *= 2
-    
-    response = client.start_execution(
-        stateMachineArn=state_machine_arn,
-        name=str(uuid4()),
-        input=json.dumps(state_machine_input)
-    )
-    print("State machine started.")
+            execution_name = get_execution_name(bucket, key, record['s3']['object'].get('eTag'))
+            to_start.append((state_machine_input, execution_name))
+
+    # start the executions of the valid files concurrently
+    failures = []
+    if to_start:
+        with ThreadPoolExecutor(max_workers=min(len(to_start), MAX_START_WORKERS)) as executor:
+            futures = [executor.submit(get_execution_starter().start, state_machine_input, execution_name, context)
+                       for state_machine_input, execution_name in to_start]
+        for (state_machine_input, execution_name), future in zip(to_start, futures):
+            key = state_machine_input['s3']['key']
+            try:
+                status, execution = future.result()
+                outcomes.append({'key': key, 'status': status, 'execution': execution})
+            except Exception as error:
+                outcomes.append({'key': key, 'status': 'FAILED', 'reason': str(error)})
+                failures.append(key)
+    print("State machine started for {} of {} file(s).".format(len(to_start) - len(failures), len(outcomes)))
+
+    if failures:
+        # fail the invocation so that it is retried; files already started keep their execution name,
+        # so the retry does not start them again
+        raise StartExecutionException('State machine not started for: {}'.format(', '.join(failures)))
+
+    return {'outcomes': outcomes}
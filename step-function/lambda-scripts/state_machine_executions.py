@@ -0,0 +1,224 @@
+'''Validation, naming and admission of executions of the image state machine.'''
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+
+
+VALID_EXTENSIONS = ['fits']
+VALID_SUBGROUPS = ['flc', 'flt']
+# longest time to sleep between two attempts at acquiring a lease (in seconds)
+MAX_DELAY = 5.0
+# stop waiting for a lease when the invocation has less time left than this (in milliseconds)
+TIMEOUT_MARGIN = 5000
+# shortest time between two reclaims of the leases of executions that ended without
+# releasing them, e.g. stopped or timed out executions (in seconds)
+RECLAIM_INTERVAL = 60
+# largest number of executions started for one version of an object, e.g. when its image keeps failing
+MAX_ATTEMPTS = 10
+# statuses of executions that did not process their image, so that it may be started again
+RETRYABLE_STATUSES = ['FAILED', 'TIMED_OUT', 'ABORTED']
+
+
+class AdmissionTimeoutException(Exception):
+    pass
+
+
+class ExecutionAttemptsException(Exception):
+    pass
+
+
+def get_error_msg(name, input_element, valid_elements):
+    msg = 'Invalid {}\n\t{} found: {}'.format(name, name.title(), input_element)
+    msg += '\n\t{} must be one of the following: '.format(name.title())
+    for index, valid_element in enumerate(valid_elements):
+        if index == len(valid_elements)-1:
+            msg += valid_element
+        else:
+            msg += valid_element + ', '
+    return msg
+
+
+def get_state_machine_input(bucket, key):
+    '''Build the input of the state machine for an object.
+       Function returns a (state machine input, problems) tuple; the object is
+       only to be processed if it has a valid subgroup and extension.'''
+
+    # EXAMPLE 1
+    # =======================================================
+    # key      : hst/public/idpy/idpya7i2q/idpya7i2q_spt.fits
+    # image_id : idpya7i2q_spt
+    # subgroup : spt
+    # extension: fits
+
+    # EXAMPLE 2
+    # ============================================================
+    # key      : hst/public/idpy/idpya7i0q/idpya7i0q_flt_thumb.jpg
+    # image_id : idpya7i0q_flt_thumb
+    # subgroup : flt_thumb
+    # extension: jpg
+
+    image_id, _, extension = key.rpartition('.')
+    image_id = image_id.split('/')[-1]
+    index = 0
+    for character in image_id:
+        if character == '_':
+            break
+        else:
+            index += 1
+    subgroup = image_id[index+1:]
+
+    elements = {'extension': {'input': extension,
+                              'valid': VALID_EXTENSIONS},
+                'subgroup' : {'input': subgroup,
+                              'valid': VALID_SUBGROUPS}}
+
+    problems = []
+    for element in elements:
+        input_element = elements[element]['input']
+        valid_elements = elements[element]['valid']
+        if input_element not in valid_elements:
+            msg = get_error_msg(element, input_element, valid_elements)
+            problems.append(msg)
+
+    state_machine_input = {
+        'image_id': image_id,
+        'subgroup': subgroup,
+        's3': {
+            'key': key,
+            'bucket': bucket
+        }
+    }
+
+    return state_machine_input, problems
+
+
+def get_execution_name(bucket, key, etag=None):
+    '''Function returns the name of the execution of an object: the image id followed by a hash
+       of the bucket, key and ETag, so that a notification delivered again (e.g. when a failed
+       invocation is retried) gets the same name and Step Functions refuses to start it twice.
+       Later attempts at the same object add a suffix (see get_attempt_name).'''
+    digest = hashlib.sha256('/'.join([bucket, key, etag or '']).encode()).hexdigest()[:16]
+    image_id = key.split('/')[-1].rpartition('.')[0]
+    # execution names are at most 80 letters, digits, "-" or "_", including the attempt suffix
+    max_length = 80 - len(get_attempt_name('', MAX_ATTEMPTS - 1))
+    return re.sub('[^0-9A-Za-z_-]', '_', image_id)[:max_length - len(digest) - 1] + '-' + digest
+
+
+def get_attempt_name(execution_name, attempt):
+    '''Function returns the name of an attempt at processing an object, the first one being
+       execution_name itself.'''
+    return execution_name if attempt == 0 else '{}-{}'.format(execution_name, attempt)
+
+
+class ExecutionStarter:
+    '''Starts executions of the image state machine once lease_store (an
+       execution_leases.LeaseStore) has a free slot for them. The "Release Execution Lease"
+       task at the end of the state machine frees the slot of an execution.'''
+    def __init__(self, client, state_machine_arn, lease_store):
+        self.client = client
+        self.state_machine_arn = state_machine_arn
+        self.lease_store = lease_store
+        self.last_reclaim = 0.0
+        self.reclaim_lock = threading.Lock()
+
+    def get_execution_arn(self, execution_name):
+        return self.state_machine_arn.replace(':stateMachine:', ':execution:') + ':' + execution_name
+
+    def get_status(self, execution_name):
+        '''Function returns the status of the execution started with this name, or None if there is
+           none. An execution that succeeded by logging its image as an error (its output has the
+           error-info) is reported as FAILED, since the image was not classified.'''
+        try:
+            response = self.client.describe_execution(executionArn=self.get_execution_arn(execution_name))
+        except self.client.exceptions.ExecutionDoesNotExist:
+            return None
+        if response['status'] == 'SUCCEEDED':
+            output = json.loads(response.get('output') or '{}')
+            if isinstance(output, dict) and 'error-info' in output:
+                return 'FAILED'
+        return response['status']
+
+    def get_next_attempt(self, execution_name):
+        '''Step Functions does not reuse the name of an execution for 90 days, so an object whose
+           image failed is started again under the name of its next attempt.
+           Function returns the name to start the object with, or None if an attempt is running
+           or processed the image.'''
+        for attempt in range(MAX_ATTEMPTS):
+            attempt_name = get_attempt_name(execution_name, attempt)
+            status = self.get_status(attempt_name)
+            if status is None:
+                return attempt_name
+            if status not in RETRYABLE_STATUSES:
+                return None
+        raise ExecutionAttemptsException('{} attempts at "{}" failed.'.format(MAX_ATTEMPTS, execution_name))
+
+    def is_running(self, execution_name):
+        '''Whether an execution of the state machine started with this name is still running.'''
+        try:
+            response = self.client.describe_execution(executionArn=self.get_execution_arn(execution_name))
+            return response['status'] == 'RUNNING'
+        except self.client.exceptions.ExecutionDoesNotExist:
+            # the lease was taken but the execution has not been started yet
+            return True
+
+    def reclaim_finished_leases(self):
+        '''Release the leases of executions that are no longer running. Leases are released by the
+           state machine itself, so this only catches executions that ended without reaching the
+           release task, and runs at most once every RECLAIM_INTERVAL seconds per container.
+           Function returns whether the leases were reclaimed.'''
+        with self.reclaim_lock:
+            if time.time() - self.last_reclaim < RECLAIM_INTERVAL:
+                return False
+            self.last_reclaim = time.time()
+        for slot, owner in self.lease_store.leases():
+            if not self.is_running(owner):
+                self.lease_store.release(slot, owner)
+        return True
+
+    def admit(self, execution_name, context):
+        '''Wait until fewer than the number of slots of executions are running.
+           Function returns the slot leased for the execution.'''
+        delay = 0.10
+        while True:
+            slot = self.lease_store.acquire(execution_name)
+            if slot is not None:
+                return slot
+            if self.reclaim_finished_leases():
+                slot = self.lease_store.acquire(execution_name)
+                if slot is not None:
+                    return slot
+            if context is not None and context.get_remaining_time_in_millis() < TIMEOUT_MARGIN + delay * 1000:
+                # let the invocation be retried instead of timing out
+                raise AdmissionTimeoutException('No execution slot became free before the invocation timed out.')
+            # incrementally increase sleeping time, with jitter, up to MAX_DELAY
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, MAX_DELAY)
+
+    def start(self, state_machine_input, execution_name, context):
+        '''Start an execution of the state machine once a slot is free, unless an attempt at the
+           object is running or processed its image. Function returns a (status, name of the
+           attempt) tuple, the status being "STARTED" or "ALREADY STARTED".'''
+        attempt_name = self.get_next_attempt(execution_name)
+        if attempt_name is None:
+            return 'ALREADY STARTED', execution_name
+        # wait for a free execution slot rather than for every other execution to finish
+        slot = self.admit(attempt_name, context)
+        # the "Release Execution Lease" task frees the slot when the execution ends
+        state_machine_input = dict(state_machine_input, lease={'slot': slot, 'owner': attempt_name})
+        try:
+            self.client.start_execution(
+                stateMachineArn=self.state_machine_arn,
+                name=attempt_name,
+                input=json.dumps(state_machine_input)
+            )
+        except self.client.exceptions.ExecutionAlreadyExists:
+            # started by another delivery of the same notification in the meantime
+            self.lease_store.release(slot, attempt_name)
+            return 'ALREADY STARTED', attempt_name
+        except Exception:
+            self.lease_store.release(slot, attempt_name)
+            raise
+        return 'STARTED', attempt_name
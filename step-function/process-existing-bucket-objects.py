@@ -1,8 +1,18 @@
+import os
 import sys
 import boto3
 import json
 import time
+import queue
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sns_batch_publisher import MAX_BATCH_PUBLISH_ENTRIES, TokenBucket, BatchPublisher
+from backfill_checkpoint import Checkpoint
+from inventory_manifest import read_manifest, iter_pages
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda-scripts'))
+from batch_get import batch_get_items
 
 
 parser = argparse.ArgumentParser(description='Publish existing bucket objects as message to SNS topic.')
@@ -10,44 +20,254 @@ parser.add_argument('region', type=str, help='Region of your AWS account.')
 parser.add_argument('profile', type=str, help='Name of the AWS profile to use.')
 parser.add_argument('bucket', type=str, help='Name of the bucket storing objects to be processed.')
 parser.add_argument('topic_arn', type=str, help='ARN of the topic to publish to.')
-parser.add_argument('-d', '--delay', type=float, default=0.10, metavar='',
-                    help='Time buffer between message publishings (default: 0.10 seconds).')
+rate_group = parser.add_mutually_exclusive_group()
+rate_group.add_argument('-r', '--rate', type=float, default=10.0, metavar='',
+                        help='Largest number of messages published per second, to prevent pipeline overload; '
+                             '0 means no limit (default: 10).')
+rate_group.add_argument('-d', '--delay', type=float, default=None, metavar='',
+                        help='Time buffer between message publishings, kept for compatibility: '
+                             'the same as a rate of 1/delay; 0 means no limit (default: none).')
+parser.add_argument('-c', '--publishers', type=int, default=4, metavar='',
+                    help='Number of batches of up to 10 messages published at the same time (default: 4).')
+parser.add_argument('-a', '--max_attempts', type=int, default=5, metavar='',
+                    help='Number of times a failed message is published before giving up (default: 5).')
+parser.add_argument('-p', '--prefix', type=str, default='', metavar='',
+                    help='Only process the objects under this prefix (default: the whole bucket).')
+parser.add_argument('-s', '--shard_depth', type=int, default=3, metavar='',
+                    help='Number of "/" levels below the prefix to expand into shards listed concurrently; '
+                         'e.g. 3 shards the STScI bucket by hst/public/<4-char>/ (default: 3).')
+parser.add_argument('-w', '--list_workers', type=int, default=16, metavar='',
+                    help='Number of shards listed at the same time (default: 16).')
+parser.add_argument('-q', '--queue_size', type=int, default=10000, metavar='',
+                    help='Largest number of listed keys waiting to be published (default: 10000).')
+parser.add_argument('-f', '--state_file', type=str, default='backfill-state.json', metavar='',
+                    help='Path to the file the progress of the run is saved to (default: backfill-state.json).')
+parser.add_argument('-i', '--checkpoint_interval', type=float, default=10.0, metavar='',
+                    help='Time between two saves of the progress (default: 10 seconds).')
+parser.add_argument('--resume', action='store_true',
+                    help='Continue the run saved in the state file instead of starting over.')
+parser.add_argument('--retry_failures', action='store_true',
+                    help='Only publish again the keys that failed in the run saved in the state file.')
+parser.add_argument('-m', '--manifest', type=str, default=None, metavar='',
+                    help='Read the keys from an S3 Inventory report of the bucket instead of listing it: path or '
+                         's3:// URL of its manifest.json, or of one CSV, CSV.gz, or Parquet data file.')
+parser.add_argument('-u', '--upload_history_table', type=str, default=None, metavar='',
+                    help='Name of the upload history table; images already in it are not published.')
 args = parser.parse_args()
 
-def publish_messages(contents):
-    global cnt, unsuccessful_msg_keys
-    for content in contents:
-        key = content['Key']
-        image_id = key.split('/')[-1].split('.')[0]
-        if any([key.endswith(ending) for ending in ENDINGS]):
-            message = {
-                        "Records": [
-                            {
-                                "s3": {
-                                    "bucket": {
-                                        "name": BUCKET
-                                    },
-                                    "object": {
-                                        "key": key
-                                    }
-                                }
+class ListingStoppedException(Exception):
+    pass
+
+
+class ListingStats:
+    '''Counters of the listing threads, reported as a listing rate at the end of the run.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.objects = 0
+        self.keys = 0
+        self.shards = 0
+        self.start = time.time()
+        self.end = None
+
+    def record(self, objects, keys):
+        with self.lock:
+            self.pages += 1
+            self.objects += objects
+            self.keys += keys
+
+    def report(self):
+        elapsed = max((self.end or time.time()) - self.start, 1e-9)
+        msg = 'Listed {} objects ({} to publish) in {} pages across {} shards in {:.1f} seconds: '
+        msg += '{:.0f} objects/s, {:.1f} pages/s.'
+        return msg.format(self.objects, self.keys, self.pages, self.shards, elapsed,
+                          self.objects / elapsed, self.pages / elapsed)
+
+
+def queue_key(key, page, etag=None):
+    '''Put a key on the publishing queue. Blocks while the publishers are behind, so memory
+       use stays bounded, unless the run is being stopped.'''
+    while not stopping.is_set():
+        try:
+            keys_queue.put((key, page, etag), timeout=0.5)
+            return
+        except queue.Full:
+            pass
+    raise ListingStoppedException('The run was stopped.')
+
+
+def list_shard(shard_index):
+    '''List a shard from its checkpoint, queueing the keys that have one of the ENDINGS.'''
+    shard = checkpoint.state['shards'][shard_index]
+    watermark = shard['watermark']
+    kwargs = {'Bucket': BUCKET, 'RequestPayer': 'requester', 'Prefix': shard['prefix']}
+    if shard['delimiter']:
+        kwargs['Delimiter'] = shard['delimiter']
+    # continue from the first page that was not fully published, skipping the keys published before
+    if shard['token']:
+        kwargs['ContinuationToken'] = shard['token']
+    elif watermark:
+        kwargs['StartAfter'] = watermark
+    while not stopping.is_set():
+        # responses come in batches of 1,000 or less
+        s3_response = s3_client.list_objects_v2(**kwargs)
+        contents = s3_response.get('Contents', [])
+        # S3 event notifications carry the ETag without its quotes
+        etags = {content['Key']: content.get('ETag', '').strip('"') or None for content in contents}
+        keys = [content['Key'] for content in contents
+                if any([content['Key'].endswith(ending) for ending in ENDINGS])
+                and (watermark is None or content['Key'] > watermark)]
+        next_token = s3_response.get('NextContinuationToken')
+        page = checkpoint.add_page(shard_index, next_token, contents[-1]['Key'] if contents else None, keys)
+        for key in keys:
+            queue_key(key, page, etags[key])
+        stats.record(len(contents), len(keys))
+        if next_token is None:
+            break
+        kwargs['ContinuationToken'] = next_token
+
+
+def get_image_id(key):
+    return key.rpartition('.')[0].split('/')[-1]
+
+
+def get_unprocessed(keys):
+    '''Consistently look up the images of keys in the upload history table with BatchGetItem.
+       Function returns the keys of the images that are not in it, i.e. neither classified
+       nor claimed by an execution classifying them.'''
+    image_ids = list({get_image_id(key) for key in keys})
+    items = batch_get_items(db_resource, UPLOAD_HISTORY_TABLE, [{'IMAGE ID': image_id} for image_id in image_ids],
+                            ProjectionExpression='#img_id', ExpressionAttributeNames={'#img_id': 'IMAGE ID'})
+    found = {item['IMAGE ID'] for item in items}
+    return [key for key in keys if get_image_id(key) not in found]
+
+
+def list_inventory_file(shard_index):
+    '''Stream a data file of the inventory report from its checkpoint, queueing the keys under
+       PREFIX that have one of the ENDINGS and, if UPLOAD_HISTORY_TABLE is set, are not in it.'''
+    shard = checkpoint.state['shards'][shard_index]
+    pages = iter_pages(shard['file'], shard['format'], shard['schema'], s3_client, int(shard['token'] or 0))
+    for row_number, is_last, rows in pages:
+        if stopping.is_set():
+            break
+        keys = [key for bucket, key in rows
+                if bucket == BUCKET and key.startswith(PREFIX)
+                and any([key.endswith(ending) for ending in ENDINGS])]
+        if UPLOAD_HISTORY_TABLE and keys:
+            keys = get_unprocessed(keys)
+        page = checkpoint.add_page(shard_index, None if is_last else str(row_number), None, keys)
+        for key in keys:
+            queue_key(key, page)
+        stats.record(len(rows), len(keys))
+
+
+def expand_prefix(prefix):
+    '''List one "/" level of a prefix. Function returns the prefixes one level down.'''
+    kwargs = {'Bucket': BUCKET, 'RequestPayer': 'requester', 'Prefix': prefix, 'Delimiter': '/'}
+    prefixes = []
+    while True:
+        s3_response = s3_client.list_objects_v2(**kwargs)
+        stats.record(0, 0)
+        prefixes.extend(common_prefix['Prefix'] for common_prefix in s3_response.get('CommonPrefixes', []))
+        if 'NextContinuationToken' not in s3_response:
+            return prefixes
+        kwargs['ContinuationToken'] = s3_response['NextContinuationToken']
+
+
+def discover_shards(executor):
+    '''Discover the prefix fan-out SHARD_DEPTH levels below PREFIX. Function returns the
+       (prefix, delimiter) of every shard: the prefixes SHARD_DEPTH levels down, listed in full,
+       and the prefixes above them, listed with a "/" delimiter for the objects directly under them.'''
+    prefixes = [PREFIX]
+    shards = []
+    for _ in range(SHARD_DEPTH):
+        shards.extend((prefix, '/') for prefix in prefixes)
+        prefixes = [prefix for level in executor.map(expand_prefix, prefixes) for prefix in level]
+    return shards + [(prefix, '') for prefix in prefixes]
+
+
+def list_bucket():
+    '''Discover the shards of the bucket, or the data files of the inventory report, unless resuming,
+       then list the unfinished ones concurrently.'''
+    with ThreadPoolExecutor(max_workers=LIST_WORKERS) as executor:
+        if checkpoint.state['shards'] is None:
+            if MANIFEST:
+                checkpoint.set_files(read_manifest(MANIFEST, s3_client))
+            else:
+                checkpoint.set_shards(discover_shards(executor))
+            checkpoint.save()
+        shard_indexes = [index for index, shard in enumerate(checkpoint.state['shards']) if not shard['done']]
+        stats.shards = len(shard_indexes)
+        # consume the results so that an exception of a listing thread is raised
+        list(executor.map(list_inventory_file if MANIFEST else list_shard, shard_indexes))
+
+
+def queue_failures(failures):
+    '''Queue the keys that failed in the saved run, instead of listing the bucket.'''
+    for key in failures:
+        queue_key(key, None)
+    stats.keys = len(failures)
+
+
+def run_listing(target):
+    global listing_error
+    try:
+        target()
+    except Exception as error:
+        listing_error = error
+    finally:
+        stats.end = time.time()
+        # tell every publisher that no more keys are coming
+        for _ in range(PUBLISHERS):
+            keys_queue.put(None)
+
+
+def get_message(key, etag=None):
+    message = {
+                "Records": [
+                    {
+                        "s3": {
+                            "bucket": {
+                                "name": BUCKET
+                            },
+                            "object": {
+                                "key": key,
+                                "eTag": etag
                             }
-                        ]
+                        }
                     }
-                    
-            sns_response = sns_client.publish(
-              TopicArn=TOPIC_ARN,
-              Message=json.dumps(message)
-            )
-                        
-            if sns_response['ResponseMetadata']['HTTPStatusCode'] == 200:
-                print('\rMessage #{} - "{}" - published to SNS topic.'.format(cnt, key), end='')
-                sys.stdout.flush()
-                cnt += 1
-            else:
-                unsuccessful_msg_keys.append(key)
-            # include a time buffer to prevent pipeline overload
-            time.sleep(DELAY)
+                ]
+            }
+    return json.dumps(message)
+
+
+def next_batch():
+    '''Take up to 10 (key, page, etag) items off the queue, waiting briefly for a batch to fill up.
+       Function returns the items, and whether the listing is done.'''
+    items = [keys_queue.get()]
+    while items[-1] is not None and len(items) < MAX_BATCH_PUBLISH_ENTRIES:
+        try:
+            items.append(keys_queue.get(timeout=0.05))
+        except queue.Empty:
+            break
+    if items[-1] is None:
+        return items[:-1], True
+    return items, False
+
+
+def run_publisher():
+    done = False
+    while not done:
+        items, done = next_batch()
+        if not items:
+            continue
+        failed = {index for index, _ in publisher.publish([get_message(key, etag) for key, _, etag in items])}
+        for index, (key, page, _) in enumerate(items):
+            checkpoint.done(page, key, failed=index in failed)
+        print('\rMessage #{} - "{}" - published to SNS topic.'.format(checkpoint.state['published'],
+                                                                       items[-1][0]), end='')
+        sys.stdout.flush()
+        checkpoint.maybe_save()
 
 
 if __name__ == '__main__':
@@ -55,33 +275,79 @@ if __name__ == '__main__':
     PROFILE = args.profile
     BUCKET = args.bucket
     TOPIC_ARN = args.topic_arn
-    DELAY = args.delay
-    assert(DELAY >= 0.0), 'Time delay value must be numeric value >= 0.0'
+    if args.delay is not None:
+        assert(args.delay >= 0.0), 'Time delay value must be numeric value >= 0.0'
+        args.rate = 1.0 / args.delay if args.delay else 0.0
+    RATE = args.rate
+    PUBLISHERS = args.publishers
+    PREFIX = args.prefix
+    SHARD_DEPTH = args.shard_depth
+    LIST_WORKERS = args.list_workers
+    MANIFEST = args.manifest
+    UPLOAD_HISTORY_TABLE = args.upload_history_table
+    assert(RATE >= 0.0), 'Rate must be numeric value >= 0.0'
+    assert(PUBLISHERS >= 1), 'Number of publishers must be an integer >= 1'
+    assert(SHARD_DEPTH >= 0), 'Shard depth must be an integer >= 0'
+    assert(LIST_WORKERS >= 1), 'Number of list workers must be an integer >= 1'
     # the endings of file names to keep
     ENDINGS = ['flt.fits',
                'flc.fits']
-    
+
     sess = boto3.Session(region_name=REGION,
                          profile_name=PROFILE)
     s3_client = sess.client('s3')
     sns_client = sess.client('sns')
-    step_client = sess.client('stepfunctions')
-    s3_response = s3_client.list_objects_v2(Bucket=BUCKET,
-                                            RequestPayer='requester')
+    db_resource = sess.resource('dynamodb')
+
+    if args.resume or args.retry_failures:
+        checkpoint = Checkpoint.load(args.state_file, BUCKET, PREFIX, args.checkpoint_interval, MANIFEST)
+    else:
+        checkpoint = Checkpoint(args.state_file, BUCKET, PREFIX, args.checkpoint_interval, MANIFEST)
+    published_before = checkpoint.state['published']
+    if args.retry_failures:
+        failures = checkpoint.state['failed']
+        # keys that fail again are recorded anew
+        checkpoint.state['failed'] = []
+        target = lambda: queue_failures(failures)
+    else:
+        target = list_bucket
 
+    # keys are streamed from the listing threads to the publishers as the shards are listed
+    keys_queue = queue.Queue(maxsize=args.queue_size)
+    stopping = threading.Event()
+    stats = ListingStats()
+    listing_error = None
+    # the rate limit is shared by every publisher, and applies to retried messages too
+    publisher = BatchPublisher(sns_client, TOPIC_ARN, TokenBucket(RATE), args.max_attempts)
+    listing_thread = threading.Thread(target=run_listing, args=(target,), daemon=True)
+    listing_thread.start()
 
-    cnt = 1
-    unsuccessful_msg_keys = []
     # run through all objects in the bucket, then SNS topic subscription will take over
-    while 'NextContinuationToken' in s3_response.keys():
-        # responses come in batches of 1,000 or less
-        token = s3_response['NextContinuationToken']
-        publish_messages(s3_response['Contents'])
-        # get a new batch of 1,000 responses
-        s3_response = s3_client.list_objects_v2(Bucket=BUCKET,
-                                                RequestPayer='requester',
-                                                ContinuationToken=token)
-    publish_messages(s3_response['Contents'])
+    publish_start = time.time()
+    publisher_threads = [threading.Thread(target=run_publisher, daemon=True) for _ in range(PUBLISHERS)]
+    for thread in publisher_threads:
+        thread.start()
+    try:
+        for thread in publisher_threads:
+            thread.join()
+        listing_thread.join()
+    except KeyboardInterrupt:
+        # keys being published when interrupted are published again when resuming
+        stopping.set()
+        checkpoint.save()
+        print('\nStopped. Progress saved to {}; continue with --resume.'.format(args.state_file))
+        sys.exit(1)
+    publish_elapsed = time.time() - publish_start
+    checkpoint.save()
+
+    published = checkpoint.state['published'] - published_before
+    print('\n' + stats.report())
+    print('Published {} messages in {:.1f} seconds: {:.1f} messages/s.'.format(
+        published, publish_elapsed, published / max(publish_elapsed, 1e-9)))
+    if listing_error is not None:
+        print('Listing stopped early: {}'.format(listing_error))
+        print('Progress saved to {}; continue with --resume.'.format(args.state_file))
+    unsuccessful_msg_keys = checkpoint.state['failed']
     msg = '\nThere were {} unsuccessfully published messages.\n'.format(len(unsuccessful_msg_keys))
     print(msg + '=' * (len(msg)-2) + '\nKEYS:')
     if len(unsuccessful_msg_keys):
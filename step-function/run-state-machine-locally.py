@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda-scripts'))
+from state_machine_executions import get_state_machine_input
+
+
+parser = argparse.ArgumentParser(description='Run a state machine definition locally against the lambda handlers and report throughput.')
+parser.add_argument('definition', type=str, help='Path to the state machine definition (e.g. batch-state-machine.json).')
+parser.add_argument('manifest', type=str, help='Path to a file of S3 keys to classify, one per line.')
+parser.add_argument('bucket', type=str, help='Name of the bucket storing the objects listed in the manifest.')
+parser.add_argument('-c', '--max_concurrency', type=int, default=10, metavar='',
+                    help='Maximum number of images processed at the same time by a Map state; 0 means no limit (default: 10).')
+parser.add_argument('-b', '--backend', type=str, default='sagemaker', choices=['sagemaker', 'automl', 'onnx'], metavar='',
+                    help='Backend of the "Classify Image" task: sagemaker, automl, or onnx (default: sagemaker).')
+parser.add_argument('-s', '--simulate', type=float, default=None, metavar='',
+                    help='Replace every task by a pass-through that sleeps this many seconds, to measure orchestration '
+                         'throughput without AWS (default: run the real handlers).')
+
+LAMBDA_SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda-scripts')
+# lambda (folder in lambda-scripts) that backs each Task state
+TASK_LAMBDAS = {'Duplicate Upload Check': 'check_for_duplicate_upload',
+                'Classify Image': 'classify_image',
+                'Copy and Delete Image': 'copy_and_delete_image',
+                'Log to DynamoDB': 'log_to_dynamodb',
+                'Log Error': 'log_error',
+                'Release Execution Lease': 'release_execution_lease'}
+
+transitions = 0
+transitions_lock = threading.Lock()
+
+
+def load_handler(task_name, backend='sagemaker', simulate=None):
+    '''Import the lambda_handler of the lambda that backs a Task state, with backend as the lambda of
+       "Classify Image"; if simulate is set, a pass-through that sleeps that many seconds instead.'''
+    if simulate is not None:
+        def handler(event, context):
+            time.sleep(simulate)
+            return event
+        return handler
+    lambda_name = TASK_LAMBDAS[task_name]
+    if lambda_name == 'classify_image':
+        lambda_name = os.path.join(lambda_name, backend)
+    lambda_folder = os.path.join(LAMBDA_SCRIPTS, lambda_name)
+    lambda_path = os.path.join(lambda_folder, 'lambda_function.py')
+    # the classify_image lambdas import the shared fits_preprocessing package, the logging
+    # lambdas the shared dynamodb_batch_writer module, and the lease lambdas execution_leases;
+    # a lambda may also import modules from its own folder (e.g. bloom_filter)
+    sys.path.insert(0, os.path.join(LAMBDA_SCRIPTS, 'classify_image'))
+    sys.path.insert(0, LAMBDA_SCRIPTS)
+    sys.path.insert(0, lambda_folder)
+    spec = importlib.util.spec_from_file_location(lambda_name.replace(os.sep, '_'), lambda_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.lambda_handler
+
+
+def get_path(data, path):
+    '''Resolve a simple reference path such as "$" or "$.images".'''
+    for name in path.split('.')[1:]:
+        data = data[name]
+    return data
+
+
+def set_path(data, path, value):
+    '''Place value in data at a simple reference path; "$" replaces data entirely and a null
+       path (ResultPath null) discards value.'''
+    if path is None:
+        return data
+    names = path.split('.')[1:]
+    if not names:
+        return value
+    target = data
+    for name in names[:-1]:
+        target = target.setdefault(name, {})
+    target[names[-1]] = value
+    return data
+
+
+def error_matches(error_equals, error):
+    return 'States.ALL' in error_equals or type(error).__name__ in error_equals
+
+
+def choice_matches(choice, data):
+    '''Evaluate a Choice rule that compares a variable to a constant.'''
+    try:
+        value = get_path(data, choice['Variable'])
+    except (KeyError, TypeError):
+        return False
+    for comparison in ['BooleanEquals', 'StringEquals', 'NumericEquals']:
+        if comparison in choice:
+            return value == choice[comparison]
+    raise NotImplementedError('Choice rule {} is not supported locally.'.format(choice))
+
+
+def get_error_info(error):
+    '''Describe an exception the way Step Functions passes a Lambda error to a Catch.'''
+    cause = {'errorType': type(error).__name__, 'errorMessage': str(error)}
+    return {'Error': cause['errorType'], 'Cause': json.dumps(cause)}
+
+
+def run_task(state_name, state, data, handlers):
+    '''Invoke the handler of a Task state, applying its Retry policies.'''
+    attempts = {}
+    while True:
+        try:
+            # lambdas receive a JSON copy of the state input
+            return handlers[state_name](json.loads(json.dumps(data)), None)
+        except Exception as error:
+            retriers = [retrier for retrier in state.get('Retry', [])
+                        if error_matches(retrier['ErrorEquals'], error)]
+            if not retriers:
+                raise
+            retrier = retriers[0]
+            attempt = attempts.get(id(retrier), 0)
+            if attempt >= retrier.get('MaxAttempts', 3):
+                raise
+            attempts[id(retrier)] = attempt + 1
+            time.sleep(retrier.get('IntervalSeconds', 1) * retrier.get('BackoffRate', 2.0) ** attempt)
+
+
+def run_states(machine, data, handlers):
+    '''Run the states of a state machine (or of a Map iterator) starting at StartAt.'''
+    global transitions
+    state_name = machine['StartAt']
+    while True:
+        with transitions_lock:
+            transitions += 1
+        state = machine['States'][state_name]
+        if state['Type'] == 'Task':
+            try:
+                data = set_path(data, state.get('ResultPath', '$'), run_task(state_name, state, data, handlers))
+            except Exception as error:
+                catchers = [catcher for catcher in state.get('Catch', [])
+                            if error_matches(catcher['ErrorEquals'], error)]
+                if not catchers:
+                    raise
+                data = set_path(data, catchers[0].get('ResultPath', '$'), get_error_info(error))
+                state_name = catchers[0]['Next']
+                continue
+        elif state['Type'] == 'Map':
+            items = get_path(data, state.get('ItemsPath', '$'))
+            if 'MaxConcurrencyPath' in state:
+                max_concurrency = get_path(data, state['MaxConcurrencyPath'])
+            else:
+                max_concurrency = state.get('MaxConcurrency', 0)
+            with ThreadPoolExecutor(max_workers=max_concurrency or max(len(items), 1)) as executor:
+                results = list(executor.map(lambda item: run_states(state['Iterator'], item, handlers), items))
+            data = set_path(data, state.get('ResultPath', '$'), results)
+        elif state['Type'] == 'Choice':
+            state_name = state.get('Default')
+            for choice in state['Choices']:
+                if choice_matches(choice, data):
+                    state_name = choice['Next']
+                    break
+            continue
+        elif state['Type'] == 'Pass':
+            pass
+        elif state['Type'] == 'Succeed':
+            return data
+        else:
+            raise NotImplementedError('State type "{}" is not supported locally.'.format(state['Type']))
+        if state.get('End'):
+            return data
+        state_name = state['Next']
+
+
+def count_failures(results):
+    '''Function returns the number of executions that went through "Log Error", which leaves the
+       error-info in their output.'''
+    return sum(1 for result in results if isinstance(result, dict) and 'error-info' in result)
+
+
+def get_task_names(machine):
+    '''Names of all Task states of a state machine, including those inside Map iterators.'''
+    names = []
+    for name, state in machine['States'].items():
+        if state['Type'] == 'Task':
+            names.append(name)
+        elif state['Type'] == 'Map':
+            names.extend(get_task_names(state['Iterator']))
+    return names
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    with open(args.definition) as definition_file:
+        definition = json.load(definition_file)
+    with open(args.manifest) as manifest:
+        keys = [line.strip() for line in manifest if line.strip()]
+    # the inputs start_state_machine builds for the objects it would process
+    images = [state_machine_input for state_machine_input, problems in
+              (get_state_machine_input(args.bucket, key) for key in keys) if not problems]
+    handlers = {name: load_handler(name, args.backend, args.simulate) for name in set(get_task_names(definition))}
+
+    start = time.perf_counter()
+    if any(state['Type'] == 'Map' for state in definition['States'].values()):
+        # one execution for the whole batch
+        executions = 1
+        output = run_states(definition, {'images': images, 'max_concurrency': args.max_concurrency}, handlers)
+        results = output['images']
+    else:
+        # one execution per image, as started by start_state_machine
+        executions = len(images)
+        with ThreadPoolExecutor(max_workers=args.max_concurrency or max(len(images), 1)) as executor:
+            results = list(executor.map(lambda image: run_states(definition, image, handlers), images))
+    elapsed = time.perf_counter() - start
+
+    failures = count_failures(results)
+    print('Images processed : {} ({} failed)'.format(len(images), failures))
+    print('Executions       : {}'.format(executions))
+    print('State transitions: {}'.format(transitions))
+    print('Elapsed time     : {:.2f} s'.format(elapsed))
+    print('Throughput       : {:.2f} images/s'.format(len(images) / elapsed if elapsed else 0.0))
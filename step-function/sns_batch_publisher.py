@@ -0,0 +1,82 @@
+'''Batched, rate-limited SNS publishing used by process-existing-bucket-objects.py.'''
+import time
+import random
+import threading
+
+
+# largest number of entries in one PublishBatch call
+MAX_BATCH_PUBLISH_ENTRIES = 10
+
+
+class TokenBucket:
+    '''Thread-safe rate limiter: acquire blocks until the requested number of tokens is
+       available. Tokens are added at rate per second, up to burst; a rate of 0 means no limit.'''
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(burst or rate, MAX_BATCH_PUBLISH_ENTRIES)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BatchPublisher:
+    '''Publish messages to an SNS topic with PublishBatch, 10 entries per call. Entries that
+       fail for a reason other than the request itself (throttling, internal errors) are
+       retried on their own with jittered exponential backoff. Safe to share between threads.'''
+    def __init__(self, sns_client, topic_arn, rate_limiter=None, max_attempts=5,
+                 base_delay=0.1, max_delay=5.0):
+        self.sns_client = sns_client
+        self.topic_arn = topic_arn
+        self.rate_limiter = rate_limiter
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def publish(self, messages):
+        '''Publish up to 10 messages. Function returns the (index, reason) of every message
+           that could not be published after max_attempts.'''
+        pending = {str(index): message for index, message in enumerate(messages)}
+        # entries rejected for good, and the last reason each pending entry failed
+        failed = {}
+        reasons = {}
+        for attempt in range(self.max_attempts):
+            if not pending:
+                break
+            if attempt:
+                # full jitter backoff before retrying the failed entries
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(len(pending))
+            entries = [{'Id': entry_id, 'Message': message} for entry_id, message in pending.items()]
+            try:
+                response = self.sns_client.publish_batch(TopicArn=self.topic_arn,
+                                                         PublishBatchRequestEntries=entries)
+            except Exception as error:
+                # the whole call failed (e.g. a network error); every entry is retried
+                reasons = {entry_id: str(error) for entry_id in pending}
+                continue
+            for entry in response.get('Successful', []):
+                pending.pop(entry['Id'], None)
+            for entry in response.get('Failed', []):
+                reasons[entry['Id']] = '{}: {}'.format(entry.get('Code'), entry.get('Message'))
+                if entry.get('SenderFault'):
+                    # the entry itself is invalid, so retrying it would fail again
+                    pending.pop(entry['Id'], None)
+                    failed[entry['Id']] = reasons[entry['Id']]
+        for entry_id in pending:
+            failed[entry_id] = reasons.get(entry_id, 'not published')
+        return sorted((int(entry_id), reason) for entry_id, reason in failed.items())
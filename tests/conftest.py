@@ -0,0 +1,80 @@
+'''Shared setup of the tests: AWS services are replaced by moto, and the lambdas are imported
+from their folders the way run-state-machine-locally.py does.'''
+import os
+import sys
+import json
+import importlib.util
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LAMBDA_SCRIPTS = os.path.join(ROOT, 'step-function', 'lambda-scripts')
+CLASSIFY_IMAGE = os.path.join(LAMBDA_SCRIPTS, 'classify_image')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, LAMBDA_SCRIPTS)
+sys.path.insert(0, CLASSIFY_IMAGE)
+
+# never reach a real account
+os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+os.environ['AWS_SESSION_TOKEN'] = 'testing'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+@pytest.fixture
+def aws():
+    '''Mock every AWS service for the duration of a test.'''
+    from moto import mock_aws
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def load_lambda(monkeypatch):
+    '''Function imports the lambda_function.py of a folder of lambda-scripts, with the given
+       environment variables set while its module-level code runs.'''
+    def load(name, **environment):
+        for key, value in environment.items():
+            monkeypatch.setenv(key, value)
+        path = os.path.join(LAMBDA_SCRIPTS, name, 'lambda_function.py')
+        spec = importlib.util.spec_from_file_location(name.replace('/', '_') + '_lambda_function', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return load
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    '''Function returns run-state-machine-locally.py imported as a module; the lambda folders it
+       adds to sys.path are removed after the test.'''
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+    path = os.path.join(ROOT, 'step-function', 'run-state-machine-locally.py')
+    spec = importlib.util.spec_from_file_location('run_state_machine_locally', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_table(name, key, key_type='S'):
+    '''Create a DynamoDB table with a single partition key. Function returns the table.'''
+    import boto3
+    db_resource = boto3.resource('dynamodb')
+    return db_resource.create_table(TableName=name,
+                                    KeySchema=[{'AttributeName': key, 'KeyType': 'HASH'}],
+                                    AttributeDefinitions=[{'AttributeName': key, 'AttributeType': key_type}],
+                                    BillingMode='PAY_PER_REQUEST')
+
+
+class Context:
+    '''Stand-in for the Lambda context, with a fixed remaining time.'''
+    def __init__(self, remaining_time_in_millis):
+        self.remaining_time_in_millis = remaining_time_in_millis
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_time_in_millis
+
+
+def get_notification(*keys):
+    '''Function returns an SNS event carrying an S3 notification of the keys.'''
+    message = {'Records': [{'s3': {'bucket': {'name': 'stpubdata'}, 'object': {'key': key}}} for key in keys]}
+    return {'Records': [{'Sns': {'Message': json.dumps(message)}}]}
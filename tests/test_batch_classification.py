@@ -0,0 +1,68 @@
+import boto3
+import pytest
+from conftest import create_table
+
+CLASSIFICATION = {'probabilities': {'DEEP': '0.9', 'STARS': '0.1'}, 'predicted_class': 'DEEP'}
+
+
+def get_images(*image_ids):
+    return [{'image_id': image_id, 's3': {'bucket': 'stpubdata', 'key': image_id + '.fits'}}
+            for image_id in image_ids]
+
+
+@pytest.fixture
+def sagemaker(aws, load_lambda, monkeypatch):
+    boto3.client('s3').create_bucket(Bucket='classified')
+    module = load_lambda('classify_image/sagemaker', ENDPOINT_NAME='model', DESTINATION_BUCKET='classified',
+                         CLASSES='DEEP,STARS')
+
+    def preprocess_image(event):
+        if event['image_id'] == 'unreadable_flt':
+            raise OSError('not a FITS file')
+        return {'TARGNAME': 'NGC 1300'}, b'jpeg', event['image_id'], b'archive'
+
+    def get_classification(content):
+        return CLASSIFICATION
+
+    monkeypatch.setattr(module, 'preprocess_image', preprocess_image)
+    monkeypatch.setattr(module, 'get_classification', get_classification)
+    return module
+
+
+def test_failed_images_do_not_fail_the_batch(sagemaker, monkeypatch):
+    original_upload = sagemaker.upload_image
+
+    def upload_image(event, content, classification):
+        if event['image_id'] == 'unwritable_flt':
+            raise PermissionError('access denied')
+        original_upload(event, content, classification)
+
+    monkeypatch.setattr(sagemaker, 'upload_image', upload_image)
+    events = sagemaker.lambda_handler(get_images('first_flt', 'unreadable_flt', 'unwritable_flt', 'last_flt'), None)
+    assert [event['image_id'] for event in events] == ['first_flt', 'unreadable_flt', 'unwritable_flt', 'last_flt']
+    for event in events[::3]:
+        assert event['classification'] == CLASSIFICATION and 'error-info' not in event
+    assert events[1]['error-info']['Error'] == 'OSError' and 'metadata' not in events[1]
+    # classified, but not uploaded
+    assert events[2]['error-info']['Error'] == 'PermissionError' and 'classification' not in events[2]
+    s3_client = boto3.client('s3')
+    assert sorted(item['Key'] for item in s3_client.list_objects_v2(Bucket='classified')['Contents']) == \
+        ['first_flt', 'last_flt']
+
+
+def test_batch_output_accepted_downstream(sagemaker, load_lambda):
+    events = sagemaker.lambda_handler(get_images('first_flt', 'unreadable_flt'), None)
+    copy_and_delete = load_lambda('copy_and_delete_image', DESTINATION_BUCKET='classified')
+    events = copy_and_delete.lambda_handler(events, None)
+    s3_client = boto3.client('s3')
+    assert [item['Key'] for item in s3_client.list_objects_v2(Bucket='classified')['Contents']] == ['DEEP/first_flt']
+
+    classifications = create_table('classifications', 'IMAGE ID')
+    upload_history = create_table('upload-history', 'IMAGE ID')
+    errors = create_table('errors', 'IMAGE ID')
+    load_lambda('log_to_dynamodb', IMAGE_CLASSIFICATIONS_TABLE='classifications',
+                UPLOAD_HISTORY_TABLE='upload-history').lambda_handler(events, None)
+    load_lambda('log_error', ERROR_TABLE='errors').lambda_handler(events, None)
+    assert [item['IMAGE ID'] for item in classifications.scan()['Items']] == ['first_flt']
+    assert [item['IMAGE ID'] for item in upload_history.scan()['Items']] == ['first_flt']
+    assert [item['IMAGE ID'] for item in errors.scan()['Items']] == ['unreadable_flt']
@@ -0,0 +1,38 @@
+import boto3
+from conftest import create_table
+from batch_get import MAX_BATCH_GET_KEYS, batch_get_items
+
+
+class ThrottledResource:
+    '''Stand-in for a DynamoDB resource returning the last key of each request as unprocessed once.'''
+    def __init__(self, items):
+        self.items = items
+        self.requests = []
+
+    def batch_get_item(self, RequestItems):
+        (table_name, request), = RequestItems.items()
+        self.requests.append(len(request['Keys']))
+        processed, unprocessed = request['Keys'][:-1] or request['Keys'], request['Keys'][-1:]
+        response = {'Responses': {table_name: [self.items[key['IMAGE ID']] for key in processed
+                                               if key['IMAGE ID'] in self.items]}}
+        if len(request['Keys']) > 1:
+            response['UnprocessedKeys'] = {table_name: dict(request, Keys=unprocessed)}
+        return response
+
+
+def test_keys_are_requested_in_batches(aws):
+    table = create_table('upload-history', 'IMAGE ID')
+    for index in range(0, 250, 2):
+        table.put_item(Item={'IMAGE ID': 'image{}_flt'.format(index)})
+    keys = [{'IMAGE ID': 'image{}_flt'.format(index)} for index in range(250)]
+    items = batch_get_items(boto3.resource('dynamodb'), 'upload-history', keys, ConsistentRead=True)
+    assert sorted(item['IMAGE ID'] for item in items) == sorted(key['IMAGE ID'] for key in keys[::2])
+
+
+def test_unprocessed_keys_are_requested_again(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda delay: None)
+    db_resource = ThrottledResource({'a': {'IMAGE ID': 'a'}, 'b': {'IMAGE ID': 'b'}})
+    keys = [{'IMAGE ID': image_id} for image_id in ['c'] * (MAX_BATCH_GET_KEYS - 1) + ['a', 'b']]
+    items = list(batch_get_items(db_resource, 'upload-history', keys, ProjectionExpression='#img_id'))
+    assert items == [{'IMAGE ID': 'a'}, {'IMAGE ID': 'b'}]
+    assert db_resource.requests == [MAX_BATCH_GET_KEYS, 1, 1]
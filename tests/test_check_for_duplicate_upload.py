@@ -0,0 +1,77 @@
+import os
+import time
+import boto3
+import pytest
+from conftest import LAMBDA_SCRIPTS
+from date_index import get_date_partitions, get_date_shard
+
+SHARDS = 4
+
+
+@pytest.fixture
+def upload_history(aws, monkeypatch):
+    monkeypatch.syspath_prepend(os.path.join(LAMBDA_SCRIPTS, 'check_for_duplicate_upload'))
+    boto3.client('s3').create_bucket(Bucket='snapshots')
+    return boto3.resource('dynamodb').create_table(
+        TableName='upload-history',
+        KeySchema=[{'AttributeName': 'IMAGE ID', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'IMAGE ID', 'AttributeType': 'S'},
+                              {'AttributeName': 'DATE SHARD', 'AttributeType': 'S'},
+                              {'AttributeName': 'TIMESTAMP ADDED TO TABLE', 'AttributeType': 'N'}],
+        GlobalSecondaryIndexes=[{'IndexName': 'date-index',
+                                 'KeySchema': [{'AttributeName': 'DATE SHARD', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'TIMESTAMP ADDED TO TABLE', 'KeyType': 'RANGE'}],
+                                 'Projection': {'ProjectionType': 'KEYS_ONLY'}}],
+        BillingMode='PAY_PER_REQUEST')
+
+
+def log_upload(table, image_id):
+    now = int(time.time())
+    date = time.strftime('%Y-%m-%d', time.gmtime(now))
+    table.put_item(Item={'IMAGE ID': image_id, 'DATE ADDED TO TABLE': date,
+                         'DATE SHARD': get_date_shard(date, image_id, SHARDS),
+                         'TIMESTAMP ADDED TO TABLE': now})
+
+
+def load_check(load_lambda):
+    return load_lambda('check_for_duplicate_upload', UPLOAD_HISTORY_TABLE='upload-history',
+                       UPLOAD_HISTORY_DATE_INDEX='date-index', UPLOAD_HISTORY_DATE_SHARDS=str(SHARDS),
+                       FILTER_SNAPSHOT_BUCKET='snapshots', EXPECTED_IMAGES='1000')
+
+
+def test_date_partitions_cover_every_shard_of_every_day():
+    day = 24 * 3600
+    assert get_date_partitions(0, day) == ['1970-01-01', '1970-01-02']
+    assert get_date_partitions(0, 0, 2) == ['1970-01-01#0', '1970-01-01#1']
+    assert get_date_shard('1970-01-01', 'idpya7i2q_flt', 2) in ('1970-01-01#0', '1970-01-01#1')
+
+
+def test_cold_container_loads_snapshot_and_refreshes_from_sharded_index(upload_history, load_lambda,
+                                                                         monkeypatch):
+    log_upload(upload_history, 'first_flt')
+    first = load_check(load_lambda)
+    event = first.lambda_handler([{'image_id': 'first_flt'}, {'image_id': 'new_flt'}], None)
+    assert [image['is_duplicate'] for image in event] == [True, False]
+    assert boto3.client('s3').head_object(Bucket='snapshots',
+                                          Key='check_for_duplicate_upload/filter.bin')['Metadata']['watermark']
+
+    # logged after the snapshot, so only found by refreshing from the index
+    log_upload(upload_history, 'second_flt')
+    second = load_check(load_lambda)
+    monkeypatch.setattr(second.upload_history_table, 'scan', None)
+    event = second.lambda_handler([{'image_id': 'first_flt'}, {'image_id': 'second_flt'}], None)
+    assert [image['is_duplicate'] for image in event] == [True, True]
+    assert 'first_flt' in second.image_filter and 'second_flt' in second.image_filter
+
+
+def test_batch_claims_are_written_concurrently(upload_history, load_lambda):
+    check = load_check(load_lambda)
+    images = [{'image_id': 'image{}_flt'.format(index)} for index in range(25)]
+    event = check.lambda_handler(images + [{'image_id': 'image0_flt'}], None)
+    # the repeated image is only classified once
+    assert [image['is_duplicate'] for image in event] == [False] * 25 + [True]
+    tokens = {item['IMAGE ID']: item['CLAIM TOKEN'] for item in upload_history.scan()['Items']}
+    assert tokens == {image['image_id']: event[0]['claim_token'] for image in images}
+    # another execution finds every image claimed
+    event = check.lambda_handler([{'image_id': 'image{}_flt'.format(index)} for index in range(25)], None)
+    assert all(image['is_duplicate'] for image in event)
@@ -0,0 +1,27 @@
+import os
+import sys
+from conftest import LAMBDA_SCRIPTS
+
+sys.path.insert(0, os.path.join(LAMBDA_SCRIPTS, 'classify_image'))
+from classification_results import get_classification_item, get_error_info, isolate_errors
+
+
+def test_predicted_class_has_the_highest_probability():
+    item = get_classification_item(zip(['CLUSTER', 'DEEP', 'NEBULA', 'STARS'], [0.1, 0.6, 0.2, 0.1]))
+    assert item == {'probabilities': {'CLUSTER': '0.1', 'DEEP': '0.6', 'NEBULA': '0.2', 'STARS': '0.1'},
+                    'predicted_class': 'DEEP'}
+
+
+def test_tied_classes_are_concatenated():
+    item = get_classification_item([('CLUSTER', 0.4), ('DEEP', 0.4), ('NEBULA', 0.2)])
+    assert item['predicted_class'] == 'CLUSTER, DEEP'
+
+
+def test_errors_are_isolated_and_described():
+    def fail(value):
+        raise ValueError('bad {}'.format(value))
+    assert isolate_errors(lambda value: value * 2)(3) == (6, None)
+    result, error = isolate_errors(fail)(3)
+    assert result is None
+    assert get_error_info(error) == {'Error': 'ValueError',
+                                     'Cause': '{"errorType": "ValueError", "errorMessage": "bad 3"}'}
@@ -0,0 +1,61 @@
+import os
+import time
+import json
+import boto3
+import pytest
+from classifications_cache import ClassificationsCache, STATE_FILE
+
+KWARGS = {'TableName': 'classifications', 'ProjectionExpression': '#img_id, #ra',
+          'ExpressionAttributeNames': {'#img_id': 'IMAGE ID', '#ra': 'RA_TARG'}}
+COLUMN_TYPES = {'IMAGE ID': 'S', 'RA_TARG': 'N'}
+
+
+@pytest.fixture
+def db_client(aws):
+    db_client = boto3.client('dynamodb')
+    db_client.create_table(
+        TableName='classifications',
+        KeySchema=[{'AttributeName': 'IMAGE ID', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'IMAGE ID', 'AttributeType': 'S'},
+                              {'AttributeName': 'DATE ADDED TO TABLE', 'AttributeType': 'S'},
+                              {'AttributeName': 'TIMESTAMP ADDED TO TABLE', 'AttributeType': 'N'}],
+        GlobalSecondaryIndexes=[{'IndexName': 'date-index',
+                                 'KeySchema': [{'AttributeName': 'DATE ADDED TO TABLE', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'TIMESTAMP ADDED TO TABLE', 'KeyType': 'RANGE'}],
+                                 'Projection': {'ProjectionType': 'ALL'}}],
+        BillingMode='PAY_PER_REQUEST')
+    return db_client
+
+
+def log_classification(db_client, image_id, ra):
+    now = int(time.time())
+    db_client.put_item(TableName='classifications',
+                       Item={'IMAGE ID': {'S': image_id}, 'RA_TARG': {'N': str(ra)},
+                             'DATE ADDED TO TABLE': {'S': time.strftime('%Y-%m-%d', time.gmtime(now))},
+                             'TIMESTAMP ADDED TO TABLE': {'N': str(now)}})
+
+
+def test_sync_queries_new_items_from_date_index(db_client, tmp_path):
+    log_classification(db_client, 'first_flt', 1.5)
+    cache = ClassificationsCache(str(tmp_path), 'classifications')
+    assert cache.sync(db_client, KWARGS, COLUMN_TYPES, segments=2, date_index='date-index') == 1
+    log_classification(db_client, 'second_flt', 2.5)
+    cache = ClassificationsCache(str(tmp_path), 'classifications')
+    assert cache.sync(db_client, KWARGS, COLUMN_TYPES, date_index='date-index') == 2
+    df = cache.read()
+    assert sorted(df['IMAGE ID']) == ['first_flt', 'second_flt']
+    assert len(cache.state['partitions']) == 2
+
+
+def test_changed_column_types_force_full_sync(db_client, tmp_path):
+    log_classification(db_client, 'first_flt', 1.5)
+    cache = ClassificationsCache(str(tmp_path), 'classifications')
+    cache.sync(db_client, KWARGS, {'IMAGE ID': 'S'})
+    stale_partitions = list(cache.state['partitions'])
+    cache = ClassificationsCache(str(tmp_path), 'classifications')
+    assert cache.sync(db_client, KWARGS, COLUMN_TYPES, date_index='date-index') == 1
+    with open(os.path.join(str(tmp_path), STATE_FILE)) as state_file:
+        assert json.load(state_file)['column_types'] == COLUMN_TYPES
+    assert list(cache.read()['RA_TARG']) == [1.5]
+    assert not any(os.path.exists(os.path.join(str(tmp_path), partition)) for partition in stale_partitions
+                   if partition not in cache.state['partitions'])
@@ -0,0 +1,98 @@
+import json
+import boto3
+import pytest
+from conftest import Context, create_table
+from execution_leases import LeaseStore
+
+
+ROLE_ARN = 'arn:aws:iam::123456789012:role/state-machine'
+KEYS = ['hst/public/idpy/idpya7i2q/idpya7i2q_flt.fits', 'hst/public/idpy/idpya7i0q/idpya7i0q_flc.fits']
+
+
+def get_s3_notification(*keys):
+    return json.dumps({'Records': [{'s3': {'bucket': {'name': 'stpubdata'}, 'object': {'key': key}}}
+                                   for key in keys]})
+
+
+def get_sns_envelope(message):
+    return json.dumps({'Type': 'Notification', 'Message': message})
+
+
+@pytest.fixture
+def queue(aws):
+    '''Function sends message bodies to a local queue and returns the SQS event of one receive.'''
+    sqs_client = boto3.client('sqs')
+    queue_url = sqs_client.create_queue(QueueName='ingestion')['QueueUrl']
+    def deliver(*bodies):
+        for body in bodies:
+            sqs_client.send_message(QueueUrl=queue_url, MessageBody=body)
+        response = sqs_client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10, VisibilityTimeout=0)
+        return {'Records': [{'messageId': message['MessageId'], 'receiptHandle': message['ReceiptHandle'],
+                             'body': message['Body'], 'eventSource': 'aws:sqs'}
+                            for message in response['Messages']]}
+    return deliver
+
+
+def create_state_machine(name):
+    definition = {'StartAt': 'Done', 'TimeoutSeconds': 3600, 'States': {'Done': {'Type': 'Succeed'}}}
+    return boto3.client('stepfunctions').create_state_machine(name=name, definition=json.dumps(definition),
+                                                              roleArn=ROLE_ARN)['stateMachineArn']
+
+
+def get_executions(arn):
+    response = boto3.client('stepfunctions').list_executions(stateMachineArn=arn)
+    return response['executions']
+
+
+def get_input(execution):
+    response = boto3.client('stepfunctions').describe_execution(executionArn=execution['executionArn'])
+    return json.loads(response['input'])
+
+
+def test_batch_mode_starts_one_execution_of_valid_distinct_images(queue, load_lambda):
+    arn = create_state_machine('batch')
+    consumer = load_lambda('consume_ingestion_queue', STATE_MACHINE_ARN=arn, MODE='batch', MAX_CONCURRENCY='4')
+    event = queue(get_sns_envelope(get_s3_notification(KEYS[0])),
+                  get_s3_notification(KEYS[0], KEYS[1]),
+                  get_s3_notification('hst/public/idpy/idpya7i2q/idpya7i2q_spt.fits'),
+                  '[]', '"x"', '{"Type": "Notification", "Message": "[1]"}', 'not json')
+    assert len(event['Records']) == 7
+
+    assert consumer.lambda_handler(event, Context(60000)) == {'batchItemFailures': []}
+    execution, = get_executions(arn)
+    execution_input = get_input(execution)
+    assert execution_input['max_concurrency'] == 4
+    assert sorted(image['s3']['key'] for image in execution_input['images']) == sorted(KEYS)
+
+
+def test_batch_mode_fails_every_message_if_not_started(queue, load_lambda):
+    arn = create_state_machine('batch').replace(':batch', ':missing')
+    consumer = load_lambda('consume_ingestion_queue', STATE_MACHINE_ARN=arn, MODE='batch')
+    event = queue(get_s3_notification(KEYS[0]), get_s3_notification(KEYS[1]), '[]')
+    failures = consumer.lambda_handler(event, Context(60000))['batchItemFailures']
+    # the message that is not a notification is dropped rather than retried
+    assert sorted(failure['itemIdentifier'] for failure in failures) == sorted(record['messageId']
+                                                                              for record in event['Records'][:2])
+
+
+def test_single_mode_is_admitted_through_leases(queue, load_lambda):
+    arn = create_state_machine('images')
+    create_table('leases', 'SLOT', 'N')
+    consumer = load_lambda('consume_ingestion_queue', STATE_MACHINE_ARN=arn, MODE='single', LEASE_TABLE='leases',
+                           MAX_CONCURRENT_EXECUTIONS='1', MAX_STARTS_PER_SECOND='1000')
+    event = queue(get_s3_notification(KEYS[0]), get_s3_notification(KEYS[1]))
+
+    # one slot: the second image times out waiting for the first one, and only its message fails
+    failures = consumer.lambda_handler(event, Context(1000))['batchItemFailures']
+    execution, = get_executions(arn)
+    first_key = get_input(execution)['s3']['key']
+    assert get_input(execution)['lease']['owner'] == execution['name']
+    assert [failure['itemIdentifier'] for failure in failures] == [record['messageId'] for record in event['Records']
+                                                                  if first_key not in record['body']]
+
+    # once the first execution released its lease, both messages delivered again start nothing twice
+    lease_store = LeaseStore(boto3.resource('dynamodb').Table('leases'), 1)
+    for slot, owner in lease_store.leases():
+        lease_store.release(slot, owner)
+    assert consumer.lambda_handler(event, Context(60000)) == {'batchItemFailures': []}
+    assert sorted(get_input(execution)['s3']['key'] for execution in get_executions(arn)) == sorted(KEYS)
@@ -0,0 +1,73 @@
+import boto3
+import pytest
+from conftest import create_table
+from dynamodb_batch_writer import BatchWriter, UnprocessedItemsException, MAX_BATCH_WRITE_ITEMS
+
+
+class ThrottledResource:
+    '''DynamoDB resource whose first throttled_calls BatchWriteItem calls leave their last request
+       of each table unprocessed (every call if throttled_calls is None). Records the number of
+       requests of each call.'''
+    def __init__(self, throttled_calls=None):
+        self.db_resource = boto3.resource('dynamodb')
+        self.throttled_calls = throttled_calls
+        self.call_sizes = []
+
+    def batch_write_item(self, RequestItems):
+        self.call_sizes.append(sum(len(requests) for requests in RequestItems.values()))
+        if self.throttled_calls is not None and len(self.call_sizes) > self.throttled_calls:
+            return self.db_resource.batch_write_item(RequestItems=RequestItems)
+        processed = {table_name: requests[:-1] for table_name, requests in RequestItems.items() if requests[:-1]}
+        if processed:
+            self.db_resource.batch_write_item(RequestItems=processed)
+        return {'UnprocessedItems': {table_name: requests[-1:] for table_name, requests in RequestItems.items()}}
+
+
+def count_items(table):
+    return table.scan(Select='COUNT')['Count']
+
+
+def test_requests_written_25_at_a_time_across_tables(aws):
+    classifications = create_table('classifications', 'IMAGE ID')
+    upload_history = create_table('upload-history', 'IMAGE ID')
+    db_resource = ThrottledResource(throttled_calls=0)
+    with BatchWriter(db_resource) as writer:
+        # moto, unlike DynamoDB, rejects a batch with the same key in two tables
+        for index in range(30):
+            writer.put('classifications', {'IMAGE ID': 'c{}'.format(index)})
+            writer.put('upload-history', {'IMAGE ID': 'u{}'.format(index)})
+    assert all(size <= MAX_BATCH_WRITE_ITEMS for size in db_resource.call_sizes)
+    assert sum(db_resource.call_sizes) == 60
+    assert count_items(classifications) == count_items(upload_history) == 30
+
+
+def test_unprocessed_items_retried(aws):
+    table = create_table('classifications', 'IMAGE ID')
+    db_resource = ThrottledResource(throttled_calls=2)
+    with BatchWriter(db_resource, base_delay=0.001) as writer:
+        for index in range(5):
+            writer.put('classifications', {'IMAGE ID': str(index)})
+    assert db_resource.call_sizes == [5, 1, 1]
+    assert count_items(table) == 5
+
+
+def test_unprocessed_items_raise_after_last_attempt(aws):
+    create_table('classifications', 'IMAGE ID')
+    db_resource = ThrottledResource()
+    writer = BatchWriter(db_resource, max_attempts=3, base_delay=0.001)
+    writer.put('classifications', {'IMAGE ID': '0'})
+    with pytest.raises(UnprocessedItemsException):
+        writer.flush()
+    assert len(db_resource.call_sizes) == 3
+
+
+def test_later_put_of_same_key_replaces_earlier_one(aws):
+    table = create_table('classifications', 'IMAGE ID')
+    db_resource = ThrottledResource(throttled_calls=0)
+    with BatchWriter(db_resource) as writer:
+        writer.put('classifications', {'IMAGE ID': 'idpya7i2q_flt', 'PREDICTED CLASS': 'line'})
+        writer.put('classifications', {'IMAGE ID': 'idpya7i2q_flt', 'PREDICTED CLASS': 'no_line'})
+        assert writer.size == 1
+    # a batch writing the same key twice would be rejected by DynamoDB
+    assert db_resource.call_sizes == [1]
+    assert table.get_item(Key={'IMAGE ID': 'idpya7i2q_flt'})['Item']['PREDICTED CLASS'] == 'no_line'
@@ -0,0 +1,33 @@
+import threading
+import boto3
+from conftest import create_table
+from dynamodb_scan import ScanStats, parallel_scan
+
+
+def fill_table(count):
+    table = create_table('classifications', 'IMAGE ID')
+    with table.batch_writer() as writer:
+        for index in range(count):
+            writer.put_item(Item={'IMAGE ID': 'image{:04d}'.format(index), 'RA_TARG': index})
+    return boto3.client('dynamodb')
+
+
+def test_segments_scanned_once_each(aws):
+    db_client = fill_table(200)
+    stats = ScanStats()
+    image_ids = [item['IMAGE ID']['S'] for items in parallel_scan(db_client, {'TableName': 'classifications',
+                                                                             'Limit': 10}, 4, stats)
+                 for item in items]
+    assert sorted(image_ids) == ['image{:04d}'.format(index) for index in range(200)]
+    assert stats.items == 200 and stats.pages >= 20
+
+
+def test_workers_stop_when_the_reader_stops_early(aws):
+    db_client = fill_table(100)
+    # one item per page: the workers fill the queue and wait for the reader
+    pages = parallel_scan(db_client, {'TableName': 'classifications', 'Limit': 1}, 4)
+    next(pages)
+    closing = threading.Thread(target=pages.close, daemon=True)
+    closing.start()
+    closing.join(timeout=10)
+    assert not closing.is_alive()
@@ -0,0 +1,114 @@
+import json
+import time
+import threading
+import boto3
+import pytest
+from conftest import Context, create_table, get_notification
+from execution_leases import (LEASE_MARGIN, LeaseConfigurationException, LeaseStore,
+                              get_lease_duration, get_lease_table)
+
+
+ROLE_ARN = 'arn:aws:iam::123456789012:role/state-machine'
+
+
+@pytest.fixture
+def lease_table(aws):
+    return create_table('leases', 'SLOT', 'N')
+
+
+def test_acquire_until_every_slot_is_held(lease_table):
+    store = LeaseStore(lease_table, 3, 600)
+    slots = [store.acquire('execution-{}'.format(index)) for index in range(3)]
+    assert sorted(slots) == [0, 1, 2]
+    assert store.acquire('execution-3') is None
+    assert sorted(store.leases()) == sorted((slot, 'execution-{}'.format(index))
+                                            for index, slot in enumerate(slots))
+
+
+def test_concurrent_invocations_never_share_a_slot(lease_table):
+    # each invocation has its own store over the same table
+    results = {}
+    def acquire(owner):
+        results[owner] = LeaseStore(lease_table, 4, 600).acquire(owner)
+    threads = [threading.Thread(target=acquire, args=('execution-{}'.format(index),)) for index in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    held = [slot for slot in results.values() if slot is not None]
+    assert sorted(held) == [0, 1, 2, 3]
+    assert len(LeaseStore(lease_table, 4, 600).leases()) == 4
+
+
+def test_release_frees_the_slot_of_its_owner_only(lease_table):
+    store = LeaseStore(lease_table, 1, 600)
+    slot = store.acquire('first')
+    store.release(slot, 'second')
+    assert store.acquire('second') is None
+    store.release(slot, 'first')
+    assert store.acquire('second') == slot
+    assert store.leases() == [(slot, 'second')]
+
+
+def test_expired_lease_can_be_taken_over(lease_table):
+    lease_table.put_item(Item={'SLOT': 0, 'OWNER': 'crashed', 'EXPIRES': int(time.time()) - 1})
+    lease_table.put_item(Item={'SLOT': 1, 'OWNER': 'running', 'EXPIRES': int(time.time()) + 600})
+    store = LeaseStore(lease_table, 2, 600)
+    assert store.acquire('next') == 0
+    assert store.acquire('other') is None
+    # the crashed execution can no longer release the slot it lost
+    store.release(0, 'crashed')
+    assert sorted(store.leases()) == [(0, 'next'), (1, 'running')]
+
+
+def test_lease_duration_follows_state_machine_timeout(aws):
+    client = boto3.client('stepfunctions')
+    definition = {'StartAt': 'Done', 'TimeoutSeconds': 3600, 'States': {'Done': {'Type': 'Succeed'}}}
+    arn = client.create_state_machine(name='images', definition=json.dumps(definition),
+                                      roleArn=ROLE_ARN)['stateMachineArn']
+    assert get_lease_duration(client, arn) == 3600 + LEASE_MARGIN
+
+    del definition['TimeoutSeconds']
+    arn = client.create_state_machine(name='no-timeout', definition=json.dumps(definition),
+                                      roleArn=ROLE_ARN)['stateMachineArn']
+    with pytest.raises(LeaseConfigurationException):
+        get_lease_duration(client, arn)
+
+
+def test_missing_lease_table_is_explained(aws):
+    with pytest.raises(LeaseConfigurationException, match='LEASE_TABLE'):
+        get_lease_table(boto3.resource('dynamodb'), None)
+
+
+def test_release_task_frees_the_lease_of_the_execution(lease_table, load_lambda):
+    release = load_lambda('release_execution_lease', LEASE_TABLE='leases')
+    store = LeaseStore(lease_table, 1, 600)
+    slot = store.acquire('execution')
+    event = {'image_id': 'idpya7i2q_flt', 'lease': {'slot': slot, 'owner': 'execution'}}
+    assert release.lambda_handler(event, None) == event
+    assert store.leases() == []
+    # executions started without a lease pass through
+    assert release.lambda_handler({'image_id': 'idpya7i2q_flt'}, None) == {'image_id': 'idpya7i2q_flt'}
+
+
+def test_executions_are_admitted_up_to_the_limit(lease_table, load_lambda):
+    client = boto3.client('stepfunctions')
+    definition = {'StartAt': 'Done', 'TimeoutSeconds': 3600, 'States': {'Done': {'Type': 'Succeed'}}}
+    arn = client.create_state_machine(name='images', definition=json.dumps(definition),
+                                      roleArn=ROLE_ARN)['stateMachineArn']
+    start_state_machine = load_lambda('start_state_machine', STATE_MACHINE_ARN=arn, LEASE_TABLE='leases',
+                                      MAX_CONCURRENT_EXECUTIONS='1')
+
+    outcome, = start_state_machine.lambda_handler(get_notification('hst/public/idpy/idpya7i2q/idpya7i2q_flt.fits'),
+                                                  Context(60000))['outcomes']
+    assert outcome['status'] == 'STARTED'
+    execution_arn = arn.replace(':stateMachine:', ':execution:') + ':' + outcome['execution']
+    execution_input = json.loads(client.describe_execution(executionArn=execution_arn)['input'])
+    assert execution_input['lease'] == {'slot': 0, 'owner': outcome['execution']}
+    assert get_lease_duration(client, arn) == start_state_machine.get_execution_starter().lease_store.duration
+
+    # the only slot is held by a running execution, so the next image waits until it gives up
+    with pytest.raises(start_state_machine.StartExecutionException):
+        start_state_machine.lambda_handler(get_notification('hst/public/idpy/idpya7i0q/idpya7i0q_flt.fits'),
+                                           Context(1000))
+    assert LeaseStore(lease_table, 1).leases() == [(0, outcome['execution'])]
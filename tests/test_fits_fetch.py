@@ -0,0 +1,81 @@
+import io
+import boto3
+import numpy as np
+import pytest
+from astropy.io import fits
+from fits_preprocessing import open_s3_fits_sci, read_fits
+
+
+class RecordingClient:
+    '''S3 client that records the Range of each GetObject call (None for a whole object).'''
+    def __init__(self):
+        self.s3_client = boto3.client('s3')
+        self.ranges = []
+
+    def get_object(self, **kwargs):
+        self.ranges.append(kwargs.get('Range'))
+        return self.s3_client.get_object(**kwargs)
+
+
+@pytest.fixture
+def s3(aws):
+    boto3.client('s3').create_bucket(Bucket='stpubdata')
+    return RecordingClient()
+
+
+def upload(hdul, key='hst/public/idpy/idpya7i2q/idpya7i2q_flt.fits'):
+    buffer = io.BytesIO()
+    hdul.writeto(buffer)
+    boto3.client('s3').put_object(Bucket='stpubdata', Key=key, Body=buffer.getvalue())
+    return key, buffer.getvalue()
+
+
+def make_hdul(chips=1, dtype=np.float32, bzero=None, shape=(40, 30)):
+    rng = np.random.default_rng(chips)
+    primary = fits.PrimaryHDU()
+    primary.header['TARGNAME'] = 'NGC 1300'
+    hdus = [primary]
+    for chip in range(chips):
+        data = rng.integers(0, 1000, shape).astype(dtype)
+        sci = fits.ImageHDU(data, name='SCI')
+        if bzero is not None:
+            sci.scale('int16', bzero=bzero)
+        hdus += [sci, fits.ImageHDU(np.zeros(shape, np.float32), name='ERR'),
+                 fits.ImageHDU(np.zeros(shape, np.int16), name='DQ')]
+    return fits.HDUList(hdus)
+
+
+def assert_matches_full_read(s3, key, content):
+    metadata, data = read_fits(open_s3_fits_sci(s3, 'stpubdata', key))
+    expected_metadata, expected = read_fits(fits.open(io.BytesIO(content)))
+    assert metadata == expected_metadata
+    assert data.dtype == np.float32 and np.array_equal(data, expected)
+
+
+@pytest.mark.parametrize('hdul', [make_hdul(1), make_hdul(2), make_hdul(1, np.int16),
+                                  make_hdul(2, np.float32, bzero=32768)],
+                         ids=['one chip', 'two chips', 'int16', 'bzero'])
+def test_sci_read_with_ranges_matches_full_read(s3, hdul):
+    key, content = upload(hdul)
+    assert_matches_full_read(s3, key, content)
+    assert None not in s3.ranges
+
+
+def test_error_and_quality_data_not_fetched(s3):
+    key, content = upload(make_hdul(2, shape=(400, 300)))
+    open_s3_fits_sci(s3, 'stpubdata', key)
+    fetched = sum(min(int(stop) + 1, len(content)) - int(start) for start, stop in
+                  (byte_range[len('bytes='):].split('-') for byte_range in s3.ranges))
+    # the SCI chips are under half of the file; ERR and DQ data make up the rest
+    assert fetched < len(content) // 2
+
+
+@pytest.mark.parametrize('hdul', [fits.HDUList([fits.PrimaryHDU(np.ones((4, 4), np.float32)),
+                                                fits.BinTableHDU.from_columns([fits.Column('A', 'E', array=[1.0])])]),
+                                  fits.HDUList([fits.PrimaryHDU(), fits.CompImageHDU(np.ones((40, 30), np.float32))])],
+                         ids=['table', 'tile-compressed'])
+def test_whole_file_read_when_sci_is_not_an_image_extension(s3, hdul):
+    key, content = upload(hdul)
+    hdul = open_s3_fits_sci(s3, 'stpubdata', key)
+    assert s3.ranges[-1] is None
+    assert len(hdul) == len(fits.open(io.BytesIO(content)))
@@ -0,0 +1,64 @@
+import numpy as np
+from astropy.io import fits
+from fits_preprocessing import block_reduce, normalize, to_uint8, fits_to_image
+
+
+def make_hdul(data, chips=1):
+    primary = fits.PrimaryHDU()
+    primary.header['TARGNAME'] = 'NGC 1300'
+    hdus = [primary]
+    for _ in range(chips):
+        hdus += [fits.ImageHDU(data, name='SCI'), fits.ImageHDU(name='ERR'), fits.ImageHDU(name='DQ')]
+    return fits.HDUList(hdus)
+
+
+def test_normalize_clips_percentiles_and_scales_in_place():
+    data = np.arange(1000, dtype=np.float32)
+    # outliers that would squash the scale without clipping
+    data[0], data[-1] = -1e6, 1e6
+    bottom, top = np.percentile(data, [1, 99])
+    result = normalize(data)
+    assert result is data and result.dtype == np.float32
+    # float32 rounding leaves the bounds within a hair of 0 and 255, which to_uint8 truncates to 0 and 255
+    assert np.isclose(result.min(), 0.0, atol=1e-4) and np.isclose(result.max(), 255.0)
+    assert to_uint8(result).min() == 0 and to_uint8(result).max() == 255
+    # values beyond the percentiles are clipped, the ones in between scaled linearly
+    assert np.count_nonzero(result < 1e-4) == np.count_nonzero(np.arange(1000) <= bottom)
+    assert np.isclose(result[500], (500 - bottom) * 255.0 / (top - bottom), rtol=1e-5)
+
+
+def test_normalize_constant_image():
+    data = np.full((4, 4), 7.0, dtype=np.float32)
+    assert not normalize(data).any()
+
+
+def test_block_reduce_averages_whole_blocks():
+    data = np.arange(10 * 7, dtype=np.float32).reshape(10, 7)
+    reduced = block_reduce(data, 3)
+    # factor 7 // 3 = 2: the last column does not fill a block and is dropped
+    assert reduced.shape == (5, 3) and reduced.dtype == np.float32
+    assert np.allclose(reduced, data[:10, :6].reshape(5, 2, 3, 2).mean(axis=(1, 3)))
+    assert block_reduce(data, 7) is data
+
+
+def test_to_uint8_flips_rows():
+    data = np.array([[0.0, 1.9], [255.0, 3.0]], dtype=np.float32)
+    assert to_uint8(data).tolist() == [[255, 3], [0, 1]]
+
+
+def test_fits_to_image_reduces_after_normalizing_full_resolution():
+    rng = np.random.default_rng(0)
+    data = rng.normal(100.0, 10.0, (64, 48)).astype(np.float32)
+    metadata, image, model_image = fits_to_image(make_hdul(data), 16)
+    assert metadata == {'TARGNAME': 'NGC 1300'}
+    assert image.size == (48, 64) and model_image.size == (16, 21)
+    expected = to_uint8(block_reduce(normalize(data.copy()), 16))
+    assert np.array_equal(np.asarray(model_image), expected)
+    _, image, model_image = fits_to_image(make_hdul(data))
+    assert model_image is image
+
+
+def test_fits_to_image_merges_two_chips():
+    data = np.ones((8, 8), dtype=np.float32)
+    _, image, _ = fits_to_image(make_hdul(data, chips=2))
+    assert image.size == (8, 16)
@@ -0,0 +1,27 @@
+import json
+from conftest import create_table
+
+
+def get_failed_image(**fields):
+    return dict({'image_id': 'idpya7i2q_flt', 's3': {'bucket': 'stpubdata', 'key': 'idpya7i2q_flt.fits'},
+                 'error-info': {'Cause': json.dumps({'errorType': 'ValueError', 'errorMessage': 'bad image'})}},
+                **fields)
+
+
+def test_errors_logged_without_upload_history_table(aws, load_lambda, monkeypatch):
+    monkeypatch.delenv('UPLOAD_HISTORY_TABLE', raising=False)
+    errors = create_table('errors', 'IMAGE ID')
+    log_error = load_lambda('log_error', ERROR_TABLE='errors')
+    log_error.lambda_handler(get_failed_image(), None)
+    assert errors.get_item(Key={'IMAGE ID': 'idpya7i2q_flt'})['Item']['ERROR TYPE'] == 'ValueError'
+
+
+def test_claim_released_only_by_its_token(aws, load_lambda):
+    create_table('errors', 'IMAGE ID')
+    upload_history = create_table('upload-history', 'IMAGE ID')
+    upload_history.put_item(Item={'IMAGE ID': 'idpya7i2q_flt', 'CLAIM TOKEN': 'mine', 'CLAIM EXPIRES': 0})
+    log_error = load_lambda('log_error', ERROR_TABLE='errors', UPLOAD_HISTORY_TABLE='upload-history')
+    log_error.lambda_handler(get_failed_image(claim_token='other'), None)
+    assert 'Item' in upload_history.get_item(Key={'IMAGE ID': 'idpya7i2q_flt'})
+    log_error.lambda_handler(get_failed_image(claim_token='mine'), None)
+    assert 'Item' not in upload_history.get_item(Key={'IMAGE ID': 'idpya7i2q_flt'})
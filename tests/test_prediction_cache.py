@@ -0,0 +1,56 @@
+import os
+import sys
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from conftest import LAMBDA_SCRIPTS, create_table
+
+sys.path.insert(0, os.path.join(LAMBDA_SCRIPTS, 'classify_image'))
+from prediction_cache import PredictionCache
+
+
+CLASSIFICATION = {'probabilities': {'DEEP': '0.9', 'STARS': '0.1'}, 'predicted_class': 'DEEP'}
+
+
+class Classifier:
+    '''Stand-in for a model, counting the images it classifies.'''
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, content):
+        self.calls += 1
+        return CLASSIFICATION
+
+
+def test_second_lookup_of_the_same_pixels_is_a_hit(aws):
+    cache = PredictionCache(create_table('predictions', 'DATA HASH'), 'v1', 3600)
+    classify = Classifier()
+    assert cache.get_or_classify('hash', classify, b'jpeg') == CLASSIFICATION
+    assert cache.get_or_classify('hash', classify, b'jpeg') == CLASSIFICATION
+    assert classify.calls == 1
+    assert (cache.hits, cache.lookups) == (1, 2)
+    # another model version does not reuse the classification
+    assert PredictionCache(cache.table, 'v2', 3600).get('hash') is None
+
+
+def test_unavailable_table_does_not_fail_classification(aws):
+    # e.g. the table was not created, or the lambda may not read it
+    cache = PredictionCache(boto3.resource('dynamodb').Table('missing'), 'v1', 3600)
+    classify = Classifier()
+    assert cache.get_or_classify('hash', classify, b'jpeg') == CLASSIFICATION
+    assert cache.get_or_classify('hash', classify, b'jpeg') == CLASSIFICATION
+    assert classify.calls == 2
+    assert (cache.hits, cache.lookups) == (0, 2)
+
+
+def test_cache_is_shared_by_the_threads_of_a_batch(aws):
+    cache = PredictionCache(create_table('predictions', 'DATA HASH'), 'v1', 3600)
+    classify = Classifier()
+    data_hashes = ['hash{}'.format(index % 4) for index in range(16)]
+    for data_hash in set(data_hashes):
+        cache.put(data_hash, CLASSIFICATION)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        items = list(executor.map(lambda data_hash: cache.get_or_classify(data_hash, classify, b'jpeg'),
+                                  data_hashes))
+    assert items == [CLASSIFICATION] * 16
+    assert classify.calls == 0
+    assert (cache.hits, cache.lookups) == (16, 16)
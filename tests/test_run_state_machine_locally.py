@@ -0,0 +1,18 @@
+import sys
+
+
+def test_lambda_imports_modules_from_its_own_folder(aws, runner, monkeypatch):
+    monkeypatch.delitem(sys.modules, 'bloom_filter', raising=False)
+    monkeypatch.setenv('UPLOAD_HISTORY_TABLE', 'upload-history')
+    assert callable(runner.load_handler('Duplicate Upload Check'))
+
+
+def test_null_result_path_keeps_the_state_input(runner):
+    machine = {'StartAt': 'Log', 'States': {'Log': {'Type': 'Task', 'ResultPath': None, 'Next': 'Done'},
+                                            'Done': {'Type': 'Succeed'}}}
+    output = runner.run_states(machine, {'image_id': 'first_flt'}, {'Log': lambda event, context: None})
+    assert output == {'image_id': 'first_flt'}
+
+
+def test_only_executions_with_error_info_are_failures(runner):
+    assert runner.count_failures([{'image_id': 'first_flt'}, None, {'image_id': 'bad_flt', 'error-info': {}}]) == 1
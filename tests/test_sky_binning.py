@@ -0,0 +1,21 @@
+import argparse
+import numpy as np
+from sky_binning import RA_BINS, add_binning_arguments, bin_sky
+
+
+def test_positions_that_are_not_finite_are_left_out():
+    ra = np.array([0.1, np.nan, 0.1, np.inf])
+    dec = np.array([0.2, 0.2, 0.2, 0.2])
+    labels = ['STARS', 'STARS', 'DEEP', 'DEEP']
+    probabilities = {'STARS': np.array([0.9, 0.5, 0.1, 0.1]), 'DEEP': np.array([0.1, 0.5, 0.7, 0.9])}
+    binned = bin_sky(ra, dec, labels, ['STARS', 'DEEP'], probabilities)
+    assert binned['COUNT'].tolist() == [2]
+    assert binned['COUNT OF STARS'].tolist() == [1] and binned['COUNT OF DEEP'].tolist() == [1]
+    assert np.allclose(binned['MEAN PROBABILITY OF STARS'], 0.9)
+    assert np.allclose(binned['MEAN PROBABILITY OF DEEP'], 0.7)
+
+
+def test_binning_arguments():
+    parser = add_binning_arguments(argparse.ArgumentParser())
+    args = parser.parse_args(['-b', '--dec_bins', '90', '-e', 'sky'])
+    assert (args.binned, args.ra_bins, args.dec_bins, args.export) == (True, RA_BINS, 90, 'sky')
@@ -0,0 +1,104 @@
+import re
+import json
+import boto3
+import pytest
+from conftest import Context, create_table, get_notification
+from execution_leases import LeaseStore
+from state_machine_executions import get_execution_name
+
+
+ROLE_ARN = 'arn:aws:iam::123456789012:role/state-machine'
+KEYS = ['hst/public/idpy/idpya7i2q/idpya7i2q_flt.fits', 'hst/public/idpy/idpya7i0q/idpya7i0q_flc.fits']
+
+
+@pytest.fixture
+def start_state_machine(aws, load_lambda):
+    create_table('leases', 'SLOT', 'N')
+    definition = {'StartAt': 'Done', 'TimeoutSeconds': 3600, 'States': {'Done': {'Type': 'Succeed'}}}
+    arn = boto3.client('stepfunctions').create_state_machine(name='images', definition=json.dumps(definition),
+                                                             roleArn=ROLE_ARN)['stateMachineArn']
+    return load_lambda('start_state_machine', STATE_MACHINE_ARN=arn, LEASE_TABLE='leases',
+                       MAX_CONCURRENT_EXECUTIONS='1')
+
+
+def get_executions(module):
+    response = boto3.client('stepfunctions').list_executions(stateMachineArn=module.state_machine_arn)
+    return sorted(execution['name'] for execution in response['executions'])
+
+
+def test_execution_names_identify_object_versions():
+    name = get_execution_name('stpubdata', KEYS[0])
+    assert name == get_execution_name('stpubdata', KEYS[0])
+    assert name.startswith('idpya7i2q_flt-')
+    assert re.fullmatch('[0-9A-Za-z_-]{1,80}', name)
+    assert name != get_execution_name('stpubdata', KEYS[0], etag='"0123"')
+    assert name != get_execution_name('stpubdata', KEYS[1])
+    long_name = get_execution_name('stpubdata', 'a/' + 'x' * 100 + '_flt.fits')
+    assert len(long_name) <= 80
+
+
+def test_retried_invocation_only_starts_the_files_that_failed(start_state_machine):
+    event = get_notification(*KEYS)
+    # one slot: the first file is started, the second one times out waiting for it
+    with pytest.raises(start_state_machine.StartExecutionException):
+        start_state_machine.lambda_handler(event, Context(1000))
+    started = get_executions(start_state_machine)
+    assert len(started) == 1
+
+    # the first execution ends and releases its lease; the notification is delivered again
+    lease_store = LeaseStore(start_state_machine.get_execution_starter().lease_store.table, 1)
+    for slot, owner in lease_store.leases():
+        lease_store.release(slot, owner)
+    outcomes = start_state_machine.lambda_handler(event, Context(60000))['outcomes']
+    # the files are started concurrently, so either one may have taken the slot first
+    statuses = {outcome['execution']: outcome['status'] for outcome in outcomes}
+    assert statuses.pop(started[0]) == 'ALREADY STARTED'
+    assert list(statuses.values()) == ['STARTED']
+    assert get_executions(start_state_machine) == sorted(outcome['execution'] for outcome in outcomes)
+    # the file that was already started did not take a slot
+    assert lease_store.leases() == [(0, list(statuses)[0])]
+
+
+def release_leases(module):
+    lease_store = LeaseStore(module.get_execution_starter().lease_store.table, 1)
+    for slot, owner in lease_store.leases():
+        lease_store.release(slot, owner)
+
+
+def test_failed_image_is_started_again_under_its_next_attempt(start_state_machine):
+    event = get_notification(KEYS[0])
+    name = start_state_machine.lambda_handler(event, Context(60000))['outcomes'][0]['execution']
+    # a running execution is not started twice
+    release_leases(start_state_machine)
+    assert start_state_machine.lambda_handler(event, Context(60000))['outcomes'][0]['status'] == 'ALREADY STARTED'
+
+    # the execution is stopped without processing the image; the notification is delivered again
+    client = start_state_machine.get_execution_starter().client
+    client.stop_execution(executionArn=start_state_machine.get_execution_starter().get_execution_arn(name))
+    release_leases(start_state_machine)
+    outcome = start_state_machine.lambda_handler(event, Context(60000))['outcomes'][0]
+    assert outcome == {'key': KEYS[0], 'status': 'STARTED', 'execution': name + '-1'}
+    assert get_executions(start_state_machine) == [name, name + '-1']
+
+
+def test_image_logged_as_an_error_is_started_again(start_state_machine, monkeypatch):
+    event = get_notification(KEYS[0])
+    name = start_state_machine.lambda_handler(event, Context(60000))['outcomes'][0]['execution']
+    release_leases(start_state_machine)
+    starter = start_state_machine.get_execution_starter()
+    describe_execution = starter.client.describe_execution
+    outputs = {name: {'image_id': 'idpya7i2q_flt', 'error-info': {'Error': 'States.TaskFailed'}},
+               name + '-1': {'image_id': 'idpya7i2q_flt', 'is_duplicate': False}}
+
+    def describe_finished_execution(**kwargs):
+        # the execution caught the error, logged the image with log_error and succeeded
+        response = describe_execution(**kwargs)
+        return dict(response, status='SUCCEEDED', output=json.dumps(outputs[response['name']]))
+
+    monkeypatch.setattr(starter.client, 'describe_execution', describe_finished_execution)
+    assert start_state_machine.lambda_handler(event, Context(60000))['outcomes'][0]['execution'] == name + '-1'
+    release_leases(start_state_machine)
+    # the image was processed by the second attempt, so it is not started again
+    outcome = start_state_machine.lambda_handler(event, Context(60000))['outcomes'][0]
+    assert outcome['status'] == 'ALREADY STARTED'
+    assert get_executions(start_state_machine) == [name, name + '-1']
@@ -0,0 +1,70 @@
+import io
+import json
+import boto3
+import numpy as np
+import pytest
+from astropy.io import fits
+from conftest import ROOT, create_table
+from execution_leases import LeaseStore
+
+CLASSIFICATION = {'probabilities': {'DEEP': '0.9', 'STARS': '0.1'}, 'predicted_class': 'DEEP'}
+KEYS = {'good_flt': 'hst/public/good/good_flt.fits', 'missing_flt': 'hst/public/miss/missing_flt.fits'}
+
+
+@pytest.fixture
+def state_machine(aws, runner, monkeypatch):
+    '''Function runs state-machine.json for one image with the real handlers, AWS being moto and
+       the SageMaker endpoint a stand-in. Function returns the output of the execution.'''
+    for key, value in {'UPLOAD_HISTORY_TABLE': 'upload-history', 'IMAGE_CLASSIFICATIONS_TABLE': 'classifications',
+                       'ERROR_TABLE': 'errors', 'LEASE_TABLE': 'leases', 'DESTINATION_BUCKET': 'classified',
+                       'ENDPOINT_NAME': 'model', 'CLASSES': 'DEEP,STARS'}.items():
+        monkeypatch.setenv(key, value)
+    for name in ['upload-history', 'classifications', 'errors']:
+        create_table(name, 'IMAGE ID')
+    create_table('leases', 'SLOT', 'N')
+    s3_client = boto3.client('s3')
+    for bucket in ['stpubdata', 'classified']:
+        s3_client.create_bucket(Bucket=bucket)
+    buffer = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(np.random.default_rng(0).normal(size=(64, 64)).astype(np.float32),
+                                                   name='SCI')]).writeto(buffer)
+    s3_client.put_object(Bucket='stpubdata', Key=KEYS['good_flt'], Body=buffer.getvalue())
+
+    with open(ROOT + '/step-function/state-machine.json') as definition_file:
+        definition = json.load(definition_file)
+    handlers = {name: runner.load_handler(name) for name in runner.get_task_names(definition)}
+    monkeypatch.setitem(handlers['Classify Image'].__globals__, 'get_classification', lambda content: CLASSIFICATION)
+    lease_store = LeaseStore(boto3.resource('dynamodb').Table('leases'), 1, 600)
+
+    def run(image_id):
+        slot = lease_store.acquire(image_id)
+        image = {'image_id': image_id, 'subgroup': 'flt', 's3': {'bucket': 'stpubdata', 'key': KEYS[image_id]},
+                 'lease': {'slot': slot, 'owner': image_id}}
+        output = runner.run_states(definition, image, handlers)
+        # every execution ends by releasing its lease
+        assert lease_store.leases() == []
+        return output
+    return run
+
+
+def get_ids(table_name):
+    return [item['IMAGE ID'] for item in boto3.resource('dynamodb').Table(table_name).scan()['Items']]
+
+
+def test_classified_image_is_logged_and_releases_its_lease(state_machine, runner):
+    output = state_machine('good_flt')
+    assert output['classification'] == CLASSIFICATION and runner.count_failures([output]) == 0
+    assert get_ids('classifications') == ['good_flt'] and get_ids('errors') == []
+    assert [item['Key'] for item in boto3.client('s3').list_objects_v2(Bucket='classified')['Contents']] == \
+        ['DEEP/good_flt']
+
+    # the same image again is skipped as a duplicate
+    assert state_machine('good_flt')['is_duplicate'] is True
+
+
+def test_failed_image_is_logged_and_releases_its_lease_and_claim(state_machine, runner):
+    output = state_machine('missing_flt')
+    assert runner.count_failures([output]) == 1
+    assert get_ids('errors') == ['missing_flt'] and get_ids('classifications') == []
+    # the claim is released so that the image can be classified again
+    assert get_ids('upload-history') == []
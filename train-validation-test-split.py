@@ -1,7 +1,11 @@
 import os
+import csv
+import sys
+import errno
 import argparse
 from numpy.random import seed, shuffle
 from shutil import copyfile
+from concurrent.futures import ThreadPoolExecutor
 
 
 parser = argparse.ArgumentParser(description='Split directory of folders of images into train, validation, and test sets.')
@@ -12,25 +16,101 @@ parser.add_argument('-v', '--validation', type=float, default=0.10, metavar='',
                     help='Proportion of data to allocate as validation data. Float between 0.0 and 1.0 (default: 0.10).')
 parser.add_argument('-e', '--test', type=float, default=0.20, metavar='',
                     help='Proportion of data to allocate as test data. Float between 0.0 and 1.0 (default: 0.20).')
+parser.add_argument('-m', '--mode', type=str, default='copy', metavar='',
+                    choices=['copy', 'hardlink', 'symlink', 'reflink', 'manifest'],
+                    help='How images are placed in the sets: copy, hardlink, symlink, reflink (copy-on-write clone '
+                         'where the file system supports it, a copy otherwise), or manifest (only write the split '
+                         'to a file, leaving the images in place) (default: copy).')
+parser.add_argument('-f', '--manifest_format', type=str, default='csv', metavar='', choices=['csv', 'lst'],
+                    help='Format of the manifest: csv (split.csv of set, path, and class rows) or lst (train.lst, '
+                         'validation.lst, and test.lst of index, class index, and path rows) (default: csv).')
+parser.add_argument('-w', '--workers', type=int, default=8, metavar='',
+                    help='Number of images placed at the same time (default: 8).')
 args = parser.parse_args()
 msg = 'The sum of train, validation, and test proportions must equal 1.0'
 assert(args.train + args.validation + args.test == 1.0), msg
 
+# ioctl request that clones a file on Linux file systems that support it (e.g. Btrfs, XFS)
+FICLONE = 0x40049409
+SETS = ['TRAIN', 'VALIDATION', 'TEST']
+
 seed(0) # set numpy random seed
 train_path = os.path.join(args.path, "TRAIN")
 validation_path = os.path.join(args.path, "VALIDATION")
 test_path = os.path.join(args.path, "TEST")
-classes = os.listdir(args.path)
-classes = list(filter(lambda x: all([not x.endswith(y) for y in ['.zip',
-                                                                 '.DS_Store']]), classes))
+# skip files and the set folders of an earlier split
+classes = sorted(entry.name for entry in os.scandir(args.path)
+                 if entry.is_dir() and entry.name not in SETS
+                 and all([not entry.name.endswith(y) for y in ['.zip', '.DS_Store']]))
 extensions = ['.jpg', '.jpeg', '.png', '.gif']
 
 
+def reflink(source, destination):
+    '''Clone a file, sharing its blocks until either copy is modified. Falls back to a copy
+       where cloning is not supported. Function returns whether the file was cloned.'''
+    if sys.platform.startswith('linux'):
+        import fcntl
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+                return True
+            except OSError as error:
+                if error.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL):
+                    raise
+    copyfile(source, destination)
+    return False
+
+
+def place_image(source, destination):
+    '''Place an image in a set folder according to the mode.
+       Function returns whether the image had to be copied instead.'''
+    if os.path.lexists(destination):
+        # links and clones cannot overwrite the image of an earlier split, and a copy over a link
+        # to the source would write to the source itself (copyfile raises SameFileError)
+        os.remove(destination)
+    if args.mode == 'hardlink':
+        try:
+            os.link(source, destination)
+            return False
+        except OSError as error:
+            # hard links cannot cross file systems
+            if error.errno != errno.EXDEV:
+                raise
+    elif args.mode == 'symlink':
+        os.symlink(os.path.abspath(source), destination)
+        return False
+    elif args.mode == 'reflink':
+        return not reflink(source, destination)
+    copyfile(source, destination)
+    return args.mode != 'copy'
+
+
+def write_manifest(plan):
+    '''Write the split without touching the images.'''
+    if args.manifest_format == 'csv':
+        # same rows as generate_gcloud_csv.py, with paths relative to the parent directory
+        with open(os.path.join(args.path, 'split.csv'), 'w', newline='') as file:
+            csv_writer = csv.writer(file)
+            for dataset, cls, img_name in plan:
+                csv_writer.writerow([dataset, os.path.join(cls, img_name), cls])
+    else:
+        # image lists as read by im2rec and the SageMaker image classification algorithm
+        for dataset in SETS:
+            with open(os.path.join(args.path, dataset.lower() + '.lst'), 'w') as file:
+                index = 0
+                for _dataset, cls, img_name in plan:
+                    if _dataset == dataset:
+                        file.write('{}\t{}\t{}\n'.format(index, classes.index(cls), os.path.join(cls, img_name)))
+                        index += 1
+
+
+# plan the whole split first: (set, class, image name) of every image
+plan = []
 for cls in classes:
     # for each class, randomly shuffle the images, and then split into train, validation, and test sets
-    images = os.listdir(os.path.join(args.path, cls))
     # make sure to grab only image files
-    images = list(filter(lambda img_name: any([str(img_name).lower().endswith(extension) for extension in extensions]), images))
+    images = sorted(entry.name for entry in os.scandir(os.path.join(args.path, cls))
+                    if any([entry.name.lower().endswith(extension) for extension in extensions]))
     shuffle(images)
     stop = int(args.train*len(images))
     train_images = images[: stop]
@@ -41,17 +121,25 @@ for cls in classes:
     # ensure no overlap between train, validation, and test sets
     msg = 'Overlap found between train, validation, and test sets.'
     assert(len(set(train_images) & set(validation_images) & set(test_images)) == 0), msg
-    for item in [(train_path, train_images),
-                 (validation_path, validation_images),
-                 (test_path, test_images)]:
-        destination_path = os.path.join(item[0], cls)
-        # create class folder
-        if not os.path.isdir(destination_path):
-            os.makedirs(destination_path)
-        # copy all of the images of that set (e.g. validation) for that class into the respective folder
-        for img_path in item[1]:
-            copyfile(os.path.join(args.path, cls, img_path), os.path.join(destination_path, img_path))
+    for dataset, dataset_images in zip(SETS, [train_images, validation_images, test_images]):
+        plan.extend((dataset, cls, img_name) for img_name in dataset_images)
     print('{} images\n'.format(cls) + '-'*20)
     print('Number of Train Images: {}\nNumber of Validation Images: {}\nNumber of Test Images: {}\n'.format(len(train_images),
                                                                                                             len(validation_images),
                                                                                                             len(test_images)))
+
+if args.mode == 'manifest':
+    write_manifest(plan)
+else:
+    # create class folders
+    for dataset_path in [train_path, validation_path, test_path]:
+        for cls in classes:
+            os.makedirs(os.path.join(dataset_path, cls), exist_ok=True)
+    # place all of the images of each set (e.g. validation) for each class into the respective folder
+    sources = [os.path.join(args.path, cls, img_name) for _, cls, img_name in plan]
+    destinations = [os.path.join(args.path, dataset, cls, img_name) for dataset, cls, img_name in plan]
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        copied = sum(executor.map(place_image, sources, destinations))
+    if copied:
+        print('{} of {} images were copied, since the {} mode is not supported for them.'.format(copied, len(plan),
+                                                                                                  args.mode))
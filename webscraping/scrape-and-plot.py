@@ -1,3 +1,6 @@
+import os
+import sys
+import argparse
 import time
 import re
 import requests
@@ -9,6 +12,9 @@ from astropy.coordinates import SkyCoord
 import astropy.units as units
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sky_binning import add_binning_arguments, render
+
 
 def extract_from_soup(soup, headers, start_index=0):
     '''Extracts table cell values from BeautifulSoup object and insert the
@@ -47,6 +53,9 @@ def get_tables(url):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape catalogs of galaxy clusters and nebulae and plot them on the sky.')
+    args = add_binning_arguments(parser).parse_args()
+
     # ==============================
     # WIKIPEDIA
     # ------------------------------
@@ -105,6 +114,7 @@ if __name__ == '__main__':
     fig = plt.figure(figsize=(16, 14))
     ax = fig.add_subplot(111, projection="mollweide")
 
+    positions = {}
     for cls in classes:
         ra = classes[cls]['RA']
         dec = classes[cls]['DEC']
@@ -121,6 +131,5 @@ if __name__ == '__main__':
         ra = coord.Angle([entry.ra for entry in temp])
         ra = ra.wrap_at(180 * units.degree)
         dec = coord.Angle([entry.dec for entry in temp])
-        ax.scatter(ra.radian, dec.radian, label=cls)
-    ax.legend()
-    plt.show()
+        positions[cls] = (ra.radian, dec.radian)
+    render(ax, fig, positions, args)
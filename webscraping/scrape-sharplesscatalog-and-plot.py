@@ -1,3 +1,6 @@
+import os
+import sys
+import argparse
 import time
 import requests
 from bs4 import BeautifulSoup
@@ -8,6 +11,9 @@ from astropy.coordinates import SkyCoord
 import astropy.units as units
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sky_binning import add_binning_arguments, render
+
 
 def extract_from_soup(soup, headers):
     table = pd.DataFrame(columns=headers)
@@ -25,6 +31,9 @@ def extract_from_soup(soup, headers):
     return table
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape the Sharpless catalog of nebulae and plot it on the sky.')
+    args = add_binning_arguments(parser).parse_args()
+
     URL = 'http://www.sharplesscatalog.com/sharplessdata.aspx'
     content = requests.get(URL)
     soup = BeautifulSoup(content.text, features='lxml')
@@ -52,6 +61,5 @@ if __name__ == '__main__':
     ra = coord.Angle([entry.ra for entry in temp])
     ra = ra.wrap_at(180 * units.degree)
     dec = coord.Angle([entry.dec for entry in temp])
-    ax.scatter(ra.radian, dec.radian)
-    ax.legend()
-    plt.show()
+    positions = {'nebula': (ra.radian, dec.radian)}
+    render(ax, fig, positions, args)
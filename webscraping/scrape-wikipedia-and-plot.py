@@ -1,3 +1,6 @@
+import os
+import sys
+import argparse
 import re
 import requests
 import pandas as pd
@@ -7,6 +10,9 @@ from astropy.coordinates import SkyCoord
 import astropy.units as units
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sky_binning import add_binning_arguments, render
+
 
 def get_tables(url):
     '''Scrape the page for all tables. Insert the table data into a Pandas DataFrame.'''
@@ -37,6 +43,9 @@ def get_tables(url):
     return tables
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape Wikipedia lists of galaxy clusters and nebulae and plot them on the sky.')
+    args = add_binning_arguments(parser).parse_args()
+
     clusters = get_tables('https://en.wikipedia.org/wiki/List_of_Abell_clusters')
     nebulae = get_tables('https://en.wikipedia.org/wiki/List_of_star-forming_regions_in_the_Local_Group')
 
@@ -57,6 +66,7 @@ if __name__ == '__main__':
     fig = plt.figure(figsize=(16, 14))
     ax = fig.add_subplot(111, projection="mollweide")
 
+    positions = {}
     for cls in classes:
         ra = classes[cls]['RA']
         dec = classes[cls]['DEC']
@@ -70,6 +80,5 @@ if __name__ == '__main__':
         ra = coord.Angle([entry.ra for entry in temp])
         ra = ra.wrap_at(180 * units.degree)
         dec = coord.Angle([entry.dec for entry in temp])
-        ax.scatter(ra.radian, dec.radian, label=cls)
-    ax.legend()
-    plt.show()
+        positions[cls] = (ra.radian, dec.radian)
+    render(ax, fig, positions, args)